@@ -0,0 +1,39 @@
+"""
+Gunicorn settings for serving UAMSAPI.asgi with uvicorn workers:
+
+    gunicorn -c UAMSAPI/gunicorn_asgi.py UAMSAPI.asgi:application
+
+Every worker is a single event loop. Django 4.0 runs every request in a thread sensitive context, so each
+in-flight request, async endpoints under aio/auth/ included, gets its own executor thread for its database
+calls and holds its own database connection. The in-flight requests of a worker are therefore capped to its
+share of the database connections: ASGI_DB_CONNECTIONS (connections the workers of a host may open together)
+divided by the number of workers, unless ASGI_LIMIT_CONCURRENCY is set. Requests over the cap are answered
+with a 503 right away. Other blocking work of the async endpoints (password hashing) runs in a pool of
+ASGI_THREADS threads per worker.
+"""
+import multiprocessing
+import os
+
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+os.environ.setdefault("ASGI_THREADS", "32")
+
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+db_connections = int(os.environ.get("ASGI_DB_CONNECTIONS", 80))
+
+
+class UvicornWorker(BaseUvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "auto",
+        "http": "auto",
+        "lifespan": "off",
+        "limit_concurrency": int(os.environ.get("ASGI_LIMIT_CONCURRENCY", max(1, db_connections // workers))),
+        "backlog": int(os.environ.get("ASGI_BACKLOG", 4096)),
+    }
+
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+worker_class = "UAMSAPI.gunicorn_asgi.UvicornWorker"
+keepalive = 5
+graceful_timeout = 30
+timeout = 30
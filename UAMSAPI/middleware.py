@@ -0,0 +1,90 @@
+"""
+Compression of the responses with brotli, when the brotli package is installed, or gzip, whichever the client
+prefers in Accept-Encoding. Responses under COMPRESSION_MIN_SIZE bytes are sent as they are, compressing
+them costs more time than it saves on the wire.
+"""
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BROTLI = "br"
+GZIP = "gzip"
+
+
+def get_available_encodings():
+    return [BROTLI, GZIP] if brotli is not None else [GZIP]
+
+
+def choose_encoding(accept_encoding, available):
+    """
+    :param str accept_encoding: Accept-Encoding header
+    :param list[str] available: Supported encodings, the first ones win ties
+    :return: str encoding with the highest quality value, None when the client accepts none of them
+    """
+    qualities = {}
+
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(content, encoding):
+    if encoding == BROTLI:
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Same rules as django.middleware.gzip.GZipMiddleware, with brotli and a configurable size threshold.
+    Streaming responses are left uncompressed.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""), get_available_encodings())
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        response.headers["Content-Encoding"] = encoding
+
+        # The compressed body is not byte for byte the one the strong ETag was computed on
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+
+        return response
@@ -0,0 +1,52 @@
+"""
+orjson renderer and parser of the API.
+
+Output is the same as DRF's JSONRenderer: dates, times and datetimes, decimals, lazy strings and other
+values orjson does not know are encoded by DRF's JSONEncoder, phone numbers and countries by their string
+form (E.164 number and country code). Indented output, as the browsable API asks for, is left to DRF.
+"""
+import orjson
+from django_countries.fields import Country
+from phonenumber_field.phonenumber import PhoneNumber
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+drf_encoder = JSONEncoder()
+
+
+def default(obj):
+    """
+    :param obj: Value orjson cannot serialize natively
+    :return: JSON serializable value
+    """
+    if isinstance(obj, (PhoneNumber, Country)):
+        return str(obj)
+    return drf_encoder.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        if self.get_indent(accepted_media_type or "", renderer_context or {}):
+            return super(ORJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=default, option=ORJSON_OPTIONS)
+
+        # Like DRF, escape the line and paragraph separators that are not valid in javascript strings
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class ORJSONParser(JSONParser):
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -12,7 +12,6 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 from decouple import config
-from google.oauth2 import service_account
 from unipath import Path
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -57,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost so that it compresses the final response body
+    'UAMSAPI.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -168,6 +169,122 @@ BROKER_URL = config('REDIS_URL')
 BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 3600}
 
 
+# CELERY QUEUES
+# Every queue has its own workers (see Procfile) so that verification codes never wait behind other tasks:
+# - otp-critical: verification codes and login links
+# - transactional: other notifications, the default queue
+# - bulk: maintenance tasks
+# Notification tasks are acknowledged on receipt, a redelivery after the visibility timeout would send
+# expired codes. Maintenance tasks are idempotent and acknowledged late.
+NOTIFICATION_OTP_QUEUE = 'otp-critical'
+CELERY_DEFAULT_QUEUE = 'transactional'
+CELERY_ROUTES = {
+    'users.tasks.tasks_verification.purge_expired_verifications': {'queue': 'bulk'},
+}
+
+
+# ONE TIME PASSWORDS
+# OTP_STORE is either users.otp.DatabaseOTPStore or users.otp.RedisOTPStore
+OTP_STORE = config('OTP_STORE', default='users.otp.DatabaseOTPStore')
+OTP_REDIS_URL = config('OTP_REDIS_URL', default=BROKER_URL)
+OTP_LIFETIME = config('OTP_LIFETIME', default=300, cast=int)  # seconds
+# A code is sent at most once per channel in this window, requests in between get the remaining cooldown
+OTP_RESEND_COOLDOWN = config('OTP_RESEND_COOLDOWN', default=60, cast=int)  # seconds
+
+VERIFICATION_PURGE_BATCH_SIZE = config('VERIFICATION_PURGE_BATCH_SIZE', default=1000, cast=int)
+VERIFICATION_PURGE_MAX_BATCHES = config('VERIFICATION_PURGE_MAX_BATCHES', default=100, cast=int)
+
+
+# AUTHENTICATION THROTTLING
+# Token buckets of users.throttling, their rates are REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+THROTTLE_REDIS_URL = config('THROTTLE_REDIS_URL', default=BROKER_URL)
+
+
+# SMS
+SMS_BATCH_SIZE = config('SMS_BATCH_SIZE', default=1000, cast=int)  # recipients per provider request
+SMS_MAX_RETRIES = config('SMS_MAX_RETRIES', default=3, cast=int)
+SMS_RETRY_DELAY = config('SMS_RETRY_DELAY', default=30, cast=int)  # seconds, doubled on every retry
+
+
+# EMAILS
+EMAIL_BATCH_SIZE = config('EMAIL_BATCH_SIZE', default=1000, cast=int)  # personalizations per SendGrid request
+EMAIL_MAX_RETRIES = config('EMAIL_MAX_RETRIES', default=3, cast=int)
+EMAIL_RETRY_DELAY = config('EMAIL_RETRY_DELAY', default=30, cast=int)  # seconds, doubled on every retry
+
+
+# NOTIFICATION BACKEND
+# notifications.backends.ProviderBackend or notifications.backends.SimulatorBackend (no provider is called)
+NOTIFICATION_BACKEND = config('NOTIFICATION_BACKEND', default='notifications.backends.ProviderBackend')
+NOTIFICATION_SIMULATOR_URL = config('NOTIFICATION_SIMULATOR_URL', default='http://localhost:8025')
+
+
+# NOTIFICATION DISPATCHER
+# sync (one provider call at a time per task) or async (notifications.dispatcher, concurrent calls per process)
+NOTIFICATION_DISPATCHER = config('NOTIFICATION_DISPATCHER', default='sync')
+NOTIFICATION_CONCURRENCY = {
+    'africastalking': config('AFRICASTALKING_CONCURRENCY', default=100, cast=int),  # requests in flight per process
+    'sendgrid': config('SENDGRID_CONCURRENCY', default=100, cast=int),
+}
+NOTIFICATION_REQUEST_TIMEOUT = config('NOTIFICATION_REQUEST_TIMEOUT', default=10.0, cast=float)  # seconds
+NOTIFICATION_CONNECT_TIMEOUT = config('NOTIFICATION_CONNECT_TIMEOUT', default=3.0, cast=float)  # seconds
+NOTIFICATION_POOL_SIZE = config('NOTIFICATION_POOL_SIZE', default=10, cast=int)  # kept alive connections, sync
+
+
+# NOTIFICATION CIRCUIT BREAKERS
+# Shared by all the workers, see notifications.breakers
+NOTIFICATION_BREAKER_REDIS_URL = config('NOTIFICATION_BREAKER_REDIS_URL', default=BROKER_URL)
+NOTIFICATION_BREAKER_FAILURE_THRESHOLD = config('NOTIFICATION_BREAKER_FAILURE_THRESHOLD', default=5, cast=int)
+NOTIFICATION_BREAKER_RESET_TIMEOUT = config('NOTIFICATION_BREAKER_RESET_TIMEOUT', default=30.0, cast=float)  # seconds
+# Longest countdown of a notification task retry, retries back off exponentially with jitter up to it
+NOTIFICATION_RETRY_MAX_DELAY = config('NOTIFICATION_RETRY_MAX_DELAY', default=600.0, cast=float)  # seconds
+
+
+# NOTIFICATION OUTBOX
+# Drained by python manage.py relay_notifications
+NOTIFICATION_OUTBOX_BATCH_SIZE = config('NOTIFICATION_OUTBOX_BATCH_SIZE', default=100, cast=int)
+NOTIFICATION_OUTBOX_POLL_INTERVAL = config('NOTIFICATION_OUTBOX_POLL_INTERVAL', default=0.5, cast=float)  # seconds
+NOTIFICATION_OUTBOX_MAX_BACKOFF = config('NOTIFICATION_OUTBOX_MAX_BACKOFF', default=30.0, cast=float)  # seconds
+# Broker rejections of a message before it is moved to the dead letters
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = config('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', default=10, cast=int)
+
+
+# CELERY BEAT
+CELERYBEAT_SCHEDULE = {
+    'purge-expired-verifications': {
+        'task': 'users.tasks.tasks_verification.purge_expired_verifications',
+        'schedule': config('VERIFICATION_PURGE_INTERVAL', default=60.0, cast=float),  # seconds
+    },
+}
+
+
+# CACHE
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_URL', default=BROKER_URL),
+    }
+}
+
+# Token -> user cache used by users.authentication.CachedTokenAuthentication
+TOKEN_CACHE_ALIAS = 'default'
+TOKEN_CACHE_TIMEOUT = config('TOKEN_CACHE_TIMEOUT', default=300, cast=int)  # seconds
+TOKEN_CACHE_LOCAL_TIMEOUT = config('TOKEN_CACHE_LOCAL_TIMEOUT', default=5, cast=int)  # seconds
+TOKEN_CACHE_LOCAL_SIZE = config('TOKEN_CACHE_LOCAL_SIZE', default=10000, cast=int)
+
+# AUTH TOKENS
+# AUTH_TOKEN_TYPE is either token (DRF tokens stored in the database) or signed (stateless signed tokens)
+AUTH_TOKEN_TYPE = config('AUTH_TOKEN_TYPE', default='token')
+SIGNED_ACCESS_TOKEN_LIFETIME = config('SIGNED_ACCESS_TOKEN_LIFETIME', default=900, cast=int)  # seconds
+SIGNED_REFRESH_TOKEN_LIFETIME = config('SIGNED_REFRESH_TOKEN_LIFETIME', default=1209600, cast=int)  # seconds
+
+
+# USER TYPEAHEAD
+# Users returned by /users/typeahead at most, and how long every process keeps its results
+TYPEAHEAD_MAX_RESULTS = config('TYPEAHEAD_MAX_RESULTS', default=10, cast=int)
+TYPEAHEAD_CACHE_TIMEOUT = config('TYPEAHEAD_CACHE_TIMEOUT', default=5, cast=int)  # seconds
+TYPEAHEAD_CACHE_SIZE = config('TYPEAHEAD_CACHE_SIZE', default=10000, cast=int)
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
@@ -178,31 +295,59 @@ MEDIA_URL = "/media/"
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880
 
 
+# WEB WORKER STARTUP
+# Seconds a new worker may take to load the application, checked by python manage.py check_startup_time
+STARTUP_TIME_BUDGET = config('STARTUP_TIME_BUDGET', default=2.0, cast=float)  # seconds
+
+
+# RESPONSE COMPRESSION
+# Responses of at least COMPRESSION_MIN_SIZE bytes are compressed with brotli or gzip, see UAMSAPI.middleware
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)  # bytes
+COMPRESSION_GZIP_LEVEL = config('COMPRESSION_GZIP_LEVEL', default=6, cast=int)
+COMPRESSION_BROTLI_QUALITY = config('COMPRESSION_BROTLI_QUALITY', default=4, cast=int)
+
+
 # CORS CONFIG
 CORS_ORIGIN_WHITELIST = config('CORS_ORIGIN_WHITELIST').split(',')
 
 # REST FRAMEWORK
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'UAMSAPI.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'UAMSAPI.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
+        'users.authentication.SignedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'rest_framework.filters.OrderingFilter',
         'rest_framework.filters.SearchFilter',
         'django_filters.rest_framework.DjangoFilterBackend',
-    )
+    ),
+    # <requests>/<second|minute|hour|day> per client IP, identifier and phone country code, see users.throttling
+    'DEFAULT_THROTTLE_RATES': {
+        'otp.ip': config('OTP_THROTTLE_IP_RATE', default='60/hour'),
+        'otp.identifier': config('OTP_THROTTLE_IDENTIFIER_RATE', default='5/hour'),
+        'otp.country': config('OTP_THROTTLE_COUNTRY_RATE', default='600/minute'),
+        'login.ip': config('LOGIN_THROTTLE_IP_RATE', default='60/minute'),
+        'login.identifier': config('LOGIN_THROTTLE_IDENTIFIER_RATE', default='10/minute'),
+    },
 }
 
 
 AUTH_USER_MODEL = 'users.User'
 
 AUTHENTICATION_BACKENDS = [
-    "users.backend.PasswordlessAuthBackend",
-    "users.backend.Backend",
-    "django.contrib.auth.backends.ModelBackend",
+    "users.backend.AuthenticationBackend",
 ]
 
 
@@ -218,6 +363,9 @@ NOSE_ARGS = [
 SENDGRID_API_KEY = config("SENDGRID_API_KEY")
 SENDGRID_DEFAULT_SENDER = config("SENDGRID_DEFAULT_SENDER")
 
+AFRICASTALKING_USERNAME = config("AFRICASTALKING_USERNAME")
+AFRICASTALKING_APIKEY = config("AFRICASTALKING_APIKEY")
+
 
 USE_HEROKU = config('USE_HEROKU', default=False, cast=bool)
 
@@ -231,6 +379,8 @@ USE_GOOGLE_STORAGE = config("USE_GOOGLE_STORAGE", default=False, cast=bool)
 if USE_GOOGLE_STORAGE:
     import json
 
+    from google.oauth2 import service_account
+
     DEFAULT_FILE_STORAGE = "storages.backends.gcloud.GoogleCloudStorage"
     GS_BUCKET_NAME = config("GS_BUCKET_NAME")
     STATICFILES_STORAGE = "storages.backends.gcloud.GoogleCloudStorage"
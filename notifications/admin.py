@@ -1,3 +1,5 @@
 from django.contrib import admin
+from .models import OutboxMessage, DeadLetter
 
-# Register your models here.
+admin.site.register(OutboxMessage)
+admin.site.register(DeadLetter)
@@ -0,0 +1,78 @@
+"""
+Notification backends.
+
+A backend tells the notification senders where the provider APIs are and how to authenticate with them.
+The backend in use is picked with the NOTIFICATION_BACKEND setting:
+
+- notifications.backends.ProviderBackend sends to Africa's Talking and SendGrid
+- notifications.backends.SimulatorBackend sends to the local simulator of notifications.simulator,
+  nothing reaches the providers
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+AFRICASTALKING = "africastalking"
+SENDGRID = "sendgrid"
+
+SMS_PATH = "/version1/messaging"
+EMAIL_PATH = "/v3/mail/send"
+
+
+class ProviderBackend:
+    """
+    Africa's Talking (its sandbox when AFRICASTALKING_USERNAME is sandbox) and SendGrid
+    """
+    # Prefix of the redis keys of the circuit breakers, see notifications.breakers
+    breaker_prefix = "breaker"
+
+    def __init__(self):
+        if settings.AFRICASTALKING_USERNAME == "sandbox":
+            self.sms_url = "https://api.sandbox.africastalking.com" + SMS_PATH
+        else:
+            self.sms_url = "https://api.africastalking.com" + SMS_PATH
+        self.email_url = "https://api.sendgrid.com" + EMAIL_PATH
+
+        self.sms_username = settings.AFRICASTALKING_USERNAME
+        self.sms_headers = {"Accept": "application/json", "ApiKey": settings.AFRICASTALKING_APIKEY}
+        self.email_headers = {"Authorization": f"Bearer {settings.SENDGRID_API_KEY}"}
+
+    def sms_data(self, batch, message, sender=None):
+        """
+        Form data of an Africa's Talking bulk SMS request
+        :param list[str] batch: Recipient phone numbers
+        :param str message: SMS Message
+        :param str sender: Custom SenderID/Name
+        :return: dict
+        """
+        data = {"username": self.sms_username, "to": ",".join(batch), "message": message, "bulkSMSMode": 1}
+
+        if sender is not None:
+            data["from"] = sender
+
+        return data
+
+
+class SimulatorBackend(ProviderBackend):
+    """
+    Local simulator serving both provider APIs
+    :param str url: Base url of the simulator, defaults to NOTIFICATION_SIMULATOR_URL
+    """
+    # Failures of the simulator must not open the breakers of the providers
+    breaker_prefix = "simulator-breaker"
+
+    def __init__(self, url=None):
+        super(SimulatorBackend, self).__init__()
+        url = (url or settings.NOTIFICATION_SIMULATOR_URL).rstrip("/")
+        self.sms_url = url + SMS_PATH
+        self.email_url = url + EMAIL_PATH
+
+
+@lru_cache(maxsize=None)
+def get_notification_backend():
+    """
+    Returns the backend configured in NOTIFICATION_BACKEND
+    :return: ProviderBackend
+    """
+    return import_string(settings.NOTIFICATION_BACKEND)()
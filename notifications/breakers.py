@@ -0,0 +1,187 @@
+"""
+Circuit breakers of the notification providers.
+
+Every provider has one breaker shared by all the worker processes, its state lives in redis under the
+breaker_prefix of the notification backend, so that the simulator has breakers of its own:
+
+- closed: requests go through, NOTIFICATION_BREAKER_FAILURE_THRESHOLD failed requests in a row open it
+- open: requests fail right away without reaching the provider for NOTIFICATION_BREAKER_RESET_TIMEOUT seconds
+- half-open: then a single probe request goes through, the breaker closes when it succeeds and opens again
+  when it fails. The probe holds its slot for NOTIFICATION_REQUEST_TIMEOUT seconds at most.
+
+A failed request is one that timed out, could not connect or got a 429 or 5xx answer. Counters of the
+transitions and of the rejected requests are kept with the state, see CircuitBreaker.stats and
+python manage.py notification_breakers.
+"""
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+
+from .backends import AFRICASTALKING, SENDGRID, get_notification_backend
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = (AFRICASTALKING, SENDGRID)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# Status of the recipients of a request the breaker did not let through
+CIRCUIT_OPEN = "CircuitOpen"
+
+
+def is_provider_failure(status_code):
+    """
+    :param int status_code: HTTP status of a provider answer, None when there was no answer
+    :return: bool whether the answer counts as a failure of the provider
+    """
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+class CircuitBreaker:
+    """
+    :param str provider: Provider name
+    :param str url: Redis url, defaults to NOTIFICATION_BREAKER_REDIS_URL
+    :param int failure_threshold: Failed requests in a row opening the breaker
+    :param float reset_timeout: Seconds the breaker stays open before a probe request is let through
+    :param str prefix: Prefix of the redis key holding the state of the breaker
+    """
+
+    ACQUIRE_SCRIPT = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'state', 'opened_at', 'probe_until')
+    if state[1] ~= 'open' and state[1] ~= 'half-open' then
+        return {1, '0'}
+    end
+    local wait = tonumber(state[2]) + tonumber(ARGV[1]) - now
+    if state[3] then
+        wait = math.max(wait, tonumber(state[3]) - now)
+    end
+    if wait > 0 then
+        redis.call('HINCRBY', KEYS[1], 'rejected', 1)
+        return {0, tostring(wait)}
+    end
+    if state[1] == 'open' then
+        redis.call('HINCRBY', KEYS[1], 'half_opened', 1)
+    end
+    redis.call('HSET', KEYS[1], 'state', 'half-open', 'probe_until', tostring(now + tonumber(ARGV[2])))
+    return {1, '0'}
+    """
+
+    SUCCESS_SCRIPT = """
+    local state = redis.call('HMGET', KEYS[1], 'state', 'failures')
+    if state[1] == 'open' or state[1] == 'half-open' then
+        redis.call('HSET', KEYS[1], 'state', 'closed', 'failures', 0)
+        redis.call('HDEL', KEYS[1], 'probe_until')
+        redis.call('HINCRBY', KEYS[1], 'closed', 1)
+        return 1
+    end
+    if state[2] and state[2] ~= '0' then
+        redis.call('HSET', KEYS[1], 'failures', 0)
+    end
+    return 0
+    """
+
+    FAILURE_SCRIPT = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local state = redis.call('HGET', KEYS[1], 'state')
+    if state == 'open' then
+        return 0
+    end
+    if state ~= 'half-open' and redis.call('HINCRBY', KEYS[1], 'failures', 1) < tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', tostring(now), 'failures', 0)
+    redis.call('HDEL', KEYS[1], 'probe_until')
+    redis.call('HINCRBY', KEYS[1], 'opened', 1)
+    return 1
+    """
+
+    def __init__(self, provider, url=None, failure_threshold=None, reset_timeout=None, prefix="breaker"):
+        import redis
+
+        self.provider = provider
+        self.client = redis.Redis.from_url(url or settings.NOTIFICATION_BREAKER_REDIS_URL, decode_responses=True)
+        self.failure_threshold = failure_threshold or settings.NOTIFICATION_BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or settings.NOTIFICATION_BREAKER_RESET_TIMEOUT
+        self.key = f"{prefix}:{provider}"
+        self._acquire = self.client.register_script(self.ACQUIRE_SCRIPT)
+        self._success = self.client.register_script(self.SUCCESS_SCRIPT)
+        self._failure = self.client.register_script(self.FAILURE_SCRIPT)
+
+    def acquire(self):
+        """
+        Asks whether a request can be sent to the provider, call record afterwards when it can
+        :return: float 0 when the request can be sent, otherwise seconds before the breaker lets a request through
+        """
+        try:
+            allowed, wait = self._acquire(keys=[self.key],
+                                          args=[self.reset_timeout, settings.NOTIFICATION_REQUEST_TIMEOUT])
+        except Exception as e:
+            # The provider is still called when redis is unreachable
+            logger.warning("Circuit breaker of %s skipped: %s", self.provider, e)
+            return 0
+        return 0 if allowed else float(wait)
+
+    def record(self, status_code):
+        """
+        Records the outcome of a request let through by acquire
+        :param int status_code: HTTP status of the provider answer, None when there was no answer
+        """
+        try:
+            if is_provider_failure(status_code):
+                if self._failure(keys=[self.key], args=[self.failure_threshold]):
+                    logger.warning("Circuit breaker of %s opened", self.provider)
+            elif self._success(keys=[self.key]):
+                logger.info("Circuit breaker of %s closed", self.provider)
+        except Exception as e:
+            logger.warning("Circuit breaker of %s skipped: %s", self.provider, e)
+
+    def retry_after(self):
+        """
+        :return: float seconds before the breaker lets a request through, 0 when it is closed
+        """
+        try:
+            stats = self.stats()
+            now = self.client.time()
+        except Exception as e:
+            logger.warning("Circuit breaker of %s skipped: %s", self.provider, e)
+            return 0
+
+        if stats["state"] == CLOSED:
+            return 0
+        return max(0.0, stats["opened_at"] + self.reset_timeout - (now[0] + now[1] / 1000000))
+
+    def stats(self):
+        """
+        :return: dict state, opened_at, consecutive failures and counters of the transitions and rejected requests
+        """
+        values = self.client.hgetall(self.key)
+        return {
+            "state": values.get("state", CLOSED),
+            "opened_at": float(values.get("opened_at", 0)),
+            "failures": int(values.get("failures", 0)),
+            "opened": int(values.get("opened", 0)),
+            "half_opened": int(values.get("half_opened", 0)),
+            "closed": int(values.get("closed", 0)),
+            "rejected": int(values.get("rejected", 0)),
+        }
+
+    def reset(self):
+        """
+        Closes the breaker and clears its counters
+        """
+        self.client.delete(self.key)
+
+
+@lru_cache(maxsize=None)
+def get_breaker(provider):
+    """
+    :param str provider: AFRICASTALKING or SENDGRID
+    :return: CircuitBreaker shared by the workers sending through the configured backend
+    """
+    return CircuitBreaker(provider, prefix=get_notification_backend().breaker_prefix)
@@ -0,0 +1,191 @@
+"""
+Asyncio dispatcher for notification provider calls.
+
+Every worker process gets one event loop, run in a daemon thread, with one aiohttp session whose
+connections to the providers are kept alive between tasks. Tasks hand their provider calls to the loop and
+wait for the results, so the calls of all the tasks a process runs are in flight at the same time, bounded
+by NOTIFICATION_CONCURRENCY per provider.
+
+Enabled with NOTIFICATION_DISPATCHER = "async". Tasks block while the loop sends, run the worker with a
+thread pool to have many of them at once:
+
+    celery -A celeryconfig worker -P threads -c 200
+
+aiohttp is imported on first use only, web processes import this module through the tasks but never send.
+"""
+import asyncio
+import json
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+
+from .backends import AFRICASTALKING, SENDGRID, get_notification_backend
+from .breakers import CIRCUIT_OPEN, PROVIDERS, get_breaker
+from .email_utils import batch_recipients as batch_email_recipients, build_mail, email_results, \
+    email_error_results, send_emails, split_rejected
+from .sms_utils import SENDER_ID, batch_recipients as batch_sms_recipients, sms_results, sms_error_results, \
+    send_bulk_message
+
+
+class NotificationDispatcher:
+    """
+    Sends SMS and emails concurrently over pooled keep-alive connections
+    :param dict concurrency: Provider -> maximum number of requests in flight, defaults to NOTIFICATION_CONCURRENCY
+    :param ProviderBackend backend: Provider APIs, defaults to the one configured in NOTIFICATION_BACKEND
+    :param dict breakers: Provider -> CircuitBreaker, defaults to the breakers shared by the workers
+    """
+
+    def __init__(self, concurrency=None, backend=None, breakers=None):
+        self.concurrency = concurrency or settings.NOTIFICATION_CONCURRENCY
+        self.backend = backend or get_notification_backend()
+        self.breakers = breakers or {provider: get_breaker(provider) for provider in PROVIDERS}
+        self.loop = None
+        self.session = None
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def run(self, coroutine):
+        """
+        Runs a coroutine on the dispatcher loop from any thread and waits for its result
+        """
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="notification-dispatcher", daemon=True).start()
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        if self.loop is not None:
+            if self.session is not None:
+                self.run(self.session.close())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = self.session = None
+            self.semaphores = {}
+
+    def get_session(self):
+        import aiohttp
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=sum(self.concurrency.values()), keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=settings.NOTIFICATION_REQUEST_TIMEOUT,
+                                              sock_connect=settings.NOTIFICATION_CONNECT_TIMEOUT),
+            )
+        return self.session
+
+    def get_semaphore(self, provider):
+        if provider not in self.semaphores:
+            self.semaphores[provider] = asyncio.Semaphore(self.concurrency[provider])
+        return self.semaphores[provider]
+
+    async def send_sms(self, phone_numbers, message, sender=SENDER_ID):
+        """
+        Async send_bulk_message, the batches are sent concurrently
+        """
+        batches, results = batch_sms_recipients(phone_numbers)
+
+        for batch_results in await asyncio.gather(*[self.post_sms(batch, message, sender) for batch in batches]):
+            results.extend(batch_results)
+
+        return results
+
+    async def post_sms(self, batch, message, sender):
+        import aiohttp
+
+        data = self.backend.sms_data(batch, message, sender)
+        breaker = self.breakers[AFRICASTALKING]
+
+        async with self.get_semaphore(AFRICASTALKING):
+            if await self.in_executor(breaker.acquire):
+                return sms_error_results(batch, CIRCUIT_OPEN)
+
+            try:
+                async with self.get_session().post(self.backend.sms_url, data=data,
+                                                   headers=self.backend.sms_headers) as response:
+                    status_code = response.status
+                    text = await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                await self.in_executor(breaker.record, None)
+                return sms_error_results(batch, e)
+
+        await self.in_executor(breaker.record, status_code)
+
+        if status_code >= 300:
+            return sms_error_results(batch, text)
+        try:
+            return sms_results(batch, json.loads(text))
+        except ValueError as e:
+            return sms_error_results(batch, e)
+
+    async def send_emails(self, messages):
+        """
+        Async email_utils.send_emails, the requests are sent concurrently
+        """
+        batches, results = batch_email_recipients(messages)
+
+        for batch_results in await asyncio.gather(*[self.post_mail(recipients) for recipients in batches]):
+            results.extend(batch_results)
+
+        return results
+
+    async def post_mail(self, recipients):
+        import aiohttp
+
+        breaker = self.breakers[SENDGRID]
+
+        async with self.get_semaphore(SENDGRID):
+            if await self.in_executor(breaker.acquire):
+                return email_error_results(recipients, CIRCUIT_OPEN)
+
+            try:
+                async with self.get_session().post(self.backend.email_url, json=build_mail(recipients).get(),
+                                                   headers=self.backend.email_headers) as response:
+                    status_code = response.status
+                    text = await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                await self.in_executor(breaker.record, None)
+                return email_error_results(recipients, e)
+
+        await self.in_executor(breaker.record, status_code)
+
+        halves = split_rejected(recipients, status_code)
+        if halves:
+            return [result for half_results in await asyncio.gather(*[self.post_mail(half) for half in halves])
+                    for result in half_results]
+
+        return email_results(recipients, status_code, text)
+
+    async def in_executor(self, function, *args):
+        # Circuit breaker calls go to redis, they must not block the loop
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+@lru_cache(maxsize=None)
+def get_dispatcher():
+    """
+    Dispatcher of the current process, created on first use so that every forked worker has its own loop
+    :return: NotificationDispatcher
+    """
+    return NotificationDispatcher()
+
+
+def dispatch_sms(phone_numbers, message, sender=SENDER_ID):
+    """
+    send_bulk_message, through the dispatcher when NOTIFICATION_DISPATCHER is async
+    """
+    if settings.NOTIFICATION_DISPATCHER == "async":
+        dispatcher = get_dispatcher()
+        return dispatcher.run(dispatcher.send_sms(phone_numbers, message, sender))
+    return send_bulk_message(phone_numbers, message, sender=sender)
+
+
+def dispatch_emails(messages):
+    """
+    email_utils.send_emails, through the dispatcher when NOTIFICATION_DISPATCHER is async
+    """
+    if settings.NOTIFICATION_DISPATCHER == "async":
+        dispatcher = get_dispatcher()
+        return dispatcher.run(dispatcher.send_emails(messages))
+    return send_emails(messages)
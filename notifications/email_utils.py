@@ -1,8 +1,16 @@
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
 
-sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
+from .backends import SENDGRID, get_notification_backend
+from .breakers import CIRCUIT_OPEN, get_breaker
+from .utils import get_http_session
+
+# Provider limits: personalizations per request and size of the substitutions of a personalization
+MAX_PERSONALIZATIONS = 1000
+MAX_SUBSTITUTIONS_SIZE = 10000
+
+MESSAGE_TAG = "-message-"
 
 
 def send_email(emails, subject, message, from_email):
@@ -10,16 +18,146 @@ def send_email(emails, subject, message, from_email):
     :param list[str] emails: list of email addresses
     :param str subject: Email subject
     :param str message: Email message to be sent to recipients
-    :return: void
+    :return: list[dict] per recipient results, see send_emails
+    """
+    return send_emails([{"emails": emails, "subject": subject, "message": message, "from_email": from_email}])
+
+
+def send_emails(messages, batch_size=None):
+    """
+    Sends many emails with as few requests as possible.
+    Every recipient gets its own personalization (recipient, subject and message), emails from the same sender
+    share a request. The message reaches the shared content through a substitution, messages too large
+    for a substitution are sent on their own. Invalid addresses are reported without a request, requests
+    SendGrid rejects are split until the rejected recipients are alone, see split_rejected.
+
+    :param list[dict] messages: Emails with emails, subject, message and from_email like send_email_task takes them
+    :param int batch_size: Maximum number of personalizations per request, defaults to EMAIL_BATCH_SIZE
+    :return: list[dict] one result per recipient with email, subject, message, from_email, status, status_code
+        and retry
+    """
+    batches, results = batch_recipients(messages, batch_size)
+
+    for recipients in batches:
+        results.extend(post_mail(recipients))
+
+    return results
+
+
+def batch_recipients(messages, batch_size=None):
     """
+    Splits the recipients of messages into SendGrid requests
+    :return: tuple list[list[dict]] recipients of every request and results of the addresses that can not be
+        sent to
+    """
+    batch_size = min(batch_size or settings.EMAIL_BATCH_SIZE, MAX_PERSONALIZATIONS)
+    batches = {}
+    singles = []
+    results = []
+
+    for message in messages:
+        for email in dict.fromkeys(message["emails"]):
+            recipient = {"email": email, "subject": message["subject"], "message": message["message"],
+                         "from_email": message.get("from_email") or settings.SENDGRID_DEFAULT_SENDER}
+
+            if not is_valid_email(email):
+                # SendGrid rejects the whole request when one of the addresses is invalid
+                results.append(dict(recipient, status="InvalidEmail", status_code=400, retry=False))
+            elif len(recipient["message"].encode()) > MAX_SUBSTITUTIONS_SIZE:
+                singles.append([recipient])
+            else:
+                batches.setdefault(recipient["from_email"], []).append(recipient)
 
-    message = Mail(
-        from_email=from_email,
-        to_emails=emails,
-        subject=subject,
-        html_content=message
-    )
+    return singles + [
+        recipients[i:i + batch_size] for recipients in batches.values() for i in range(0, len(recipients), batch_size)
+    ], results
+
+
+def is_valid_email(email):
     try:
-        response = sg.send(message)
-    except Exception as e:
-        print(e)
+        validate_email(email)
+    except ValidationError:
+        return False
+    return True
+
+
+def split_rejected(recipients, status_code):
+    """
+    A request SendGrid rejects as a whole is sent again in two halves, so that the recipients it would reject
+    end up alone in their request and the others are sent
+    :param list[dict] recipients: Recipients of the request
+    :param int status_code: HTTP status of the answer
+    :return: list[list[dict]] recipients of the requests to send instead, empty when the results are final
+    """
+    if status_code != 400 or len(recipients) < 2:
+        return []
+
+    middle = len(recipients) // 2
+    return [recipients[:middle], recipients[middle:]]
+
+
+def build_mail(recipients):
+    from sendgrid.helpers.mail import Mail, Personalization, To, Substitution
+
+    if len(recipients) == 1:
+        recipient = recipients[0]
+        return Mail(from_email=recipient["from_email"], to_emails=recipient["email"], subject=recipient["subject"],
+                    html_content=recipient["message"])
+
+    mail = Mail(from_email=recipients[0]["from_email"], html_content=MESSAGE_TAG)
+
+    for index, recipient in enumerate(recipients):
+        personalization = Personalization()
+        personalization.add_to(To(recipient["email"]))
+        personalization.subject = recipient["subject"]
+        personalization.add_substitution(Substitution(MESSAGE_TAG, recipient["message"]))
+        mail.add_personalization(personalization, index=index)
+
+    return mail
+
+
+def post_mail(recipients):
+    """
+    Sends recipients sharing a sender in one request, unless the SendGrid circuit breaker is open
+    """
+    import requests
+
+    backend = get_notification_backend()
+    breaker = get_breaker(SENDGRID)
+
+    if breaker.acquire():
+        return email_error_results(recipients, CIRCUIT_OPEN)
+
+    try:
+        response = get_http_session().post(backend.email_url, json=build_mail(recipients).get(),
+                                           headers=backend.email_headers,
+                                           timeout=(settings.NOTIFICATION_CONNECT_TIMEOUT,
+                                                    settings.NOTIFICATION_REQUEST_TIMEOUT))
+    except requests.RequestException as e:
+        breaker.record(None)
+        return email_error_results(recipients, e)
+
+    breaker.record(response.status_code)
+
+    halves = split_rejected(recipients, response.status_code)
+    if halves:
+        return [result for half in halves for result in post_mail(half)]
+
+    return email_results(recipients, response.status_code, response.text)
+
+
+def email_results(recipients, status_code, text):
+    """
+    SendGrid accepts or rejects a request as a whole, every recipient gets the status of the request.
+    Rejected requests only get here with a single recipient, see split_rejected.
+    """
+    status = "Accepted" if status_code < 300 else text
+
+    # Throttled and server errors are transient, other errors come from the request itself
+    retry = status_code == 429 or status_code >= 500
+
+    return [dict(recipient, status=status, status_code=status_code, retry=retry) for recipient in recipients]
+
+
+def email_error_results(recipients, error):
+    return [dict(recipient, status=str(error), status_code=None, retry=True) for recipient in recipients]
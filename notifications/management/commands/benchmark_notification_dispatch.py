@@ -0,0 +1,73 @@
+import asyncio
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications.backends import AFRICASTALKING, SENDGRID, SimulatorBackend
+from notifications.breakers import PROVIDERS, CircuitBreaker
+from notifications.dispatcher import NotificationDispatcher
+from notifications.simulator import ProviderSimulator, percentile
+
+
+class Command(BaseCommand):
+    help = "Measures notification throughput and latency of the async dispatcher against the local provider " \
+           "simulator, compared with one provider call in flight at a time like a prefork worker process"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--notifications", type=int, default=1000, help="Number of SMS and of emails sent")
+        parser.add_argument("--latency", default="fixed:0.1",
+                            help="Provider latency, see notifications.simulator.parse_latency")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of provider requests failing")
+        parser.add_argument("--rate-limit", type=float, default=None, help="Provider requests per second")
+        parser.add_argument("--concurrency", type=int, default=200, help="Requests in flight per provider")
+
+    def handle(self, *args, **options):
+        count = options["notifications"]
+
+        for concurrency in (1, options["concurrency"]):
+            try:
+                simulator = ProviderSimulator(latency=options["latency"], error_rate=options["error_rate"],
+                                              rate_limit=options["rate_limit"])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+            # Breakers of each run's own, so that simulated errors neither reach the shared breakers of the
+            # providers nor the next run
+            prefix = f"benchmark-breaker-{uuid.uuid4()}"
+            breakers = {provider: CircuitBreaker(provider, prefix=prefix) for provider in PROVIDERS}
+
+            dispatcher = NotificationDispatcher(
+                concurrency={AFRICASTALKING: concurrency, SENDGRID: concurrency},
+                backend=SimulatorBackend(simulator.start()),
+                breakers=breakers,
+            )
+
+            async def timed(coroutine):
+                start = time.perf_counter()
+                results = await coroutine
+                return time.perf_counter() - start, results
+
+            async def send_all():
+                return await asyncio.gather(
+                    *[timed(dispatcher.send_sms([f"+99{i:010d}"], "Benchmark")) for i in range(count)],
+                    *[timed(dispatcher.send_emails([{"emails": [f"user{i}@example.com"], "subject": "Benchmark",
+                                                     "message": "<p>Benchmark</p>"}])) for i in range(count)],
+                )
+
+            start = time.perf_counter()
+            timings = dispatcher.run(send_all())
+            elapsed = time.perf_counter() - start
+            dispatcher.close()
+            simulator.stop()
+            rejected = sum(breaker.stats()["rejected"] for breaker in breakers.values())
+            for breaker in breakers.values():
+                breaker.reset()
+
+            latencies = sorted(latency for latency, _ in timings)
+            failed = sum(1 for _, results in timings for result in results if result["retry"])
+            self.stdout.write(
+                f"concurrency {concurrency}: sent {len(timings)} notifications in {elapsed:.2f}s "
+                f"({len(timings) / elapsed:.0f} notifications/s), p50 {percentile(latencies, 50):.3f}s, "
+                f"p99 {percentile(latencies, 99):.3f}s, {failed} failed ({rejected} rejected by the breakers)"
+            )
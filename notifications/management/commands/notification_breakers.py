@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from notifications.breakers import PROVIDERS, get_breaker
+
+
+class Command(BaseCommand):
+    help = "Shows the state and counters of the circuit breakers of the notification providers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Close the breakers and clear their counters")
+
+    def handle(self, *args, **options):
+        for provider in PROVIDERS:
+            breaker = get_breaker(provider)
+
+            if options["reset"]:
+                breaker.reset()
+
+            stats = breaker.stats()
+            self.stdout.write(
+                f"{provider}: {stats['state']}, retry after {breaker.retry_after():.1f}s, "
+                f"{stats['failures']} failures in a row, opened {stats['opened']} times, "
+                f"half-opened {stats['half_opened']} times, closed {stats['closed']} times, "
+                f"{stats['rejected']} requests rejected"
+            )
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications.outbox import relay_outbox
+
+
+class Command(BaseCommand):
+    help = "Publishes the notification outbox to the broker in batches, in the order the notifications were added"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.NOTIFICATION_OUTBOX_BATCH_SIZE,
+                            help="Number of messages published per transaction")
+        parser.add_argument("--interval", type=float, default=settings.NOTIFICATION_OUTBOX_POLL_INTERVAL,
+                            help="Seconds to wait when the outbox is drained")
+        parser.add_argument("--max-backoff", type=float, default=settings.NOTIFICATION_OUTBOX_MAX_BACKOFF,
+                            help="Maximum seconds to wait after consecutive broker errors")
+        parser.add_argument("--once", action="store_true", help="Drain the outbox and exit")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        interval = options["interval"]
+        failures = 0
+
+        while True:
+            try:
+                published = relay_outbox(batch_size)
+            except Exception as e:
+                if options["once"]:
+                    raise CommandError(f"Could not publish notification: {e}")
+
+                failures += 1
+                delay = min(interval * 2 ** failures, options["max_backoff"])
+                self.stderr.write(f"Could not publish notification: {e}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            failures = 0
+
+            if published:
+                self.stdout.write(f"Published {published} notifications")
+
+            if published < batch_size:
+                if options["once"]:
+                    break
+                time.sleep(interval)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from notifications.models import DeadLetter
+from notifications.outbox import requeue_dead_letters
+
+
+class Command(BaseCommand):
+    help = "Puts the notifications that failed after their last retry back in the outbox, on their queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--task", help="Only requeue the dead letters of this task, e.g. "
+                                           "notifications.tasks.tasks_sms.send_sms_task")
+
+    def handle(self, *args, **options):
+        dead_letters = DeadLetter.objects.all()
+
+        if options["task"]:
+            dead_letters = dead_letters.filter(task=options["task"])
+
+        self.stdout.write(f"Requeued {requeue_dead_letters(dead_letters)} notifications")
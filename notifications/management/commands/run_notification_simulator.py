@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications.simulator import ProviderSimulator
+
+
+class Command(BaseCommand):
+    help = "Serves a local simulator of the Africa's Talking and SendGrid APIs, " \
+           "use it with NOTIFICATION_BACKEND=notifications.backends.SimulatorBackend"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8025)
+        parser.add_argument("--latency", default="fixed:0",
+                            help="fixed:<s>, uniform:<low>,<high>, exponential:<mean> or lognormal:<median>,<sigma>")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500")
+        parser.add_argument("--recipient-error-rate", type=float, default=0.0,
+                            help="Share of SMS recipients reported with a 500 status")
+        parser.add_argument("--rate-limit", type=float, default=None,
+                            help="Requests per second accepted per provider, the others are answered with a 429")
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            simulator = ProviderSimulator(
+                latency=options["latency"],
+                error_rate=options["error_rate"],
+                recipient_error_rate=options["recipient_error_rate"],
+                rate_limit=options["rate_limit"],
+                seed=options["seed"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Serving the notification simulator on http://{options['host']}:{options['port']}")
+        simulator.serve(host=options["host"], port=options["port"])
@@ -0,0 +1,22 @@
+# Generated by Django 4.0.7 on 2026-10-16 22:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_dead_letter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='queue',
+            field=models.CharField(blank=True, default='', help_text='Empty to route by task', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(fields=['queue', 'id'], name='notificatio_queue_1059b6_idx'),
+        ),
+    ]
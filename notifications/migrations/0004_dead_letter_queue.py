@@ -0,0 +1,18 @@
+# Generated by Django 4.0.7 on 2026-10-16 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_outbox_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deadletter',
+            name='queue',
+            field=models.CharField(blank=True, default='', help_text='Empty to route by task', max_length=255),
+        ),
+    ]
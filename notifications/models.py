@@ -1,3 +1,43 @@
 from django.db import models
 
-# Create your models here.
+
+class OutboxMessage(models.Model):
+    """
+    Notification task waiting to be published to the broker.
+    Rows are written in the same transaction as the change they notify about and published in id order
+    by the relay_notifications command, which deletes them once the broker accepted them.
+    Messages for NOTIFICATION_OTP_QUEUE are published before the others.
+    """
+    task = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict)
+    queue = models.CharField(max_length=255, blank=True, default="", help_text="Empty to route by task")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [models.Index(fields=["queue", "id"])]
+
+    def __str__(self):
+        return f"{self.task} - {self.id}"
+
+
+class DeadLetter(models.Model):
+    """
+    Notification task that still had failed recipients after its last retry or recipients the provider rejected,
+    with the keyword arguments sending to them only, or that the outbox relay could not publish
+    NOTIFICATION_OUTBOX_MAX_ATTEMPTS times.
+    Put back in the outbox with the requeue_dead_letters command, on the queue the task was on.
+    """
+    task = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict)
+    queue = models.CharField(max_length=255, blank=True, default="", help_text="Empty to route by task")
+    results = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.task} - {self.id}"
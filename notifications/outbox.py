@@ -0,0 +1,154 @@
+"""
+Transactional outbox for notification tasks.
+
+Views do not publish tasks to the broker. They call enqueue_notification inside the transaction that
+changes the data the notification is about, which costs a single local INSERT and rolls back with the change.
+The relay_notifications command drains the outbox with relay_outbox:
+
+- Messages for NOTIFICATION_OTP_QUEUE are published first, so that verification codes never wait behind
+  other notifications, then the others.
+- Messages are published in id order within these two groups. A batch stops at the first message the broker
+  rejects and the next pass starts again from that message, so a message is never published before an older
+  one of the same task and queue.
+- Rows are locked while a batch is published, several relays can run but only one publishes at a time.
+- Delivery is at least once: a relay that dies between publishing and committing publishes the batch again.
+- A message the broker rejected NOTIFICATION_OUTBOX_MAX_ATTEMPTS times is moved to the dead letters, so that it
+  does not hold back the messages behind it. requeue_dead_letters puts it back.
+- Messages of the tasks in COALESCED_TASKS are published as a single message of a batch task per queue, placed
+  where the first of them was. The relay batch is the window in which they are collected.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from celeryconfig import app
+from .models import OutboxMessage, DeadLetter
+from .tasks.tasks_email import send_email_task, send_email_batch_task
+
+# Task name -> name of the task taking the keyword arguments of many of its messages as messages
+COALESCED_TASKS = {
+    send_email_task.name: send_email_batch_task.name,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_notification(task, queue=None, **kwargs):
+    """
+    Adds a task to the outbox, it is published once the current transaction commits
+    :param celery.Task task: Task
+    :param str queue: Queue the task is published to, defaults to the one CELERY_ROUTES gives the task
+    :param kwargs: Task keyword arguments, must be JSON serializable
+    :return: OutboxMessage
+    """
+    return OutboxMessage.objects.create(task=task.name, queue=queue or "", kwargs=kwargs)
+
+
+def requeue_dead_letters(dead_letters=None):
+    """
+    Moves dead letters back to the outbox, their tasks are published again by the relay to the queues they
+    were on, or to the ones CELERY_ROUTES gives them when that is not known
+    :param QuerySet dead_letters: Dead letters to requeue, defaults to all of them
+    :return: int number of requeued dead letters
+    """
+    with transaction.atomic():
+        dead_letters = list((dead_letters if dead_letters is not None else DeadLetter.objects.all())
+                            .select_for_update().order_by("id"))
+        OutboxMessage.objects.bulk_create([OutboxMessage(task=letter.task, queue=letter.queue, kwargs=letter.kwargs)
+                                           for letter in dead_letters])
+        DeadLetter.objects.filter(id__in=[letter.id for letter in dead_letters]).delete()
+
+    return len(dead_letters)
+
+
+def relay_outbox(batch_size=None):
+    """
+    Publishes the oldest messages of the outbox to the broker and deletes them
+    :param int batch_size: Maximum number of messages published
+    :return: int number of published messages
+    :raises Exception: The broker error when a message could not be published, messages published before it
+        are deleted all the same. Messages out of attempts are dead lettered instead and the batch goes on.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE
+    published = []
+    error = None
+
+    with transaction.atomic():
+        messages = list(OutboxMessage.objects.select_for_update()
+                        .filter(queue=settings.NOTIFICATION_OTP_QUEUE).order_by("id")[:batch_size])
+
+        if len(messages) < batch_size:
+            messages.extend(OutboxMessage.objects.select_for_update().exclude(queue=settings.NOTIFICATION_OTP_QUEUE)
+                            .order_by("id")[:batch_size - len(messages)])
+
+        for task, queue, kwargs, grouped in group_messages(messages):
+            try:
+                app.send_task(task, kwargs=kwargs, **({"queue": queue} if queue else {}))
+            except Exception as e:
+                for message in grouped:
+                    message.attempts += 1
+                    message.last_error = str(e)
+
+                dead = [message for message in grouped if message.attempts >= settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS]
+                pending = [message for message in grouped if message not in dead]
+
+                if dead:
+                    dead_letter_messages(dead)
+                if pending:
+                    OutboxMessage.objects.bulk_update(pending, ["attempts", "last_error"])
+                    error = e
+                    break
+                continue
+
+            published.extend(message.id for message in grouped)
+
+        if published:
+            OutboxMessage.objects.filter(id__in=published).delete()
+
+    if error:
+        raise error
+
+    return len(published)
+
+
+def dead_letter_messages(messages):
+    """
+    Moves outbox messages the broker kept rejecting to the dead letters
+    :param list[OutboxMessage] messages: Messages out of attempts
+    """
+    DeadLetter.objects.bulk_create([
+        DeadLetter(task=message.task, queue=message.queue, kwargs=message.kwargs,
+                   results=[{"error": message.last_error, "attempts": message.attempts}])
+        for message in messages
+    ])
+    OutboxMessage.objects.filter(id__in=[message.id for message in messages]).delete()
+
+    for message in messages:
+        logger.error("Outbox message %s of %s dead lettered after %s attempts: %s", message.id, message.task,
+                     message.attempts, message.last_error)
+
+
+def group_messages(messages):
+    """
+    Tasks to publish for a batch of messages, in the order of their first message
+    :param list[OutboxMessage] messages: Messages in publishing order
+    :return: list[tuple] task name, queue, task keyword arguments and the messages they publish
+    """
+    groups = []
+    batches = {}
+
+    for message in messages:
+        batch_task = COALESCED_TASKS.get(message.task)
+        key = (batch_task, message.queue)
+
+        if batch_task is None:
+            groups.append((message.task, message.queue, message.kwargs, [message]))
+        elif key in batches:
+            batches[key][2]["messages"].append(message.kwargs)
+            batches[key][3].append(message)
+        else:
+            batches[key] = (batch_task, message.queue, {"messages": [message.kwargs]}, [message])
+            groups.append(batches[key])
+
+    return groups
@@ -0,0 +1,255 @@
+"""
+Local simulator of the Africa's Talking bulk SMS and SendGrid mail send APIs.
+
+It answers like the providers, with configurable latency, error rates and rate limiting, and records every
+request it receives. Point the notification senders at it with
+NOTIFICATION_BACKEND = "notifications.backends.SimulatorBackend" and run it with:
+
+    python manage.py run_notification_simulator --latency lognormal:0.2,0.5 --error-rate 0.01
+
+or in process with ProviderSimulator(...).start(), which serves it from a daemon thread.
+The recorded requests and latency percentiles are served under /simulator/.
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from aiohttp import web
+
+from .backends import AFRICASTALKING, SENDGRID, SMS_PATH, EMAIL_PATH
+from .email_utils import is_valid_email
+from .sms_utils import PHONE_NUMBER_REGEX
+
+
+def parse_latency(spec):
+    """
+    Latency distribution from its description
+    :param str spec: fixed:<seconds>, uniform:<low>,<high>, exponential:<mean> or lognormal:<median>,<sigma>
+    :return: callable taking a random.Random and returning a latency in seconds
+    """
+    name, _, args = spec.partition(":")
+
+    try:
+        args = [float(arg) for arg in args.split(",")] if args else []
+
+        if name == "fixed":
+            seconds, = args
+            return lambda rng: seconds
+        if name == "uniform":
+            low, high = args
+            return lambda rng: rng.uniform(low, high)
+        if name == "exponential":
+            mean, = args
+            return lambda rng: rng.expovariate(1 / mean) if mean else 0
+        if name == "lognormal":
+            median, sigma = args
+            return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    except ValueError:
+        pass
+
+    raise ValueError(f"Invalid latency distribution: {spec}")
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second with bursts of up to rate requests
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+
+class ProviderSimulator:
+    """
+    :param str latency: Latency distribution of the responses, see parse_latency
+    :param float error_rate: Share of the requests answered with a 500
+    :param float recipient_error_rate: Share of the SMS recipients reported with a 500 InternalServerError status
+    :param float rate_limit: Requests per second accepted per provider, the others are answered with a 429
+    :param int seed: Seed of the random draws
+    :param int max_records: Number of requests kept in the records
+    """
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, recipient_error_rate=0.0, rate_limit=None, seed=None,
+                 max_records=100000):
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.recipient_error_rate = recipient_error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.records = deque(maxlen=max_records)
+        self.buckets = {}
+        self.loop = None
+        self.runner = None
+        self.url = None
+
+    def application(self):
+        app = web.Application()
+        app.router.add_post(SMS_PATH, self.messaging)
+        app.router.add_post(EMAIL_PATH, self.mail_send)
+        app.router.add_get("/simulator/records", self.get_records)
+        app.router.add_delete("/simulator/records", self.delete_records)
+        app.router.add_get("/simulator/stats", self.get_stats)
+        return app
+
+    def start(self, host="127.0.0.1", port=0):
+        """
+        Serves the simulator from a daemon thread
+        :return: str base url of the simulator
+        """
+        self.loop = asyncio.new_event_loop()
+        self.runner = web.AppRunner(self.application(), access_log=None)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, host, port)
+        self.loop.run_until_complete(site.start())
+        threading.Thread(target=self.loop.run_forever, name="notification-simulator", daemon=True).start()
+
+        host, port = site._server.sockets[0].getsockname()[:2]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    def stop(self):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = self.runner = self.url = None
+
+    def serve(self, host="127.0.0.1", port=8025):
+        """
+        Serves the simulator until interrupted
+        """
+        web.run_app(self.application(), host=host, port=port, access_log=None)
+
+    def is_rate_limited(self, provider):
+        if not self.rate_limit:
+            return False
+        if provider not in self.buckets:
+            self.buckets[provider] = TokenBucket(self.rate_limit)
+        return not self.buckets[provider].take()
+
+    async def respond(self, provider, payload, recipients, response):
+        """
+        Applies rate limiting, latency and errors to a response and records the request
+        :param callable response: Returns the successful response
+        """
+        received_at = time.time()
+
+        if self.is_rate_limited(provider):
+            latency = 0
+            result = web.json_response({"errors": [{"message": "Too many requests"}]}, status=429)
+        else:
+            latency = self.latency(self.random)
+            await asyncio.sleep(latency)
+
+            if self.random.random() < self.error_rate:
+                result = web.json_response({"errors": [{"message": "Simulated error"}]}, status=500)
+            else:
+                result = response()
+
+        self.records.append({"provider": provider, "received_at": received_at, "latency": latency,
+                             "status": result.status, "recipients": recipients, "payload": payload})
+        return result
+
+    async def messaging(self, request):
+        data = dict(await request.post())
+        numbers = data.get("to", "").split(",")
+
+        def response():
+            statuses = []
+
+            for number in numbers:
+                if not PHONE_NUMBER_REGEX.match(number):
+                    status, status_code = "InvalidPhoneNumber", 403
+                elif self.random.random() < self.recipient_error_rate:
+                    status, status_code = "InternalServerError", 500
+                else:
+                    status, status_code = "Success", 101
+
+                statuses.append({"number": number, "status": status, "statusCode": status_code,
+                                 "cost": "KES 0.8000" if status_code == 101 else "0",
+                                 "messageId": f"ATPid_{self.random.getrandbits(64):016x}"})
+
+            sent = sum(1 for status in statuses if status["statusCode"] == 101)
+            return web.json_response({"SMSMessageData": {"Message": f"Sent to {sent}/{len(numbers)}",
+                                                         "Recipients": statuses}}, status=201)
+
+        return await self.respond(AFRICASTALKING, data, numbers, response)
+
+    async def mail_send(self, request):
+        try:
+            payload = await request.json()
+            recipients = [to["email"] for personalization in payload["personalizations"]
+                          for to in personalization["to"]]
+        except (ValueError, KeyError, TypeError):
+            return web.json_response({"errors": [{"message": "Bad Request"}]}, status=400)
+
+        def response():
+            # SendGrid rejects the whole request when one of the addresses is invalid
+            if not all(is_valid_email(email) for email in recipients):
+                return web.json_response({"errors": [{"message": "Invalid email address", "field": "to"}]},
+                                         status=400)
+            return web.Response(status=202)
+
+        return await self.respond(SENDGRID, payload, recipients, response)
+
+    def stats(self):
+        """
+        Requests, recipients, statuses and latency percentiles per provider
+        :return: dict
+        """
+        stats = {}
+        all_records = list(self.records)
+
+        for provider in (AFRICASTALKING, SENDGRID):
+            records = [record for record in all_records if record["provider"] == provider]
+            latencies = sorted(record["latency"] for record in records)
+            statuses = {}
+
+            for record in records:
+                statuses[str(record["status"])] = statuses.get(str(record["status"]), 0) + 1
+
+            stats[provider] = {
+                "requests": len(records),
+                "recipients": sum(len(record["recipients"]) for record in records),
+                "statuses": statuses,
+                "latency": {name: percentile(latencies, p) for name, p in
+                            (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))},
+            }
+
+        return stats
+
+    async def get_records(self, request):
+        return web.json_response(list(self.records))
+
+    async def delete_records(self, request):
+        self.records.clear()
+        return web.Response(status=204)
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats())
+
+
+def percentile(values, p):
+    """
+    :param list[float] values: Sorted values
+    :param float p: Percentile, between 0 and 100
+    :return: float or None when there are no values
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(len(values) * p / 100) - 1))]
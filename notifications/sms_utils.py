@@ -1,5 +1,18 @@
+import re
+
+from django.conf import settings
+
+from .backends import AFRICASTALKING, get_notification_backend
+from .breakers import CIRCUIT_OPEN, get_breaker
+from .utils import get_http_session
+
 SENDER_ID = None
-from .utils import sms_backend
+
+# Africa's Talking per-recipient status codes worth sending again, the others are final
+# (100 Processed, 101 Sent, 102 Queued, 403 InvalidPhoneNumber, 406 UserInBlacklist...)
+RETRYABLE_STATUS_CODES = (500, 501, 502)
+
+PHONE_NUMBER_REGEX = re.compile(r"^\+\d{1,3}\d{3,}$")
 
 
 def send_message(phone_number, message, sender=SENDER_ID):
@@ -9,4 +22,104 @@ def send_message(phone_number, message, sender=SENDER_ID):
     :param str sender: Custom SenderID/Name
     """
 
-    sms_backend.send(message=message, recipients=[phone_number], sender_id=sender)
+    send_bulk_message([phone_number], message, sender=sender)
+
+
+def send_bulk_message(phone_numbers, message, sender=SENDER_ID, batch_size=None):
+    """
+    Sends the same message to many recipients, one provider request per batch of recipients.
+    A request that fails marks all the recipients of its batch as failed, the other batches are still sent.
+
+    :param list[str] phone_numbers: Recipient phone numbers, with the country code
+    :param str message: SMS Message to be sent
+    :param str sender: Custom SenderID/Name
+    :param int batch_size: Maximum number of recipients per request, defaults to SMS_BATCH_SIZE
+    :return: list[dict] one result per distinct recipient with number, status, status_code and retry
+    """
+    batches, results = batch_recipients(phone_numbers, batch_size)
+
+    for batch in batches:
+        results.extend(post_sms(batch, message, sender))
+
+    return results
+
+
+def post_sms(batch, message, sender):
+    """
+    Sends one provider request, unless the Africa's Talking circuit breaker is open
+    """
+    import requests
+
+    backend = get_notification_backend()
+    breaker = get_breaker(AFRICASTALKING)
+
+    if breaker.acquire():
+        return sms_error_results(batch, CIRCUIT_OPEN)
+
+    try:
+        response = get_http_session().post(backend.sms_url, data=backend.sms_data(batch, message, sender),
+                                           headers=backend.sms_headers,
+                                           timeout=(settings.NOTIFICATION_CONNECT_TIMEOUT,
+                                                    settings.NOTIFICATION_REQUEST_TIMEOUT))
+    except requests.RequestException as e:
+        breaker.record(None)
+        return sms_error_results(batch, e)
+
+    breaker.record(response.status_code)
+
+    if response.status_code >= 300:
+        return sms_error_results(batch, response.text)
+    try:
+        return sms_results(batch, response.json())
+    except ValueError as e:
+        return sms_error_results(batch, e)
+
+
+def batch_recipients(phone_numbers, batch_size=None):
+    """
+    Splits recipients into provider requests
+    :return: tuple list of recipient batches and results of the numbers that can not be sent to
+    """
+    batch_size = batch_size or settings.SMS_BATCH_SIZE
+    recipients = []
+    results = []
+
+    for phone_number in dict.fromkeys(phone_numbers):
+        if PHONE_NUMBER_REGEX.match(phone_number):
+            recipients.append(phone_number)
+        else:
+            # The provider rejects the whole request when one of the numbers is invalid
+            results.append(sms_result(phone_number, "InvalidPhoneNumber", 403))
+
+    return [recipients[i:i + batch_size] for i in range(0, len(recipients), batch_size)], results
+
+
+def sms_results(batch, response):
+    """
+    Per recipient results of a provider response
+    """
+    try:
+        statuses = {recipient["number"]: recipient for recipient in response["SMSMessageData"]["Recipients"]}
+    except (KeyError, TypeError) as e:
+        return sms_error_results(batch, f"Unexpected response: {e}")
+
+    results = []
+
+    for phone_number in batch:
+        status = statuses.get(phone_number)
+
+        if status is None:
+            results.append(sms_result(phone_number, "NotReported", None, retry=True))
+        else:
+            results.append(sms_result(phone_number, status["status"], status["statusCode"],
+                                      retry=status["statusCode"] in RETRYABLE_STATUS_CODES))
+
+    return results
+
+
+def sms_error_results(batch, error):
+    return [sms_result(phone_number, str(error), None, retry=True) for phone_number in batch]
+
+
+def sms_result(phone_number, status, status_code, retry=False):
+    return {"number": phone_number, "status": status, "status_code": status_code, "retry": retry}
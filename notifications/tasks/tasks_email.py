@@ -1,18 +1,91 @@
-from celeryconfig import app
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 from django.conf import settings
-from notifications.email_utils import send_email
 
-sg = SendGridAPIClient(settings.SENDGRID_API_KEY)
+from celeryconfig import app
+from notifications.backends import SENDGRID
+from notifications.models import DeadLetter
+from notifications.dispatcher import dispatch_emails
+from notifications.utils import get_task_queue, retry_countdown
+
 sg_default_sender = settings.SENDGRID_DEFAULT_SENDER
 
-@app.task
-def send_email_task(emails, subject, message, from_email=sg_default_sender):
+
+@app.task(bind=True, max_retries=settings.EMAIL_MAX_RETRIES, ignore_result=True)
+def send_email_task(self, emails, subject, message, from_email=sg_default_sender):
     """
     :param list[str] emails: list of email addresses
     :param str subject: Email subject
     :param str message: Email message to be sent to recipients
-    :return: void
+    :return: list[dict] per recipient results of the last attempt, see email_utils.send_emails
+    """
+    results = dispatch_emails([{"emails": emails, "subject": subject, "message": message, "from_email": from_email}])
+    failed = [result for result in results if result["retry"]]
+    rejected = get_rejected(results)
+
+    if rejected:
+        DeadLetter.objects.create(task=self.name, queue=get_task_queue(self), kwargs={
+            "emails": [result["email"] for result in rejected], "subject": subject, "message": message,
+            "from_email": from_email
+        }, results=summarize_results(rejected))
+
+    if failed:
+        # Only the failed recipients are sent again
+        kwargs = {"emails": [result["email"] for result in failed], "subject": subject, "message": message,
+                  "from_email": from_email}
+
+        if self.request.retries < self.max_retries:
+            raise self.retry(kwargs=kwargs, countdown=retry_countdown(settings.EMAIL_RETRY_DELAY,
+                                                                      self.request.retries, SENDGRID))
+
+        DeadLetter.objects.create(task=self.name, queue=get_task_queue(self), kwargs=kwargs,
+                                  results=summarize_results(failed))
+
+    return summarize_results(results)
+
+
+@app.task(bind=True, max_retries=settings.EMAIL_MAX_RETRIES, ignore_result=True)
+def send_email_batch_task(self, messages):
+    """
+    Sends the messages of many send_email_task calls with as few SendGrid requests as possible.
+    The notification relay publishes one of these for the send_email_task messages of a batch.
+
+    :param list[dict] messages: send_email_task keyword arguments
+    :return: list[dict] per recipient results of the last attempt, see email_utils.send_emails
+    """
+    results = dispatch_emails(messages)
+    failed = [
+        {"emails": [result["email"]], "subject": result["subject"], "message": result["message"],
+         "from_email": result["from_email"]}
+        for result in results if result["retry"]
+    ]
+    rejected = get_rejected(results)
+
+    if rejected:
+        DeadLetter.objects.create(task=self.name, queue=get_task_queue(self), kwargs={"messages": [
+            {"emails": [result["email"]], "subject": result["subject"], "message": result["message"],
+             "from_email": result["from_email"]}
+            for result in rejected
+        ]}, results=summarize_results(rejected))
+
+    if failed:
+        if self.request.retries < self.max_retries:
+            raise self.retry(kwargs={"messages": failed}, countdown=retry_countdown(settings.EMAIL_RETRY_DELAY,
+                                                                                    self.request.retries, SENDGRID))
+
+        DeadLetter.objects.create(task=self.name, queue=get_task_queue(self), kwargs={"messages": failed},
+                                  results=summarize_results([result for result in results if result["retry"]]))
+
+    return summarize_results(results)
+
+
+def get_rejected(results):
+    """
+    Recipients SendGrid or the address validation rejected, they are dead lettered at once instead of retried
+    """
+    return [result for result in results if not result["retry"] and result["status_code"] >= 300]
+
+
+def summarize_results(results):
+    """
+    Recipient, status and retry of send_emails results, as the tasks return and dead letter them
     """
-    send_email(emails, subject, message, from_email)
+    return [{key: result[key] for key in ("email", "status", "status_code", "retry")} for result in results]
@@ -1,11 +1,32 @@
+from django.conf import settings
+
 from celeryconfig import app
-from notifications.sms_utils import send_message
+from notifications.backends import AFRICASTALKING
+from notifications.models import DeadLetter
+from notifications.sms_utils import SENDER_ID
+from notifications.dispatcher import dispatch_sms
+from notifications.utils import get_task_queue, retry_countdown
+
 
-@app.task
-def send_sms_task(phone_numbers, message):
+@app.task(bind=True, max_retries=settings.SMS_MAX_RETRIES, ignore_result=True)
+def send_sms_task(self, phone_numbers, message, sender=SENDER_ID):
     """
     :param list[str] phone_numbers: list of phone numbers to receive sms message. Country code must be included
     :param str message: SMS message to be sent to recipients
+    :param str sender: Custom SenderID/Name
+    :return: list[dict] per recipient results of the last attempt, see sms_utils.send_bulk_message
     """
-    for phone_number in phone_numbers:
-        send_message(phone_number=phone_number, message=message)
\ No newline at end of file
+    results = dispatch_sms(phone_numbers, message, sender=sender)
+    failed = [result for result in results if result["retry"]]
+
+    if failed:
+        # Only the failed recipients are sent again
+        kwargs = {"phone_numbers": [result["number"] for result in failed], "message": message, "sender": sender}
+
+        if self.request.retries < self.max_retries:
+            raise self.retry(kwargs=kwargs, countdown=retry_countdown(settings.SMS_RETRY_DELAY, self.request.retries,
+                                                                      AFRICASTALKING))
+
+        DeadLetter.objects.create(task=self.name, queue=get_task_queue(self), kwargs=kwargs, results=failed)
+
+    return results
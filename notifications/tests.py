@@ -1,3 +1,512 @@
-from django.test import TestCase
+import time
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from celeryconfig import app
+from notifications.models import OutboxMessage, DeadLetter
+from notifications.outbox import enqueue_notification, relay_outbox, requeue_dead_letters
+from notifications.sms_utils import send_bulk_message
+from notifications.tasks.tasks_sms import send_sms_task
+from notifications.tasks.tasks_email import send_email_task, send_email_batch_task
+from notifications.email_utils import send_emails
+from notifications.backends import AFRICASTALKING, SENDGRID, SimulatorBackend
+from notifications.dispatcher import NotificationDispatcher
+from notifications.simulator import ProviderSimulator, parse_latency
+from notifications.breakers import CircuitBreaker, PROVIDERS, CIRCUIT_OPEN, OPEN, HALF_OPEN, CLOSED, get_breaker
+from notifications.utils import retry_countdown
+from users.models import User, Verification
+from users.tasks.tasks_verification import purge_expired_verifications
+from users.tests import use_fresh_throttle_buckets
+
+
+class TestNotificationOutbox(TestCase):
+    """
+    Test notification outbox:
+    - Requests add notifications to the outbox instead of publishing them, in the transaction of their change
+    - The relay publishes them in order and stops at the first broker error
+    - Messages rejected too many times are dead lettered instead of blocking the outbox
+    - Verification codes are published first, to their own queue
+    """
+
+    def setUp(self):
+        use_fresh_throttle_buckets(self)
+        self.client = APIClient()
+
+    def test_request_verification_code_adds_to_outbox(self):
+        with mock.patch("notifications.outbox.app.send_task") as send_task:
+            response = self.client.post("/auth/request-verification-code", data={"username": "+000000000000"})
+
+        self.assertEqual(response.status_code, 200)
+        send_task.assert_not_called()
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.task, send_sms_task.name)
+        self.assertEqual(message.kwargs["phone_numbers"], ["+000000000000"])
+        self.assertEqual(message.queue, settings.NOTIFICATION_OTP_QUEUE)
+
+    def test_request_verification_code_is_atomic(self):
+        with mock.patch("users.views.enqueue_notification", side_effect=RuntimeError("Outbox is down")):
+            with self.assertRaises(RuntimeError):
+                self.client.post("/auth/request-verification-code", data={"username": "+000000000000"})
+
+        self.assertFalse(User.objects.filter(phone_number="+000000000000").exists())
+        self.assertFalse(Verification.objects.exists())
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_relay_in_order(self):
+        first = enqueue_notification(send_sms_task, phone_numbers=["+111111111111"], message="first")
+        second = enqueue_notification(send_sms_task, phone_numbers=["+222222222222"], message="second")
+
+        with mock.patch("notifications.outbox.app.send_task") as send_task:
+            self.assertEqual(relay_outbox(), 2)
+
+        self.assertEqual(send_task.call_args_list, [
+            mock.call(first.task, kwargs=first.kwargs),
+            mock.call(second.task, kwargs=second.kwargs),
+        ])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_relay_coalesces_emails(self):
+        first = enqueue_notification(send_email_task, emails=["first@xyz.com"], subject="Hi", message="first")
+        sms = enqueue_notification(send_sms_task, phone_numbers=["+111111111111"], message="sms")
+        second = enqueue_notification(send_email_task, emails=["second@xyz.com"], subject="Hi", message="second")
+
+        with mock.patch("notifications.outbox.app.send_task") as send_task:
+            self.assertEqual(relay_outbox(), 3)
+
+        self.assertEqual(send_task.call_args_list, [
+            mock.call(send_email_batch_task.name, kwargs={"messages": [first.kwargs, second.kwargs]}),
+            mock.call(sms.task, kwargs=sms.kwargs),
+        ])
+
+    def test_relay_otp_queue_first(self):
+        status = enqueue_notification(send_email_task, emails=["first@xyz.com"], subject="Hi", message="status")
+        maintenance = enqueue_notification(send_sms_task, phone_numbers=["+111111111111"], message="maintenance")
+        otp = enqueue_notification(send_email_task, queue=settings.NOTIFICATION_OTP_QUEUE, emails=["second@xyz.com"],
+                                   subject="Hi", message="otp")
+
+        with mock.patch("notifications.outbox.app.send_task") as send_task:
+            self.assertEqual(relay_outbox(batch_size=2), 2)
+
+        self.assertEqual(send_task.call_args_list, [
+            mock.call(send_email_batch_task.name, kwargs={"messages": [otp.kwargs]},
+                      queue=settings.NOTIFICATION_OTP_QUEUE),
+            mock.call(send_email_batch_task.name, kwargs={"messages": [status.kwargs]}),
+        ])
+        self.assertEqual(list(OutboxMessage.objects.all()), [maintenance])
+
+    def test_routes(self):
+        router = app.amqp.router
+
+        self.assertEqual(router.route({}, send_sms_task.name)["queue"].name, "transactional")
+        self.assertEqual(router.route({}, purge_expired_verifications.name)["queue"].name, "bulk")
+
+    def test_relay_batch_size(self):
+        for i in range(3):
+            enqueue_notification(send_sms_task, phone_numbers=["+111111111111"], message=str(i))
+
+        with mock.patch("notifications.outbox.app.send_task"):
+            self.assertEqual(relay_outbox(batch_size=2), 2)
+
+        self.assertEqual([message.kwargs["message"] for message in OutboxMessage.objects.all()], ["2"])
+
+    def test_relay_stops_at_broker_error(self):
+        enqueue_notification(send_sms_task, phone_numbers=["+111111111111"], message="first")
+        enqueue_notification(send_sms_task, phone_numbers=["+111111111111"], message="second")
+        enqueue_notification(send_sms_task, phone_numbers=["+111111111111"], message="third")
+
+        with mock.patch("notifications.outbox.app.send_task",
+                        side_effect=[None, ConnectionError("Broker is down")]) as send_task:
+            with self.assertRaises(ConnectionError):
+                relay_outbox()
+
+        self.assertEqual(send_task.call_count, 2)
+
+        pending = list(OutboxMessage.objects.all())
+        self.assertEqual([message.kwargs["message"] for message in pending], ["second", "third"])
+        self.assertEqual(pending[0].attempts, 1)
+        self.assertEqual(pending[0].last_error, "Broker is down")
+
+        with mock.patch("notifications.outbox.app.send_task"):
+            self.assertEqual(relay_outbox(), 2)
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    @override_settings(NOTIFICATION_OUTBOX_MAX_ATTEMPTS=2)
+    def test_relay_dead_letters_rejected_messages(self):
+        poison = enqueue_notification(send_sms_task, queue=settings.NOTIFICATION_OTP_QUEUE,
+                                      phone_numbers=["+111111111111"], message="poison")
+        enqueue_notification(send_sms_task, phone_numbers=["+111111111111"], message="next")
+
+        def send_task(task, kwargs, **options):
+            if kwargs["message"] == "poison":
+                raise ValueError("Cannot serialize")
+
+        with mock.patch("notifications.outbox.app.send_task", side_effect=send_task):
+            with self.assertRaises(ValueError):
+                relay_outbox()
+            self.assertEqual(relay_outbox(), 1)
+
+        self.assertFalse(OutboxMessage.objects.exists())
+
+        dead_letter = DeadLetter.objects.get()
+        self.assertEqual((dead_letter.task, dead_letter.queue, dead_letter.kwargs),
+                         (poison.task, settings.NOTIFICATION_OTP_QUEUE, poison.kwargs))
+        self.assertEqual(dead_letter.results, [{"error": "Cannot serialize", "attempts": 2}])
+
+
+class SimulatorTestCase(TestCase):
+    """
+    Sends notifications to an in process ProviderSimulator
+    """
+    simulator_options = {}
+    breaker_options = {}
+
+    def setUp(self):
+        self.simulator = ProviderSimulator(**self.simulator_options)
+        self.backend = SimulatorBackend(self.simulator.start())
+        self.addCleanup(self.simulator.stop)
+
+        for module in ("sms_utils", "email_utils"):
+            patcher = mock.patch(f"notifications.{module}.get_notification_backend", return_value=self.backend)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # Breakers of their own, so that failures of other tests do not open them
+        prefix = f"test-breaker-{uuid.uuid4()}"
+        self.breakers = {provider: CircuitBreaker(provider, prefix=prefix, **self.breaker_options)
+                         for provider in PROVIDERS}
+
+        for module in ("sms_utils", "email_utils", "dispatcher", "utils"):
+            patcher = mock.patch(f"notifications.{module}.get_breaker", new=self.breakers.__getitem__)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TestSMSBatching(SimulatorTestCase):
+    """
+    Test multi-recipient SMS sending:
+    - Recipients are sent in batches of SMS_BATCH_SIZE
+    - Invalid numbers are reported without a request
+    - Only the recipients that failed are retried
+    """
+
+    def test_batches(self):
+        phone_numbers = [f"+2507880000{i:02d}" for i in range(25)]
+
+        results = send_bulk_message(phone_numbers + phone_numbers[:5] + ["250788"], "Hello", batch_size=10)
+
+        self.assertEqual([len(record["recipients"]) for record in self.simulator.records], [10, 10, 5])
+        self.assertEqual(self.simulator.records[0]["payload"]["message"], "Hello")
+        self.assertEqual(len(results), 26)
+        self.assertEqual(results[0], {"number": "250788", "status": "InvalidPhoneNumber", "status_code": 403,
+                                      "retry": False})
+        self.assertTrue(all(result["status_code"] == 101 for result in results[1:]))
+
+    def test_failed_request(self):
+        self.simulator.error_rate = 1
+
+        results = send_bulk_message(["+250788000000", "+250788000001"], "Hello")
+
+        self.assertEqual([result["retry"] for result in results], [True, True])
+        self.assertIn("Simulated error", results[0]["status"])
+
+    @override_settings(SMS_RETRY_DELAY=0)
+    def test_task_retries_failed_recipients(self):
+        with mock.patch("notifications.tasks.tasks_sms.dispatch_sms", side_effect=[
+            [{"number": "+250788000000", "status": "Success", "status_code": 101, "retry": False},
+             {"number": "+250788000001", "status": "GatewayError", "status_code": 501, "retry": True},
+             {"number": "+250788000002", "status": "UserInBlacklist", "status_code": 406, "retry": False}],
+            [{"number": "+250788000001", "status": "Success", "status_code": 101, "retry": False}],
+        ]) as dispatch_sms:
+            results = send_sms_task.apply(kwargs={
+                "phone_numbers": ["+250788000000", "+250788000001", "+250788000002"],
+                "message": "Hello"
+            }).get()
+
+        self.assertEqual(dispatch_sms.call_args_list[1].args[0], ["+250788000001"])
+        self.assertEqual(results, [{"number": "+250788000001", "status": "Success", "status_code": 101,
+                                    "retry": False}])
+
+
+class TestEmailBatching(SimulatorTestCase):
+    """
+    Test aggregated email sending:
+    - Emails from the same sender share a request, one personalization per recipient
+    - Invalid addresses are reported without a request
+    - Rejected requests are split until the rejected recipients are alone
+    - Only the recipients of failed requests are retried, rejected recipients are dead lettered
+    """
+
+    def test_personalizations(self):
+        messages = [
+            {"emails": ["first@xyz.com", "second@xyz.com"], "subject": "Hi", "message": "<p>1</p>"},
+            {"emails": ["third@xyz.com"], "subject": "Hello", "message": "<p>2</p>"},
+            {"emails": ["fourth@xyz.com"], "subject": "Hello", "message": "<p>3</p>", "from_email": "other@xyz.com"},
+        ]
+
+        results = send_emails(messages, batch_size=2)
+
+        bodies = [record["payload"] for record in self.simulator.records]
+        self.assertEqual(len(bodies), 3)
+        self.assertEqual([len(body["personalizations"]) for body in bodies], [2, 1, 1])
+        self.assertEqual(bodies[0]["personalizations"][1], {
+            "to": [{"email": "second@xyz.com"}], "subject": "Hi", "substitutions": {"-message-": "<p>1</p>"}
+        })
+        self.assertEqual(bodies[2]["from"], {"email": "other@xyz.com"})
+        self.assertEqual([result["status"] for result in results], ["Accepted"] * 4)
+
+    def test_rate_limited(self):
+        self.simulator.rate_limit = 1
+
+        results = send_emails([{"emails": [f"user{i}@xyz.com"], "subject": "Hi", "message": "<p>Hi</p>",
+                                "from_email": f"sender{i}@xyz.com"} for i in range(3)])
+
+        self.assertEqual([result["status_code"] for result in results], [202, 429, 429])
+        self.assertEqual([result["retry"] for result in results], [False, True, True])
+
+    def test_invalid_addresses(self):
+        results = send_emails([{"emails": ["first@xyz.com", "first", "second@xyz.com"], "subject": "Hi",
+                                "message": "<p>Hi</p>"}])
+
+        self.assertEqual(len(self.simulator.records), 1)
+        self.assertEqual(self.simulator.records[0]["recipients"], ["first@xyz.com", "second@xyz.com"])
+        self.assertEqual([(result["email"], result["status_code"], result["retry"]) for result in results], [
+            ("first", 400, False), ("first@xyz.com", 202, False), ("second@xyz.com", 202, False)
+        ])
+
+    def test_rejected_request_is_split(self):
+        emails = ["first@xyz.com", "second@xyz.com", "third@xyz", "fourth@xyz.com"]
+
+        # Addresses SendGrid rejects but the validation lets through
+        with mock.patch("notifications.email_utils.is_valid_email", side_effect=lambda email: True):
+            results = send_emails([{"emails": emails, "subject": "Hi", "message": "<p>Hi</p>"}])
+
+        self.assertEqual([record["recipients"] for record in self.simulator.records], [
+            emails, emails[:2], emails[2:], ["third@xyz"], ["fourth@xyz.com"]
+        ])
+        self.assertEqual([(result["email"], result["status_code"], result["retry"]) for result in results], [
+            ("first@xyz.com", 202, False), ("second@xyz.com", 202, False), ("third@xyz", 400, False),
+            ("fourth@xyz.com", 202, False)
+        ])
+
+    def test_task_dead_letters_rejected_recipients(self):
+        messages = [
+            {"emails": ["first@xyz.com"], "subject": "Hi", "message": "<p>1</p>", "from_email": "a@xyz.com"},
+            {"emails": ["second"], "subject": "Hi", "message": "<p>2</p>", "from_email": "a@xyz.com"},
+        ]
+
+        results = send_email_batch_task.apply(kwargs={"messages": messages}).get()
+
+        self.assertEqual([result["status_code"] for result in results], [400, 202])
+        dead_letter = DeadLetter.objects.get()
+        self.assertEqual(dead_letter.task, send_email_batch_task.name)
+        self.assertEqual(dead_letter.kwargs, {"messages": [messages[1]]})
+        self.assertEqual(dead_letter.results, [{"email": "second", "status": "InvalidEmail", "status_code": 400,
+                                                "retry": False}])
+
+    @override_settings(EMAIL_RETRY_DELAY=0)
+    def test_task_retries_failed_recipients(self):
+        messages = [
+            {"emails": ["first@xyz.com"], "subject": "Hi", "message": "<p>1</p>", "from_email": "a@xyz.com"},
+            {"emails": ["second@xyz.com"], "subject": "Hi", "message": "<p>2</p>", "from_email": "b@xyz.com"},
+        ]
+        failed = dict(messages[1], email="second@xyz.com", status="error", status_code=503, retry=True)
+
+        with mock.patch("notifications.tasks.tasks_email.dispatch_emails", side_effect=[
+            [dict(messages[0], email="first@xyz.com", status="Accepted", status_code=202, retry=False), failed],
+            [dict(failed, status="Accepted", status_code=202, retry=False)],
+        ]) as dispatch_emails:
+            results = send_email_batch_task.apply(kwargs={"messages": messages}).get()
+
+        self.assertEqual(dispatch_emails.call_args_list[1].args[0], [
+            {"emails": ["second@xyz.com"], "subject": "Hi", "message": "<p>2</p>", "from_email": "b@xyz.com"}
+        ])
+        self.assertEqual(results, [{"email": "second@xyz.com", "status": "Accepted", "status_code": 202,
+                                    "retry": False}])
+
+
+class TestNotificationDispatcher(SimulatorTestCase):
+    """
+    Test async notification dispatcher
+    """
+
+    def setUp(self):
+        super(TestNotificationDispatcher, self).setUp()
+        self.dispatcher = NotificationDispatcher(concurrency={AFRICASTALKING: 2, SENDGRID: 2}, backend=self.backend)
+        self.addCleanup(self.dispatcher.close)
+
+    @override_settings(SMS_BATCH_SIZE=2)
+    def test_send_sms(self):
+        results = self.dispatcher.run(self.dispatcher.send_sms(
+            ["+250788000000", "+250788000001", "+250788000002", "250788"], "Hello"))
+
+        self.assertEqual([(result["number"], result["status_code"]) for result in results], [
+            ("250788", 403), ("+250788000000", 101), ("+250788000001", 101), ("+250788000002", 101)
+        ])
+        self.assertEqual(len(self.simulator.records), 2)
+
+    def test_send_emails(self):
+        results = self.dispatcher.run(self.dispatcher.send_emails([
+            {"emails": ["first@xyz.com", "second@xyz.com"], "subject": "Hi", "message": "<p>1</p>"},
+        ]))
+
+        self.assertEqual([(result["email"], result["status"]) for result in results], [
+            ("first@xyz.com", "Accepted"), ("second@xyz.com", "Accepted")
+        ])
+
+    def test_send_emails_splits_rejected_requests(self):
+        with mock.patch("notifications.email_utils.is_valid_email", side_effect=lambda email: True):
+            results = self.dispatcher.run(self.dispatcher.send_emails([
+                {"emails": ["first@xyz", "second@xyz.com"], "subject": "Hi", "message": "<p>1</p>"},
+            ]))
+
+        self.assertEqual(len(self.simulator.records), 3)
+        self.assertEqual([(result["email"], result["status_code"]) for result in results], [
+            ("first@xyz", 400), ("second@xyz.com", 202)
+        ])
+
+    def test_unreachable_provider(self):
+        dispatcher = NotificationDispatcher(backend=SimulatorBackend("http://127.0.0.1:9"))
+
+        results = dispatcher.run(dispatcher.send_sms(["+250788000000"], "Hello"))
+        dispatcher.close()
+
+        self.assertTrue(results[0]["retry"])
+
+    def test_injected_breakers(self):
+        breaker = CircuitBreaker(AFRICASTALKING, prefix=f"test-breaker-{uuid.uuid4()}", failure_threshold=1)
+        breaker.record(None)
+        dispatcher = NotificationDispatcher(backend=self.backend,
+                                            breakers={AFRICASTALKING: breaker, SENDGRID: self.breakers[SENDGRID]})
+
+        results = dispatcher.run(dispatcher.send_sms(["+250788000000"], "Hello"))
+        dispatcher.close()
+
+        self.assertEqual(results[0]["status"], CIRCUIT_OPEN)
+        self.assertEqual(len(self.simulator.records), 0)
+        self.assertEqual(self.breakers[AFRICASTALKING].stats()["rejected"], 0)
+
+    def test_simulator_breaker_keys(self):
+        with mock.patch("notifications.breakers.get_notification_backend", return_value=self.backend):
+            self.assertEqual(get_breaker.__wrapped__(AFRICASTALKING).key, "simulator-breaker:africastalking")
+
+
+class TestProviderSimulator(SimulatorTestCase):
+    """
+    Test provider simulator: latency distributions, failure injection and records
+    """
+    simulator_options = {"latency": "fixed:0.01", "recipient_error_rate": 1, "seed": 1}
+
+    def test_parse_latency(self):
+        self.assertEqual(parse_latency("fixed:0.2")(None), 0.2)
+        self.assertTrue(0.1 <= parse_latency("uniform:0.1,0.3")(ProviderSimulator().random) <= 0.3)
+
+        for spec in ("fixed", "uniform:1", "normal:1,2", "lognormal:a,b"):
+            with self.assertRaises(ValueError):
+                parse_latency(spec)
+
+    def test_recipient_errors_and_stats(self):
+        results = send_bulk_message(["+250788000000", "+250788000001"], "Hello")
+
+        self.assertEqual([result["status_code"] for result in results], [500, 500])
+        self.assertTrue(all(result["retry"] for result in results))
+
+        stats = self.simulator.stats()
+        self.assertEqual(stats[AFRICASTALKING]["requests"], 1)
+        self.assertEqual(stats[AFRICASTALKING]["recipients"], 2)
+        self.assertEqual(stats[AFRICASTALKING]["statuses"], {"201": 1})
+        self.assertEqual(stats[AFRICASTALKING]["latency"]["p99"], 0.01)
+        self.assertEqual(stats[SENDGRID]["requests"], 0)
+
+
+class TestCircuitBreakers(SimulatorTestCase):
+    """
+    Test provider circuit breakers and retries:
+    - Failed requests in a row open the breaker, requests then fail without reaching the provider
+    - After the reset timeout a single probe goes through, it closes or opens the breaker again
+    - Retries back off with jitter and wait for the breaker
+    - Recipients still failing after the last retry become dead letters, which can be requeued
+    """
+    breaker_options = {"failure_threshold": 2, "reset_timeout": 0.2}
+
+    def test_breaker_opens(self):
+        self.simulator.error_rate = 1
+
+        for _ in range(2):
+            send_bulk_message(["+250788000000"], "Hello")
+        results = send_bulk_message(["+250788000000"], "Hello")
+
+        self.assertEqual(len(self.simulator.records), 2)
+        self.assertEqual(results[0]["status"], CIRCUIT_OPEN)
+        self.assertTrue(results[0]["retry"])
+
+        stats = self.breakers[AFRICASTALKING].stats()
+        self.assertEqual((stats["state"], stats["opened"], stats["rejected"]), (OPEN, 1, 1))
+        self.assertEqual(self.breakers[SENDGRID].stats()["state"], CLOSED)
+
+        dispatcher = NotificationDispatcher(backend=self.backend, breakers=self.breakers)
+        results = dispatcher.run(dispatcher.send_sms(["+250788000000"], "Hello"))
+        dispatcher.close()
+
+        self.assertEqual(results[0]["status"], CIRCUIT_OPEN)
+        self.assertEqual(len(self.simulator.records), 2)
+
+    def test_half_open_probe(self):
+        breaker = self.breakers[SENDGRID]
+        for _ in range(2):
+            breaker.record(503)
+
+        self.assertGreater(breaker.acquire(), 0)
+        time.sleep(0.25)
+
+        self.assertEqual(breaker.acquire(), 0)
+        self.assertEqual(breaker.stats()["state"], HALF_OPEN)
+        self.assertGreater(breaker.acquire(), 0)
+
+        breaker.record(None)
+        self.assertEqual(breaker.stats()["state"], OPEN)
+        time.sleep(0.25)
+
+        self.assertEqual(breaker.acquire(), 0)
+        breaker.record(202)
+
+        stats = breaker.stats()
+        self.assertEqual((stats["state"], stats["opened"], stats["half_opened"], stats["closed"]), (CLOSED, 2, 2, 1))
+        self.assertEqual(breaker.acquire(), 0)
+
+    @override_settings(NOTIFICATION_RETRY_MAX_DELAY=40)
+    def test_retry_countdown(self):
+        countdowns = [retry_countdown(10, 2, SENDGRID) for _ in range(20)]
+        self.assertTrue(all(20 <= countdown <= 40 for countdown in countdowns))
+        self.assertGreater(len(set(countdowns)), 1)
+
+        with override_settings(NOTIFICATION_BREAKER_RESET_TIMEOUT=60):
+            breaker = CircuitBreaker(SENDGRID, prefix=f"test-breaker-{uuid.uuid4()}", failure_threshold=1)
+            breaker.record(None)
+
+            with mock.patch("notifications.utils.get_breaker", return_value=breaker):
+                self.assertGreater(retry_countdown(0, 0, SENDGRID), 50)
+
+    @override_settings(SMS_RETRY_DELAY=0)
+    def test_dead_letters(self):
+        self.simulator.error_rate = 1
+        self.addCleanup(setattr, send_sms_task, "max_retries", send_sms_task.max_retries)
+        send_sms_task.max_retries = 1
+
+        send_sms_task.apply(kwargs={"phone_numbers": ["+250788000000", "250788"], "message": "Hello"},
+                            routing_key=settings.NOTIFICATION_OTP_QUEUE).get()
+
+        dead_letter = DeadLetter.objects.get()
+        self.assertEqual((dead_letter.task, dead_letter.queue), (send_sms_task.name, settings.NOTIFICATION_OTP_QUEUE))
+        self.assertEqual(dead_letter.kwargs["phone_numbers"], ["+250788000000"])
+        self.assertIn("Simulated error", dead_letter.results[0]["status"])
+
+        self.assertEqual(requeue_dead_letters(), 1)
+        self.assertFalse(DeadLetter.objects.exists())
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.queue, message.kwargs), (settings.NOTIFICATION_OTP_QUEUE, dead_letter.kwargs))
@@ -1,11 +1,44 @@
-# -*- coding: utf-8 -*-
+import random
+from functools import lru_cache
+
 from django.conf import settings
-import africastalking
-from decouple import config
 
+from .breakers import get_breaker
+
+
+@lru_cache(maxsize=None)
+def get_http_session():
+    """
+    HTTP session shared by the provider calls of a worker process, it keeps the connections alive.
+    Created on first use so that every forked worker opens its own connections.
+    :return: requests.Session
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=settings.NOTIFICATION_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_task_queue(task):
+    """
+    :param celery.Task task: Bound task being run
+    :return: str queue the task was delivered from, empty when unknown, e.g. when run eagerly
+    """
+    return (task.request.delivery_info or {}).get("routing_key") or ""
 
-username = config("AFRICASTALKING_USERNAME")
-api_key = config("AFRICASTALKING_APIKEY")
 
-africastalking.initialize(username, api_key)
-sms_backend = africastalking.SMS
+def retry_countdown(delay, retries, provider):
+    """
+    Countdown of a task retry: exponential backoff with jitter, and no shorter than the time the circuit
+    breaker of the provider stays open
+    :param float delay: Countdown of the first retry
+    :param int retries: Retries done so far
+    :param str provider: Provider the task sends to
+    :return: float seconds
+    """
+    backoff = min(delay * 2 ** retries, settings.NOTIFICATION_RETRY_MAX_DELAY)
+    return max(random.uniform(backoff / 2, backoff), get_breaker(provider).retry_after())
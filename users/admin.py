@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import User, Verification
+from .models import User, Verification, UserIdentifier, TypeaheadTerm
 
 admin.site.register(User)
-admin.site.register(Verification)
\ No newline at end of file
+admin.site.register(Verification)
+admin.site.register(UserIdentifier)
+admin.site.register(TypeaheadTerm)
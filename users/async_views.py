@@ -0,0 +1,306 @@
+"""
+Async implementations of the OTP and login endpoints of AuthenticationViewset, served under aio/auth/.
+
+They answer with the same payloads as their DRF counterparts but never block the event loop when
+the project runs under ASGI (see UAMSAPI/gunicorn_asgi.py):
+- Database access goes through sync_to_async, Django 4.0 ships no async ORM. Calls stay thread
+  sensitive so every query of a request runs on the same connection.
+- Passwords are checked by authenticate(), through users.backend.AuthenticationBackend like the DRF views,
+  in the sync thread of the request, next to other requests instead of in front of them.
+- Notifications go to the outbox (notifications.outbox), verification codes through the resend
+  coalescing of users.views.send_verification_code.
+- Requests are throttled by the throttles of users.throttling before any database query.
+"""
+import json
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import JsonResponse, QueryDict
+
+from .models import User, Verification
+from .otp import get_otp_store
+from .throttling import OTPRateThrottle, LoginRateThrottle
+from .serializers import UserMiniSerializer
+from .tokens import issue_auth_tokens
+from .views import request_verification
+from .utils import is_username_email, classify_identifier, normalize_email
+from notifications.tasks.tasks_email import send_email_task
+from notifications.outbox import enqueue_notification
+
+thread_sync_to_async = partial(sync_to_async, thread_sensitive=False)
+
+
+def csrf_exempt(view):
+    # django.views.decorators.csrf.csrf_exempt wraps the view in a sync function on Django 4.0
+    view.csrf_exempt = True
+    return view
+
+
+def get_request_data(request):
+    """
+    Parses JSON or form encoded bodies like DRF parsers do
+    :param HttpRequest request: Request
+    :return: dict or QueryDict
+    """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST if request.method == "POST" else QueryDict()
+
+
+def method_not_allowed(request):
+    return JsonResponse({"detail": f"Method \"{request.method}\" not allowed."}, status=405)
+
+
+def bad_request(detail):
+    return JsonResponse({"detail": detail}, status=400)
+
+
+async def check_throttle(throttle_class, request, data):
+    """
+    :param type throttle_class: users.throttling.TokenBucketThrottle subclass
+    :param HttpRequest request: Request
+    :param dict data: Parsed request body
+    :return: JsonResponse answering a throttled request like DRF does, None when the request is allowed
+    """
+    throttle = throttle_class()
+
+    if await thread_sync_to_async(throttle.allow)(request, data):
+        return None
+
+    wait = throttle.wait()
+    response = JsonResponse({"detail": f"Request was throttled. Expected available in {wait} "
+                                       f"second{'' if wait == 1 else 's'}."}, status=429)
+    response["Retry-After"] = str(wait)
+    return response
+
+
+@sync_to_async
+def get_user(kind, identifier):
+    return User.objects.get_by_identifier(kind, identifier)
+
+
+@sync_to_async
+def send_login_link(user, email):
+    """
+    Creates a login link and adds its notification to the outbox in one transaction
+    """
+    with transaction.atomic():
+        verification = Verification.objects.create_for_user(user)
+
+        link = f"http://localhost:4200/login-with-link/{verification.id}"
+
+        subject = "UAMS Authentication"
+        message = f"<p>Please click this link to login: <a href=\"{link}\">{link}</a></p>"
+
+        enqueue_notification(send_email_task, queue=settings.NOTIFICATION_OTP_QUEUE, emails=[email], subject=subject,
+                             message=message)
+
+
+def serialize_user(user, request):
+    return UserMiniSerializer(user, context={"request": request}).data
+
+
+@csrf_exempt
+async def request_verification_code(request):
+    """
+    Async version of AuthenticationViewset.request_verification_code
+    """
+    if request.method != "POST":
+        return method_not_allowed(request)
+
+    data = get_request_data(request)
+    if data is None:
+        return bad_request("Malformed request body")
+
+    throttled = await check_throttle(OTPRateThrottle, request, data)
+    if throttled:
+        return throttled
+
+    username = data.get("username")
+
+    kind, identifier = classify_identifier(username)
+
+    if kind not in ("PHONE_NUMBER", "EMAIL"):
+        return bad_request("Valid email or phone number is not supplied")
+
+    error, cooldown = await sync_to_async(request_verification)(kind, identifier, username)
+
+    if error:
+        return bad_request(error)
+
+    if cooldown:
+        return JsonResponse({"detail": "Verification code has already been sent to {username}.".format(
+            username=username), "cooldown": cooldown})
+
+    return JsonResponse({"detail": "Verification code has been sent to {username}.".format(username=username),
+                         "cooldown": settings.OTP_RESEND_COOLDOWN})
+
+
+@csrf_exempt
+async def verify_otp(request):
+    """
+    Async version of AuthenticationViewset.verify_otp
+    """
+    if request.method != "POST":
+        return method_not_allowed(request)
+
+    data = get_request_data(request)
+    if data is None:
+        return bad_request("Malformed request body")
+
+    throttled = await check_throttle(LoginRateThrottle, request, data)
+    if throttled:
+        return throttled
+
+    kind, identifier = classify_identifier(data.get("username"))
+
+    if kind not in ("PHONE_NUMBER", "EMAIL"):
+        return bad_request("Valid email or phone number is not supplied")
+
+    user = await get_user(kind, identifier)
+
+    if not user:
+        return bad_request("No account found")
+    if not user.is_active:
+        return bad_request("The account is not active")
+
+    if not await sync_to_async(get_otp_store().verify)(user, data.get("code")):
+        return bad_request("Invalid verification code")
+
+    return JsonResponse({"detail": "OTP verified"})
+
+
+@csrf_exempt
+async def perform__authentication(request):
+    """
+    Async version of AuthenticationViewset.perform__authentication
+    """
+    if request.method != "POST":
+        return method_not_allowed(request)
+
+    data = get_request_data(request)
+    if data is None:
+        return bad_request("Malformed request body")
+
+    throttled = await check_throttle(LoginRateThrottle, request, data)
+    if throttled:
+        return throttled
+
+    password = data.get("password")
+
+    kind, identifier = classify_identifier(data.get("username"))
+
+    if kind not in ("PHONE_NUMBER", "EMAIL"):
+        return bad_request("Valid email or phone number is not supplied")
+
+    user = await get_user(kind, identifier)
+
+    if not user:
+        return bad_request("No account found")
+    if not user.is_active:
+        return bad_request("The account is not active")
+
+    # The backend checks the password of the user resolved above instead of looking it up again
+    user = await sync_to_async(authenticate)(request, username=data.get("username"), password=password, user=user)
+
+    if not user:
+        return bad_request("Invalid credentials")
+
+    if not await sync_to_async(get_otp_store().consume)(user, data.get("code"), used=True):
+        return bad_request("Invalid verification code")
+
+    response = serialize_user(user, request)
+    response.update(await sync_to_async(issue_auth_tokens)(user))
+    return JsonResponse(response)
+
+
+@csrf_exempt
+async def generate_magic_link(request):
+    """
+    Async version of AuthenticationViewset.generate_magic_link
+    """
+    if request.method != "POST":
+        return method_not_allowed(request)
+
+    data = get_request_data(request)
+    if data is None:
+        return bad_request("Malformed request body")
+
+    throttled = await check_throttle(OTPRateThrottle, request, data)
+    if throttled:
+        return throttled
+
+    email = data.get("email")
+
+    if not email or not is_username_email(email):
+        return bad_request("Invalid email address")
+
+    user = await get_user("EMAIL", normalize_email(email))
+
+    if not user:
+        return bad_request("Account with the email is not found")
+
+    if not user.is_active:
+        return bad_request("The account with the email address is not active. Activate your account to continue")
+
+    if not user.is_email_verified:
+        return bad_request(
+            "The email address is not verified. Use other login methods and verify your account first")
+
+    await send_login_link(user, email)
+
+    return JsonResponse({"detail": "Login link has been sent to the email address"})
+
+
+@sync_to_async
+def use_login_link(verification_id):
+    """
+    Marks an active login link as used and returns it with its user, None when the link is invalid
+    """
+    verification = Verification.objects.active().select_related("user").filter(
+        id=verification_id, is_used=False).first()
+
+    if verification and verification.user.is_active:
+        verification.is_valid = False
+        verification.is_used = True
+        verification.save()
+
+    return verification
+
+
+@csrf_exempt
+async def signin_with_magic_link(request):
+    """
+    Async version of AuthenticationViewset.signin_with_magic_link
+    """
+    if request.method != "GET":
+        return method_not_allowed(request)
+
+    throttled = await check_throttle(LoginRateThrottle, request, request.GET)
+    if throttled:
+        return throttled
+
+    try:
+        verification = await use_login_link(request.GET.get("login_id"))
+    except ValidationError:
+        verification = None
+
+    if not verification:
+        return bad_request("The login link is invalid")
+
+    user = verification.user
+
+    if not user.is_active:
+        return bad_request("The account is not active. Please activate your account and try again")
+
+    response = serialize_user(user, request)
+    response.update(await sync_to_async(issue_auth_tokens)(user))
+    return JsonResponse(response)
@@ -0,0 +1,204 @@
+"""
+Token authentication backed by a two tier cache of token -> user (DRF tokens) and user id -> user
+(signed tokens).
+
+The first tier is a small in-process LRU with a short TTL, the second one is the shared
+cache (redis). Entries are dropped from both tiers when a token is deleted or its user is saved,
+other processes drop their in-process entries when the short TTL runs out.
+
+The shared cache holds the column values of the user without the password hash, cached users have their
+password deferred, it is read from the database on first access. A cached user may be up to
+TOKEN_CACHE_LOCAL_TIMEOUT seconds old, views changing it must save the fields they changed only.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, BaseAuthentication, get_authorization_header
+
+from users.models import User
+from users.tokens import read_token, InvalidToken, ACCESS
+
+
+class LocalCache:
+    """
+    Thread safe LRU cache with a TTL on every entry
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_token_cache = LocalCache(settings.TOKEN_CACHE_LOCAL_SIZE, settings.TOKEN_CACHE_LOCAL_TIMEOUT)
+local_user_cache = LocalCache(settings.TOKEN_CACHE_LOCAL_SIZE, settings.TOKEN_CACHE_LOCAL_TIMEOUT)
+
+
+# Columns of the users kept in the shared cache, the password hash stays in the database
+CACHED_USER_FIELDS = [field for field in User._meta.concrete_fields if field.attname != "password"]
+
+
+def get_token_cache_key(key):
+    return f"auth:token:v2:{key}"
+
+
+def get_user_cache_key(user_id):
+    return f"auth:user:v2:{user_id}"
+
+
+def dump_user(user):
+    """
+    :param User user: User loaded without its password
+    :return: dict column -> value as written to the database, of the CACHED_USER_FIELDS
+    """
+    return {field.attname: field.get_prep_value(getattr(user, field.attname)) for field in CACHED_USER_FIELDS}
+
+
+def load_user(values):
+    """
+    :param dict values: Values returned by dump_user
+    :return: User with its password deferred
+    """
+    return User.from_db(router.db_for_read(User), list(values), list(values.values()))
+
+
+def get_cached_user(user_id):
+    """
+    Returns a copy of the user from the cache tiers, the database is only queried on misses
+    :param str user_id: User id
+    :return: User or None
+    """
+    user = local_user_cache.get(user_id)
+
+    if user is None:
+        shared_cache = caches[settings.TOKEN_CACHE_ALIAS]
+        values = shared_cache.get(get_user_cache_key(user_id))
+
+        if values is None:
+            user = User.objects.defer("password").filter(pk=user_id).first()
+            if user is None:
+                return None
+            values = dump_user(user)
+            shared_cache.set(get_user_cache_key(user_id), values, settings.TOKEN_CACHE_TIMEOUT)
+
+        user = load_user(values)
+        local_user_cache.set(user_id, user)
+
+    return copy.copy(user)
+
+
+def invalidate_cached_user(user_id):
+    local_user_cache.delete(str(user_id))
+    caches[settings.TOKEN_CACHE_ALIAS].delete(get_user_cache_key(user_id))
+
+
+def invalidate_cached_tokens(keys):
+    """
+    Drops tokens from both cache tiers
+    :param list[str] keys: Token keys
+    """
+    keys = list(keys)
+    for key in keys:
+        local_token_cache.delete(key)
+    if keys:
+        caches[settings.TOKEN_CACHE_ALIAS].delete_many([get_token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement of TokenAuthentication that only queries the database on cache misses
+    """
+
+    def authenticate_credentials(self, key):
+        user = local_token_cache.get(key)
+
+        if user is None:
+            shared_cache = caches[settings.TOKEN_CACHE_ALIAS]
+            values = shared_cache.get(get_token_cache_key(key))
+
+            if values is None:
+                model = self.get_model()
+                try:
+                    token = model.objects.select_related('user').defer('user__password').get(key=key)
+                except model.DoesNotExist:
+                    raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+                values = dump_user(token.user)
+                shared_cache.set(get_token_cache_key(key), values, settings.TOKEN_CACHE_TIMEOUT)
+
+            user = load_user(values)
+            local_token_cache.set(key, user)
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        # Views may change request.user, every request gets its own copy of the cached user
+        user = copy.copy(user)
+        return user, self.get_model()(key=key, user=user)
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates signed access tokens (see users.tokens) sent as "Authorization: Bearer <token>".
+    The token is validated without storage and the user comes from the user cache.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header.'))
+
+        try:
+            payload = read_token(auth[1].decode(), ACCESS)
+        except (InvalidToken, UnicodeError):
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        user = get_cached_user(payload["uid"])
+
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return user, payload
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -1,65 +1,55 @@
 """
-Backend that allows authentication using phone_number and phone_number
+Backend that allows authentication using phone_number, email or username,
+with either a password or a verification code
 """
 from django.contrib.auth.backends import ModelBackend
 
-from users.models import User, Verification
+from users.models import User
+from users.otp import get_otp_store
+from users.utils import classify_identifier
 
 
-class PasswordlessAuthBackend(ModelBackend):
-    """Log in without providing a password.
-
+class AuthenticationBackend(ModelBackend):
+    """
+    Single backend for every credential shape.
+    The credentials are classified once (verification code or password, and phone number,
+    email or username), the user is resolved with a single query and only the matching check runs.
     """
 
     def authenticate(self, request, username=None, password=None, **kwargs):
-        code = kwargs.get("verification_code")
-        vc = Verification.objects.filter(code=code, is_used=False, is_valid=True, user__username=username).first()
-
-        try:
-            user = User.objects.get(username=username, is_active=True)
-
-            if user and vc:
-                vc.is_used = True
-                vc.is_valid = False
-                vc.save()
-                return user
-            return None
-        except:
-            return None
-
-    def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
-
-
-class Backend(ModelBackend):
-
-    def authenticate(self, request=None, **kwargs):
         """
         Returns a user with the given credentials
         :param request: Request object passed to the backend
-        :param kwargs: Contains credentials to find user
+        :param str username: Phone number, email or username
+        :param str password: Password, checked when no verification code is given
+        :param kwargs: May contain verification_code to log in without a password, and user when the caller
+            already resolved the user of username, which saves the lookup
         :return: User if credentials are found
         """
-        username = kwargs.get('username')  # Contains phone_number or email
-        password = kwargs.get('password')
+        code = kwargs.get("verification_code")
+        user = kwargs.get("user")
 
-        # Trying phone_number
-        user = User.objects.filter(phone_number=username).first()
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
 
-        # Trying email
-        if not user:
-            user = User.objects.filter(email=username).first()
+        if (not username and user is None) or (not code and password is None):
+            return None
 
-        # Trying username
-        if not user:
-            user = User.objects.filter(username=username).first()
+        if user is None:
+            user = User.objects.get_by_identifier(*classify_identifier(username))
 
-        if user:
-            if user.check_password(password) and user.is_active:
+        if code:
+            if user and user.is_active and get_otp_store().consume(user, code):
                 return user
+            return None
+
+        if not user:
+            # Run the password hasher once to reduce the timing difference with existing users
+            User().set_password(password)
+            return None
+
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
 
         return None
 
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from users.models import User, TypeaheadTerm, TYPEAHEAD_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Creates the missing TypeaheadTerm rows of existing users, in chunks ordered by user id"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of users processed per chunk")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        queryset = User.objects.only("id", *TYPEAHEAD_FIELDS).order_by("id")
+        last_id = None
+        processed = 0
+
+        while True:
+            chunk = queryset.filter(id__gt=last_id) if last_id else queryset
+            users = list(chunk[:batch_size])
+
+            if not users:
+                break
+
+            TypeaheadTerm.objects.bulk_create(
+                [TypeaheadTerm(user=user, term=term) for user in users for term in user.get_typeahead_terms()],
+                ignore_conflicts=True
+            )
+
+            last_id = users[-1].id
+            processed += len(users)
+            self.stdout.write(f"Processed {processed} users")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled typeahead terms of {processed} users"))
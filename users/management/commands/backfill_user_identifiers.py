@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from users.models import User, UserIdentifier
+from users.utils import get_identifiers
+
+
+class Command(BaseCommand):
+    help = "Creates the missing UserIdentifier rows of existing users, in the order they joined so that an " \
+           "identifier shared by several accounts goes to the account that joined first"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of users processed per chunk")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        users = User.objects.order_by("date_joined", "id").values_list("id", "phone_number", "email", "username")
+        rows = []
+        processed = 0
+
+        for user_id, phone_number, email, username in users.iterator(chunk_size=batch_size):
+            rows.extend(UserIdentifier(user_id=user_id, kind=kind, value=value) for kind, value in
+                        get_identifiers(phone_number, email, username).items())
+            processed += 1
+
+            if processed % batch_size == 0:
+                UserIdentifier.objects.bulk_create(rows, ignore_conflicts=True)
+                rows = []
+                self.stdout.write(f"Processed {processed} users")
+
+        UserIdentifier.objects.bulk_create(rows, ignore_conflicts=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled identifiers of {processed} users"))
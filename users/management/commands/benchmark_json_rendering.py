@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from UAMSAPI.middleware import BROTLI, GZIP, compress, get_available_encodings
+from UAMSAPI.renderers import ORJSONRenderer
+from users.models import User
+from users.serializers import UserMiniValuesSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Measures rendering time of a /users page with DRF's JSONRenderer and ORJSONRenderer, and its size " \
+           "on the wire uncompressed, gzipped and brotli compressed. Rows created by the benchmark are rolled back"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Number of users in the page")
+        parser.add_argument("--rounds", type=int, default=5, help="Runs of each renderer, the fastest one counts")
+
+    def handle(self, *args, **options):
+        count = options["users"]
+
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(
+                    [User(phone_number=f"+99{i:010d}", password="!", first_name=f"First{i}", last_name=f"Last{i}",
+                          email=f"user{i}@example.com", nationality="RW") for i in range(count)],
+                    batch_size=1000
+                )
+                rows = User.objects.filter(phone_number__startswith="+99").values(*UserMiniValuesSerializer.columns)
+                data = {
+                    "next": None,
+                    "previous": None,
+                    "results": UserMiniValuesSerializer(rows, {"request": APIRequestFactory().get("/users")}).data,
+                }
+
+                for renderer in (JSONRenderer(), ORJSONRenderer()):
+                    elapsed = min(self.timed(renderer, data) for _ in range(options["rounds"]))
+                    self.stdout.write(f"{renderer.__class__.__name__}: {elapsed * 1000:.1f}ms "
+                                      f"({count / elapsed:.0f} users/s)")
+
+                content = ORJSONRenderer().render(data)
+                sizes = [f"{len(content)} bytes uncompressed"]
+                for encoding in (GZIP, BROTLI):
+                    if encoding not in get_available_encodings():
+                        sizes.append(f"{encoding} unavailable")
+                        continue
+                    start = time.perf_counter()
+                    compressed = compress(content, encoding)
+                    sizes.append(f"{len(compressed)} bytes {encoding} "
+                                 f"({(time.perf_counter() - start) * 1000:.1f}ms)")
+                self.stdout.write(", ".join(sizes))
+
+                raise Rollback
+        except Rollback:
+            pass
+
+    @staticmethod
+    def timed(renderer, data):
+        start = time.perf_counter()
+        renderer.render(data, "application/json")
+        return time.perf_counter() - start
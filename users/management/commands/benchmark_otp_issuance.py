@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.models import User
+from users.otp import get_otp_store
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Measures OTP issuance throughput of the configured OTP store. " \
+           "Every issued code stays outstanding, so the last codes are issued against the full set. " \
+           "Rows created by the benchmark are rolled back, redis codes expire after OTP_LIFETIME"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000, help="Number of users receiving a code")
+
+    def handle(self, *args, **options):
+        count = options["users"]
+        store = get_otp_store()
+
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(
+                    [User(phone_number=f"+99{i:010d}", password="!") for i in range(count)], batch_size=1000
+                )
+                users = list(User.objects.filter(phone_number__startswith="+99").only("id")[:count])
+
+                start = time.perf_counter()
+                codes = [store.issue(user, channel="PHONE_NUMBER").code for user in users]
+                elapsed = time.perf_counter() - start
+
+                self.stdout.write(
+                    f"{store.__class__.__name__}: issued {len(codes)} codes in {elapsed:.2f}s "
+                    f"({len(codes) / elapsed:.0f} codes/s), {len(codes) - len(set(codes))} shared between users"
+                )
+
+                raise Rollback
+        except Rollback:
+            pass
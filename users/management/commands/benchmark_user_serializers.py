@@ -0,0 +1,65 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from users.models import User
+from users.serializers import UserMiniSerializer, UserMiniValuesSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Measures how fast a page of users is read and serialized by UserMiniSerializer from model instances " \
+           "and by UserMiniValuesSerializer from values() rows. Rows created by the benchmark are rolled back"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000, help="Number of users in the page")
+        parser.add_argument("--rounds", type=int, default=3, help="Runs of each serializer, the fastest one counts")
+
+    def handle(self, *args, **options):
+        count = options["users"]
+        context = {"request": APIRequestFactory().get("/users")}
+        countries = ["RW", "KE", "UG", "TZ", None]
+
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(
+                    [User(phone_number=f"+99{i:010d}", password="!", first_name=f"First{i}", last_name=f"Last{i}",
+                          email=f"user{i}@example.com", nationality=countries[i % len(countries)],
+                          birthdate=date(1960, 1, 1) + timedelta(days=i % 15000) if i % 3 else None,
+                          profile_photo=f"profile-photos/{i}.png" if i % 2 else None)
+                     for i in range(count)],
+                    batch_size=1000
+                )
+                queryset = User.objects.filter(phone_number__startswith="+99").order_by("-date_joined", "-id")
+
+                paths = {
+                    "UserMiniSerializer": lambda: UserMiniSerializer(
+                        queryset[:count], many=True, context=context).data,
+                    "UserMiniValuesSerializer": lambda: UserMiniValuesSerializer(
+                        queryset.values(*UserMiniValuesSerializer.columns)[:count], context).data,
+                }
+
+                timings = {}
+                for name, serialize in paths.items():
+                    timings[name] = min(self.timed(serialize) for _ in range(options["rounds"]))
+                    self.stdout.write(f"{name}: {count} users in {timings[name]:.3f}s "
+                                      f"({count / timings[name]:.0f} users/s)")
+
+                speedup = timings["UserMiniSerializer"] / timings["UserMiniValuesSerializer"]
+                self.stdout.write(f"values() path is {speedup:.1f}x faster")
+
+                raise Rollback
+        except Rollback:
+            pass
+
+    @staticmethod
+    def timed(serialize):
+        start = time.perf_counter()
+        serialize()
+        return time.perf_counter() - start
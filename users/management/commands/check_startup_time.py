@@ -0,0 +1,76 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Loads the application and its url configuration like a web worker does before its first response
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from {module} import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(time.perf_counter() - start)
+"""
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def parse_import_times(output):
+    """
+    :param str output: Standard error of python -X importtime
+    :return: list[tuple] module, depth, self and cumulative import time in seconds, in import order
+    """
+    times = []
+
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            times.append((module, len(indent) // 2, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+
+    return times
+
+
+class Command(BaseCommand):
+    help = "Measures the cold start of a web worker in a new interpreter, reports the slowest imports like " \
+           "python -X importtime and fails when the start takes longer than STARTUP_TIME_BUDGET"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--budget", type=float, default=settings.STARTUP_TIME_BUDGET,
+                            help="Seconds the start may take")
+        parser.add_argument("--application", choices=["wsgi", "asgi"], default="wsgi",
+                            help="Application module loaded, UAMSAPI.wsgi or UAMSAPI.asgi")
+        parser.add_argument("--top", type=int, default=20, help="Number of modules reported")
+        parser.add_argument("--depth", type=int, default=None,
+                            help="Only report modules imported at most this deep, 0 for top level imports")
+
+    def handle(self, *args, **options):
+        script = STARTUP_SCRIPT.format(module=f"UAMSAPI.{options['application']}")
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "UAMSAPI.settings"))
+
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", script], capture_output=True, text=True,
+                                 env=env, cwd=settings.BASE_DIR.parent)
+
+        times = parse_import_times(process.stderr)
+
+        if process.returncode != 0:
+            errors = [line for line in process.stderr.splitlines() if not IMPORT_TIME_LINE.match(line)]
+            raise CommandError("The application could not be loaded:\n" + "\n".join(errors[-20:]))
+
+        elapsed = float(process.stdout.strip().splitlines()[-1])
+
+        if options["depth"] is not None:
+            times = [entry for entry in times if entry[1] <= options["depth"]]
+
+        self.stdout.write(f"{'cumulative':>12} {'self':>10}  module")
+        for module, depth, self_time, cumulative in sorted(times, key=lambda entry: -entry[3])[:options["top"]]:
+            self.stdout.write(f"{cumulative * 1000:10.1f}ms {self_time * 1000:8.1f}ms  {module}")
+
+        self.stdout.write(f"Started in {elapsed:.3f}s, {len(times)} modules, budget {options['budget']:.3f}s")
+
+        if elapsed > options["budget"]:
+            raise CommandError(f"Startup took {elapsed:.3f}s, over the budget of {options['budget']:.3f}s")
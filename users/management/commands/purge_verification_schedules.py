@@ -0,0 +1,17 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from users.utils import purge_verification_schedules
+
+
+class Command(BaseCommand):
+    help = "Deletes the one-off auto_invalidate_verification_* beat entries left by the old expiry scheduling"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of entries deleted per statement")
+
+    def handle(self, *args, **options):
+        deleted = purge_verification_schedules(apps, options["batch_size"],
+                                               progress=lambda count: self.stdout.write(f"Deleted {count} entries"))
+
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} verification expiry entries"))
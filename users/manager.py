@@ -35,6 +35,17 @@ class UserManager(UManager):
         extra_fields.setdefault('is_superuser', False)
         return self._create_user(phone_number, email, password, **extra_fields)
 
+    def get_by_identifier(self, kind, value):
+        """
+        Returns the user owning a normalized login identifier, see users.utils.classify_identifier
+        :param str kind: PHONE_NUMBER, EMAIL or USERNAME
+        :param str value: Normalized identifier
+        :return: User or None
+        """
+        if not kind or not value:
+            return None
+        return self.filter(identifiers__kind=kind, identifiers__value=value).first()
+
     def create_superuser(self, phone_number, password, email=None, **extra_fields):
         extra_fields.setdefault('is_staff', True)
         extra_fields.setdefault('is_superuser', True)
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+import users.utils
+
+
+def purge_verification_schedules(apps, schema_editor):
+    """
+    Verification expiry is checked on read now, the one-off beat entries are no longer needed.
+    Large backlogs can be purged beforehand with the purge_verification_schedules command.
+    """
+    users.utils.purge_verification_schedules(apps)
+
+
+class Migration(migrations.Migration):
+    # Every batch of the purge commits on its own
+    atomic = False
+
+    dependencies = [
+        ('users', '0003_verification_channel'),
+        ('django_celery_beat', '0016_alter_crontabschedule_timezone'),
+    ]
+
+    operations = [
+        migrations.RunPython(purge_verification_schedules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.7 on 2026-10-16 20:48
+
+from django.db import migrations, models
+import django.db.models.functions.text
+import users.operations
+
+
+class Migration(migrations.Migration):
+    # The indexes are built without blocking writes to users_user and users_verification
+    atomic = False
+
+    dependencies = [
+        ('users', '0004_purge_verification_schedules'),
+    ]
+
+    operations = [
+        users.operations.AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='user_email_upper_idx'),
+        ),
+        users.operations.AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(fields=['username'], name='user_username_idx'),
+        ),
+        users.operations.AddIndexConcurrently(
+            model_name='verification',
+            index=models.Index(fields=['created_at'], name='verification_created_at_idx'),
+        ),
+    ]
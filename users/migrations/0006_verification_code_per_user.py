@@ -0,0 +1,26 @@
+# Generated by Django 4.0.7 on 2026-10-16 20:49
+
+from django.db import migrations, models
+import users.operations
+import users.utils
+
+
+class Migration(migrations.Migration):
+    # The unique index is built without blocking writes to users_verification
+    atomic = False
+
+    dependencies = [
+        ('users', '0005_indexes'),
+    ]
+
+    operations = [
+        users.operations.AddConstraintConcurrently(
+            model_name='verification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_valid', True)), fields=('user', 'code'), name='verification_active_code_unique'),
+        ),
+        migrations.AlterField(
+            model_name='verification',
+            name='code',
+            field=models.CharField(default=users.utils.generate_digits_code, max_length=6),
+        ),
+    ]
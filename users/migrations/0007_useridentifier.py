@@ -0,0 +1,28 @@
+# Generated by Django 4.0.7 on 2026-10-16 20:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_verification_code_per_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserIdentifier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('PHONE_NUMBER', 'PHONE_NUMBER'), ('EMAIL', 'EMAIL'), ('USERNAME', 'USERNAME')], max_length=30)),
+                ('value', models.CharField(max_length=254)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='identifiers', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='useridentifier',
+            constraint=models.UniqueConstraint(fields=('kind', 'value'), name='user_identifier_unique'),
+        ),
+    ]
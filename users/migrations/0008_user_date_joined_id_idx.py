@@ -0,0 +1,20 @@
+# Generated by Django 4.0.7 on 2026-10-16 22:55
+
+from django.db import migrations, models
+import users.operations
+
+
+class Migration(migrations.Migration):
+    # The index is built without blocking writes to users_user
+    atomic = False
+
+    dependencies = [
+        ('users', '0007_useridentifier'),
+    ]
+
+    operations = [
+        users.operations.AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(fields=['date_joined', 'id'], name='user_date_joined_id_idx'),
+        ),
+    ]
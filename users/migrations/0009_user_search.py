@@ -0,0 +1,70 @@
+from django.db import migrations
+
+# Text searched by users.search.UserSearchFilter, its expressions there must stay identical to these for the
+# indexes to serve the searches
+POSTGRES_DOCUMENT = "lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || " \
+                    "coalesce(username, '') || ' ' || coalesce(email, '') || ' ' || coalesce(phone_number, ''))"
+
+# Expression indexes built concurrently, users_user is neither rewritten nor locked against writes
+POSTGRES_FORWARDS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS user_search_vector_idx ON users_user USING gin "
+    f"((to_tsvector('simple'::regconfig, translate({POSTGRES_DOCUMENT}, '+', ' '))))",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS user_search_document_trgm_idx ON users_user USING gin "
+    f"(({POSTGRES_DOCUMENT}) gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP INDEX CONCURRENTLY IF EXISTS user_search_document_trgm_idx",
+    "DROP INDEX CONCURRENTLY IF EXISTS user_search_vector_idx",
+]
+
+SQLITE_DOCUMENT = "coalesce({row}.first_name, '') || ' ' || coalesce({row}.last_name, '') || ' ' || " \
+                  "coalesce({row}.username, '') || ' ' || coalesce({row}.email, '') || ' ' || " \
+                  "coalesce({row}.phone_number, '')"
+
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE users_user_fts USING fts5(id UNINDEXED, document)",
+    f"INSERT INTO users_user_fts (id, document) SELECT id, {SQLITE_DOCUMENT.format(row='users_user')} FROM users_user",
+    "CREATE TRIGGER users_user_fts_insert AFTER INSERT ON users_user BEGIN "
+    f"INSERT INTO users_user_fts (id, document) VALUES (new.id, {SQLITE_DOCUMENT.format(row='new')}); END",
+    "CREATE TRIGGER users_user_fts_update AFTER UPDATE OF first_name, last_name, username, email, phone_number "
+    "ON users_user BEGIN DELETE FROM users_user_fts WHERE id = old.id; "
+    f"INSERT INTO users_user_fts (id, document) VALUES (new.id, {SQLITE_DOCUMENT.format(row='new')}); END",
+    "CREATE TRIGGER users_user_fts_delete AFTER DELETE ON users_user BEGIN "
+    "DELETE FROM users_user_fts WHERE id = old.id; END",
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER users_user_fts_delete",
+    "DROP TRIGGER users_user_fts_update",
+    "DROP TRIGGER users_user_fts_insert",
+    "DROP TABLE users_user_fts",
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement, params=None)
+    return run
+
+
+class Migration(migrations.Migration):
+    """
+    Postgres: a pg_trgm GIN index on the search text and a full text GIN index on its words, both expression
+    indexes. SQLite: an FTS5 table maintained by triggers. Other databases search with icontains.
+    SQLite drops the triggers when a migration rebuilds users_user, such a migration has to create them again.
+    """
+    atomic = False
+
+    dependencies = [
+        ('users', '0008_user_date_joined_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_statements({"postgresql": POSTGRES_FORWARDS, "sqlite": SQLITE_FORWARDS}),
+            run_statements({"postgresql": POSTGRES_BACKWARDS, "sqlite": SQLITE_BACKWARDS}),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.0.7 on 2026-10-16 23:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Term index of users.typeahead.get_terms. On postgres the terms are indexed in the C collation, the index then
+# serves both the prefix range and the ordering on term, whatever the database collation. SQLite drops the index
+# when a migration rebuilds users_typeaheadterm, such a migration has to create it again
+INDEX_FORWARDS = {
+    "postgresql": 'CREATE INDEX typeahead_term_idx ON users_typeaheadterm ((term COLLATE "C"))',
+    None: "CREATE INDEX typeahead_term_idx ON users_typeaheadterm (term)",
+}
+
+INDEX_BACKWARDS = "DROP INDEX IF EXISTS typeahead_term_idx"
+
+
+def create_term_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    schema_editor.execute(INDEX_FORWARDS.get(vendor, INDEX_FORWARDS[None]), params=None)
+
+
+def drop_term_index(apps, schema_editor):
+    schema_editor.execute(INDEX_BACKWARDS, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_user_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TypeaheadTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=254)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='typeahead_terms', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='typeaheadterm',
+            constraint=models.UniqueConstraint(fields=('user', 'term'), name='typeahead_term_unique'),
+        ),
+        migrations.RunPython(create_term_index, drop_term_index),
+    ]
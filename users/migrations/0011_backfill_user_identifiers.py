@@ -0,0 +1,40 @@
+from django.db import migrations
+
+from users.utils import get_identifiers
+
+BATCH_SIZE = 1000
+
+
+def backfill_user_identifiers(apps, schema_editor):
+    """
+    Logins resolve users through UserIdentifier, existing users get their identifiers here.
+    Users are read in the order they joined, so that an email or username shared by several accounts goes to
+    the account that joined first. Every batch commits on its own.
+    """
+    User = apps.get_model("users", "User")
+    UserIdentifier = apps.get_model("users", "UserIdentifier")
+
+    users = User.objects.order_by("date_joined", "id").values_list("id", "phone_number", "email", "username")
+    rows = []
+
+    for user_id, phone_number, email, username in users.iterator(chunk_size=BATCH_SIZE):
+        rows.extend(UserIdentifier(user_id=user_id, kind=kind, value=value) for kind, value in
+                    get_identifiers(phone_number, email, username).items())
+
+        if len(rows) >= BATCH_SIZE:
+            UserIdentifier.objects.bulk_create(rows, ignore_conflicts=True)
+            rows = []
+
+    UserIdentifier.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('users', '0010_typeahead_term'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_user_identifiers, migrations.RunPython.noop),
+    ]
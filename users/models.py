@@ -1,14 +1,23 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser, Group
 import uuid
 
-from django.db.models.signals import post_save, pre_save
+from django.db.models.functions import Upper
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from django_countries.fields import CountryField
 from phonenumber_field.modelfields import PhoneNumberField
+from rest_framework.authtoken.models import Token
 
 from users.manager import UserManager
-from .utils import generate_code, generate_digits_code
+from .utils import generate_code, generate_digits_code, allocate_digits_code, get_identifiers, get_typeahead_terms
+
+logger = logging.getLogger(__name__)
 
 
 class User(AbstractUser):
@@ -49,14 +58,276 @@ class User(AbstractUser):
 
     class Meta(AbstractUser.Meta):
         swappable = 'AUTH_USER_MODEL'
+        indexes = [
+            # Email lookups are case insensitive (email__iexact compares UPPER(email))
+            models.Index(Upper('email'), name='user_email_upper_idx'),
+            models.Index(fields=['username'], name='user_username_idx'),
+            # Keyset pagination of the users list, see users.pagination
+            models.Index(fields=['date_joined', 'id'], name='user_date_joined_id_idx'),
+        ]
 
     def __str__(self):
         return str(self.phone_number)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(User, cls).from_db(db, field_names, values)
+        # Raw column values the identifiers and typeahead terms derive from, they are only normalized on save when
+        # one of them changed
+        instance._loaded_values = {name: value for name, value in zip(field_names, values) if name in SNAPSHOT_FIELDS}
+        return instance
+
+    def save(self, *args, **kwargs):
+        super(User, self).save(*args, **kwargs)
+
+        update_fields = kwargs.get("update_fields")
+        names = SNAPSHOT_FIELDS if update_fields is None else SNAPSHOT_FIELDS.intersection(update_fields)
+        self._loaded_values = {
+            **getattr(self, "_loaded_values", {}),
+            **{name: self.get_column_value(name) for name in names - self.get_deferred_fields()}
+        }
+
+    def get_column_value(self, name):
+        """
+        :param str name: Field name
+        :return: Value of the field as written to the database
+        """
+        return self._meta.get_field(name).get_prep_value(getattr(self, name))
+
+    def get_changed_fields(self, names, update_fields=None):
+        """
+        :param set[str] names: Names of fields among SNAPSHOT_FIELDS
+        :param update_fields: update_fields of the save, None when every field was saved
+        :return: set[str] fields among names saved with another value than the one loaded, all of them when the
+            user was not loaded from the database
+        """
+        if update_fields is not None:
+            names = names.intersection(update_fields)
+
+        loaded = getattr(self, "_loaded_values", None)
+        if loaded is None:
+            return set(names)
+
+        deferred = self.get_deferred_fields()
+        return {name for name in names if name not in deferred and
+                (name not in loaded or self.get_column_value(name) != loaded[name])}
+
+    def get_identifiers(self, kinds=None):
+        """
+        Normalized login identifiers of the user, as stored in UserIdentifier
+        :param set[str] kinds: Kinds of the identifiers returned, defaults to all
+        :return: dict kind -> value
+        """
+        fields = [name for name, kind in IDENTIFIER_FIELDS.items() if kinds is None or kind in kinds]
+        return get_identifiers(**{name: getattr(self, name) for name in fields})
+
+    def get_typeahead_terms(self):
+        """
+        Terms of the user in TypeaheadTerm
+        :return: set[str]
+        """
+        return get_typeahead_terms(self.first_name, self.last_name, self.username, self.email, self.phone_number)
+
+
+# Field -> kind of the identifier it holds
+IDENTIFIER_FIELDS = {"phone_number": "PHONE_NUMBER", "email": "EMAIL", "username": "USERNAME"}
+TYPEAHEAD_FIELDS = {"first_name", "last_name", "username", "email", "phone_number"}
+SNAPSHOT_FIELDS = TYPEAHEAD_FIELDS | set(IDENTIFIER_FIELDS)
+
+
+class UserIdentifier(models.Model):
+    """
+    Normalized login identifiers (E.164 phone number, lowercased email and username) of users.
+    Resolving a user from an identifier is a single probe of the (kind, value) unique index.
+    Emails and usernames are not unique on User, one shared by several accounts belongs to the account that
+    joined first, and passes to the next one when that account changes it or is deleted.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="identifiers")
+    kinds = [
+        ("PHONE_NUMBER", "PHONE_NUMBER"),
+        ("EMAIL", "EMAIL"),
+        ("USERNAME", "USERNAME"),
+    ]
+    kind = models.CharField(max_length=30, choices=kinds)
+    value = models.CharField(max_length=254)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'value'], name='user_identifier_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} - {self.value}"
+
+
+def claim_identifier(user, kind, value):
+    """
+    Gives an identifier to the user, unless an account that joined before the user holds it
+    :param User user: User whose phone number, email or username is the identifier
+    :param str kind: PHONE_NUMBER, EMAIL or USERNAME
+    :param str value: Normalized identifier
+    """
+    owner = UserIdentifier.objects.filter(kind=kind, value=value).values_list(
+        "id", "user_id", "user__date_joined").first()
+
+    if owner is None:
+        UserIdentifier.objects.bulk_create([UserIdentifier(user=user, kind=kind, value=value)], ignore_conflicts=True)
+        return
+
+    identifier_id, owner_id, owner_date_joined = owner
+    if owner_id == user.pk:
+        return
+
+    if (user.date_joined, str(user.pk)) < (owner_date_joined, str(owner_id)):
+        UserIdentifier.objects.filter(id=identifier_id).update(user=user)
+        logger.warning("%s %s passed from user %s to user %s, who joined first", kind, value, owner_id, user.pk)
+    else:
+        logger.warning("%s %s of user %s stays with user %s, who joined first", kind, value, user.pk, owner_id)
+
+
+def reassign_identifier(kind, value, exclude=None):
+    """
+    Gives a released identifier to the account that joined first among those still holding it
+    :param str kind: PHONE_NUMBER, EMAIL or USERNAME
+    :param str value: Normalized identifier
+    :param exclude: Primary key of the user that released it
+    :return: User now owning the identifier, None when no account holds it
+    """
+    users = User.objects.filter(**{IDENTIFIER_LOOKUPS[kind]: value})
+    if exclude is not None:
+        users = users.exclude(pk=exclude)
+    user = users.order_by("date_joined", "id").first()
+
+    if user is not None:
+        UserIdentifier.objects.bulk_create([UserIdentifier(user=user, kind=kind, value=value)], ignore_conflicts=True)
+    return user
+
+
+# Kind -> lookup of the users whose column holds a normalized identifier
+IDENTIFIER_LOOKUPS = {"PHONE_NUMBER": "phone_number", "EMAIL": "email__iexact", "USERNAME": "username"}
+
+
+@receiver(post_save, sender=User)
+def post_save_user_identifiers(sender, instance=None, created=False, update_fields=None, **kwargs):
+    """
+    Keeps UserIdentifier in sync with the user, identifiers are only normalized and written when the phone number,
+    email or username changed
+    """
+    changed = set(IDENTIFIER_FIELDS) if created else instance.get_changed_fields(set(IDENTIFIER_FIELDS), update_fields)
+    if not changed:
+        return
+
+    kinds = {IDENTIFIER_FIELDS[name] for name in changed}
+    identifiers = instance.get_identifiers(kinds)
+
+    released = []
+    if not created:
+        released = [(kind, value) for kind, value in UserIdentifier.objects.filter(
+            user=instance, kind__in=kinds).values_list("kind", "value") if identifiers.get(kind) != value]
+        if released:
+            UserIdentifier.objects.filter(user=instance, kind__in=[kind for kind, _ in released]).delete()
+
+    for kind, value in identifiers.items():
+        claim_identifier(instance, kind, value)
+
+    for kind, value in released:
+        reassign_identifier(kind, value, exclude=instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def post_delete_user_identifiers(sender, instance=None, **kwargs):
+    """
+    Identifiers of a deleted user pass to the other accounts holding them
+    """
+    kinds = {kind for name, kind in IDENTIFIER_FIELDS.items() if name not in instance.get_deferred_fields()}
+    for kind, value in instance.get_identifiers(kinds).items():
+        reassign_identifier(kind, value, exclude=instance.pk)
+
+
+class TypeaheadTerm(models.Model):
+    """
+    Normalized names, username, email and phone numbers of users, see users.utils.get_typeahead_terms.
+    A typeahead lookup is one ordered range scan of the terms starting with the typed prefix.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="typeahead_terms")
+    term = models.CharField(max_length=254)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'term'], name='typeahead_term_unique'),
+        ]
+        # typeahead_term_idx is created by migration 0010_typeahead_term, on postgres it indexes the terms in
+        # the C collation, which no portable index definition can express
+
+    def __str__(self):
+        return self.term
+
+
+@receiver(post_save, sender=User)
+def post_save_user_typeahead_terms(sender, instance=None, created=False, update_fields=None, **kwargs):
+    """
+    Keeps TypeaheadTerm in sync with the user, terms are only computed and written when a field they derive from
+    changed
+    """
+    if not created and not instance.get_changed_fields(TYPEAHEAD_FIELDS, update_fields):
+        return
+
+    terms = instance.get_typeahead_terms()
+
+    if not created:
+        TypeaheadTerm.objects.filter(user=instance).exclude(term__in=terms).delete()
+
+    TypeaheadTerm.objects.bulk_create([TypeaheadTerm(user=instance, term=term) for term in terms], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=User)
+def post_save_user_tokens(sender, instance=None, created=False, **kwargs):
+    """
+    Cached tokens and users hold a copy of the user, they are dropped whenever the user changes (is_active included)
+    """
+    from users.authentication import invalidate_cached_tokens, invalidate_cached_user
+    if not created:
+        invalidate_cached_tokens(Token.objects.filter(user=instance).values_list("key", flat=True))
+        invalidate_cached_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def post_delete_token(sender, instance=None, **kwargs):
+    from users.authentication import invalidate_cached_tokens
+    invalidate_cached_tokens([instance.key])
+
+
+def get_verification_expiry_cutoff():
+    """
+    Verifications created before the returned time are expired
+    :return: datetime
+    """
+    return timezone.now() - timedelta(seconds=settings.OTP_LIFETIME)
+
+
+class VerificationQuerySet(models.QuerySet):
+
+    def active(self):
+        """
+        Valid verifications that are still within OTP_LIFETIME
+        """
+        return self.filter(is_valid=True, created_at__gte=get_verification_expiry_cutoff())
+
+    def expired(self):
+        return self.filter(created_at__lt=get_verification_expiry_cutoff())
+
+    def create_for_user(self, user, **kwargs):
+        """
+        Creates a verification with a code that none of the valid verifications of the user holds.
+        Codes are only unique per user, so allocation does not depend on the size of the table.
+        """
+        taken = self.filter(user=user, is_valid=True).values_list("code", flat=True)
+        return self.create(user=user, code=allocate_digits_code(taken), **kwargs)
+
 
 class Verification(models.Model):
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
-    code = models.CharField(max_length=6, default=generate_digits_code, unique=True)
+    code = models.CharField(max_length=6, default=generate_digits_code)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     is_valid = models.BooleanField(default=True)
     is_used = models.BooleanField(default=False)
@@ -68,12 +339,22 @@ class Verification(models.Model):
     channel = models.CharField(max_length=30, default="ALL", choices=channels)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = VerificationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Codes are unique among the valid verifications of a user, the index also serves the OTP lookups
+            models.UniqueConstraint(fields=['user', 'code'], condition=models.Q(is_valid=True),
+                                    name='verification_active_code_unique'),
+        ]
+        indexes = [
+            # Range scanned by purge_expired_verifications
+            models.Index(fields=['created_at'], name='verification_created_at_idx'),
+        ]
+
     def __str__(self):
         return f"{self.code} - {self.user.phone_number}"
 
-
-@receiver(post_save, sender=Verification)
-def post_save_verification(sender, instance=None, created=False, **kwargs):
-    from users.tasks.tasks_verification import schedule_expiration
-    if created and instance:
-        schedule_expiration.delay(str(instance.id))
+    @property
+    def is_expired(self):
+        return self.created_at < get_verification_expiry_cutoff()
@@ -0,0 +1,54 @@
+"""
+Migration operations that do not block writes to large tables on postgres
+"""
+from django.contrib.postgres.operations import AddIndexConcurrently as PostgresAddIndexConcurrently
+from django.db.migrations import AddConstraint, AddIndex
+
+
+class AddIndexConcurrently(PostgresAddIndexConcurrently):
+    """
+    CREATE INDEX CONCURRENTLY on postgres, a plain AddIndex on other databases (sqlite in development and tests).
+    The migration must set atomic = False.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super(AddIndexConcurrently, self).database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super(AddIndexConcurrently, self).database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class AddConstraintConcurrently(AddConstraint):
+    """
+    Unique constraints with a condition are unique indexes on postgres, they are built with CREATE UNIQUE INDEX
+    CONCURRENTLY there. Other constraints and other databases get a plain AddConstraint.
+    The migration must set atomic = False. A concurrent build that fails, e.g. on duplicates, leaves an invalid
+    index that has to be dropped before the migration is run again.
+    """
+
+    def is_concurrent(self, schema_editor):
+        return schema_editor.connection.vendor == "postgresql" and getattr(self.constraint, "condition", None) is not None
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.is_concurrent(schema_editor) or not self.allow_migrate_model(schema_editor.connection.alias,
+                                                                                 model):
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+        statement = self.constraint.create_sql(model, schema_editor)
+        statement.template = statement.template.replace("CREATE UNIQUE INDEX", "CREATE UNIQUE INDEX CONCURRENTLY", 1)
+        schema_editor.execute(statement)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.is_concurrent(schema_editor) or not self.allow_migrate_model(schema_editor.connection.alias,
+                                                                                 model):
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {schema_editor.quote_name(self.constraint.name)}")
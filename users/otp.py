@@ -0,0 +1,214 @@
+"""
+One time password stores.
+
+A store keeps the verification codes handed out by the authentication endpoints
+together with their state (valid, used and channel). The store in use is picked
+with the OTP_STORE setting:
+
+- users.otp.DatabaseOTPStore keeps codes in the Verification table
+- users.otp.RedisOTPStore keeps codes in redis and relies on key TTLs for expiry
+
+Sends of a code are coalesced: a code is sent at most once per channel every OTP_RESEND_COOLDOWN
+seconds, see claim_otp_send.
+"""
+import math
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .models import Verification, get_verification_expiry_cutoff
+from .utils import generate_digits_code, allocate_digits_code
+
+OTP = namedtuple("OTP", ["code", "channel"])
+
+
+class BaseOTPStore:
+    """
+    Interface shared by all OTP stores.
+    A user has at most one active (valid and unused) code at a time.
+    """
+
+    def issue(self, user, channel="ALL"):
+        """
+        Returns the active code of the user, a new one is created when there is none
+        :param User user: Owner of the code
+        :param str channel: PHONE_NUMBER, EMAIL or ALL
+        :return: OTP
+        """
+        raise NotImplementedError
+
+    def verify(self, user, code):
+        """
+        Marks a valid and unused code as used, the code stays valid until it is consumed
+        :param User user: Owner of the code
+        :param str code: Code supplied by the user
+        :return: bool
+        """
+        raise NotImplementedError
+
+    def consume(self, user, code, channel=None, used=False):
+        """
+        Invalidates a valid code, the code can not be used again afterwards
+        :param User user: Owner of the code
+        :param str code: Code supplied by the user
+        :param str channel: When provided, the code must have been issued for this channel
+        :param bool used: Whether the code must have been verified already
+        :return: bool
+        """
+        raise NotImplementedError
+
+
+class DatabaseOTPStore(BaseOTPStore):
+    """
+    Keeps codes in the Verification table.
+    Expiry is checked on read, expired rows are removed by purge_expired_verifications.
+    """
+
+    def issue(self, user, channel="ALL"):
+        cutoff = get_verification_expiry_cutoff()
+        valid = list(Verification.objects.filter(user=user, is_valid=True).only("code", "is_used", "channel",
+                                                                                 "created_at"))
+        verification = next((v for v in valid if not v.is_used and v.created_at >= cutoff), None)
+
+        if not verification:
+            taken = [v.code for v in valid]
+            verification = Verification.objects.create(user=user, channel=channel, code=allocate_digits_code(taken))
+        elif verification.channel != channel:
+            verification.channel = channel
+            verification.save(update_fields=["channel"])
+
+        return OTP(verification.code, verification.channel)
+
+    def verify(self, user, code):
+        if not code:
+            return False
+        return Verification.objects.active().filter(
+            user=user, code=code, is_used=False
+        ).update(is_used=True) > 0
+
+    def consume(self, user, code, channel=None, used=False):
+        if not code:
+            return False
+
+        filter_params = {
+            "user": user,
+            "code": code,
+            "is_used": used
+        }
+
+        if channel:
+            filter_params["channel"] = channel
+
+        return Verification.objects.active().filter(**filter_params).update(is_valid=False, is_used=True) > 0
+
+
+class RedisOTPStore(BaseOTPStore):
+    """
+    Keeps codes in redis, one hash per user holding the code, its channel and its used flag.
+    Keys expire after OTP_LIFETIME seconds and every state change is a single atomic script call.
+    """
+
+    ISSUE_SCRIPT = """
+    if redis.call('HGET', KEYS[1], 'used') == '0' then
+        if ARGV[2] ~= redis.call('HGET', KEYS[1], 'channel') then
+            redis.call('HSET', KEYS[1], 'channel', ARGV[2])
+        end
+        return {redis.call('HGET', KEYS[1], 'code'), ARGV[2]}
+    end
+    redis.call('HSET', KEYS[1], 'code', ARGV[1], 'channel', ARGV[2], 'used', '0')
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return {ARGV[1], ARGV[2]}
+    """
+
+    VERIFY_SCRIPT = """
+    local state = redis.call('HMGET', KEYS[1], 'code', 'used')
+    if state[1] == ARGV[1] and state[2] == '0' then
+        redis.call('HSET', KEYS[1], 'used', '1')
+        return 1
+    end
+    return 0
+    """
+
+    CONSUME_SCRIPT = """
+    local state = redis.call('HMGET', KEYS[1], 'code', 'used', 'channel')
+    if state[1] == ARGV[1] and state[2] == ARGV[2] and (ARGV[3] == '' or state[3] == ARGV[3]) then
+        redis.call('DEL', KEYS[1])
+        return 1
+    end
+    return 0
+    """
+
+    def __init__(self, url=None, lifetime=None, prefix="otp"):
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.OTP_REDIS_URL, decode_responses=True)
+        self.lifetime = lifetime or settings.OTP_LIFETIME
+        self.prefix = prefix
+        self._issue = self.client.register_script(self.ISSUE_SCRIPT)
+        self._verify = self.client.register_script(self.VERIFY_SCRIPT)
+        self._consume = self.client.register_script(self.CONSUME_SCRIPT)
+
+    def key(self, user):
+        return f"{self.prefix}:{user.pk}"
+
+    def issue(self, user, channel="ALL"):
+        code, channel = self._issue(keys=[self.key(user)], args=[generate_digits_code(), channel, self.lifetime])
+        return OTP(code, channel)
+
+    def verify(self, user, code):
+        if not code:
+            return False
+        return bool(self._verify(keys=[self.key(user)], args=[str(code)]))
+
+    def consume(self, user, code, channel=None, used=False):
+        if not code:
+            return False
+        return bool(self._consume(keys=[self.key(user)], args=[str(code), "1" if used else "0", channel or ""]))
+
+
+@lru_cache(maxsize=None)
+def get_otp_store():
+    """
+    Returns the store configured in OTP_STORE
+    :return: BaseOTPStore
+    """
+    return import_string(settings.OTP_STORE)()
+
+
+def get_otp_send_key(user, otp, channel):
+    return f"otp-send:{user.pk}:{channel}:{otp.code}"
+
+
+def claim_otp_send(user, otp, channel):
+    """
+    Claims the send of a code over a channel for OTP_RESEND_COOLDOWN seconds.
+    Only the first of concurrent or repeated requests for the same code gets the claim, the others must
+    not send it again. A new code gets a new send window.
+    :param User user: Owner of the code
+    :param OTP otp: Code about to be sent
+    :param str channel: PHONE_NUMBER or EMAIL
+    :return: int 0 when the send was claimed, otherwise seconds left before the code can be sent again
+    """
+    cooldown = settings.OTP_RESEND_COOLDOWN
+    key = get_otp_send_key(user, otp, channel)
+
+    if cache.add(key, time.time() + cooldown, timeout=cooldown):
+        return 0
+
+    sent_until = cache.get(key)
+    if sent_until is None:
+        # The window closed in between
+        return 0 if cache.add(key, time.time() + cooldown, timeout=cooldown) else cooldown
+
+    return max(1, math.ceil(sent_until - time.time()))
+
+
+def release_otp_send(user, otp, channel):
+    """
+    Gives up a claim of claim_otp_send when the code could not be sent
+    """
+    cache.delete(get_otp_send_key(user, otp, channel))
@@ -0,0 +1,233 @@
+"""
+Keyset pagination.
+
+Pages are read after the position of the last row of the previous page, in the order of the view's
+ordering followed by the primary key, instead of counting and skipping the rows before them. A page is
+then one index range scan however deep it is, as long as an index covers the ordering, and rows inserted
+or deleted meanwhile do not shift the pages. Nullable ordering fields sort their nulls last.
+
+The total count is not computed unless the client asks for it with ?count=estimate, it is then read from
+the planner statistics on postgres and counted on other databases.
+"""
+import json
+from copy import copy
+from types import SimpleNamespace
+from base64 import b64decode, b64encode
+
+from django.db import connections
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+ESTIMATE = "estimate"
+
+
+def estimate_count(queryset):
+    """
+    :param QuerySet queryset: Filtered queryset
+    :return: int rows the planner expects the queryset to return on postgres, the exact count elsewhere
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def keyset_filter(terms, position):
+    """
+    :param list[tuple] terms: (field name, descending, nulls last, nullable) of each ordering field, the last
+        one being unique
+    :param list position: Values of the ordering fields of a row
+    :return: Q selecting the rows coming after the position in the order of the terms
+    """
+    after = None
+
+    for (name, descending, nulls_last, nullable), value in reversed(list(zip(terms, position))):
+        if value is None:
+            beyond = None if nulls_last else Q(**{f"{name}__isnull": False})
+            equal = Q(**{f"{name}__isnull": True})
+        else:
+            beyond = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            if nullable and nulls_last:
+                beyond |= Q(**{f"{name}__isnull": True})
+            equal = Q(**{name: value})
+
+        if after is None:
+            after = beyond
+        elif beyond is None:
+            after = equal & after
+        else:
+            after = beyond | (equal & after)
+
+    # Redundant bound on the first field so that the database can start an index scan at the position
+    name, descending, nulls_last, nullable = terms[0]
+    if position[0] is not None and not nullable:
+        after &= Q(**{f"{name}__{'lte' if descending else 'gte'}": position[0]})
+
+    return after
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination on the whole ordering of the view plus the primary key.
+    The cursor holds the ordering and the position of the first or last row of a page, a cursor of another
+    ordering is rejected.
+    """
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        pk_name = queryset.model._meta.pk.name
+        names = [name.lstrip("-") for name in self.ordering]
+        if pk_name not in names:
+            self.ordering += (("-" if self.ordering[0].startswith("-") else "") + pk_name,)
+
+        self.fields = [self.get_ordering_field(queryset, name.lstrip("-")) for name in self.ordering]
+
+        # Rows of a values() queryset need the ordering fields for the cursors, annotations have to be selected
+        # by the caller
+        if queryset._fields is not None:
+            missing = [field.name for field in self.fields if field.name not in queryset._fields]
+            if missing:
+                queryset = queryset.values(*queryset._fields, *missing)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == ESTIMATE:
+            self.count = estimate_count(queryset)
+
+        reverse, cursor_position, position = self.decode_cursor(request) or (False, None, None)
+
+        terms = [(field.name, name.startswith("-") != reverse, not reverse, field.null)
+                 for name, field in zip(self.ordering, self.fields)]
+
+        queryset = queryset.order_by(*[self.get_order_by(term) for term in terms])
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(terms, position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.previous_position = self.get_position(self.page[0]) if self.page else cursor_position
+        self.next_position = self.get_position(self.page[-1]) if self.page else cursor_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    @staticmethod
+    def get_ordering_field(queryset, name):
+        """
+        :param QuerySet queryset: Paginated queryset
+        :param str name: Name of a model field or of an annotation, e.g. a search rank
+        :return: Field converting the values of the ordering field
+        """
+        if name in queryset.query.annotations:
+            field = copy(queryset.query.annotations[name].output_field)
+            field.set_attributes_from_name(name)
+            return field
+        return queryset.model._meta.get_field(name)
+
+    @staticmethod
+    def get_order_by(term):
+        name, descending, nulls_last, nullable = term
+        if not nullable:
+            return f"-{name}" if descending else name
+        nulls = {"nulls_last" if nulls_last else "nulls_first": True}
+        return F(name).desc(**nulls) if descending else F(name).asc(**nulls)
+
+    def get_position(self, instance):
+        """
+        :param instance: Row of the page, a model instance or a dict of a values() queryset
+        :return: list its ordering field values as strings, None for nulls
+        """
+        if isinstance(instance, dict):
+            instance = SimpleNamespace(**{field.attname: instance[field.name] for field in self.fields})
+
+        return [None if field.value_from_object(instance) is None else field.value_to_string(instance)
+                for field in self.fields]
+
+    def decode_cursor(self, request):
+        """
+        :param Request request: Request
+        :return: tuple (reverse, position as encoded, position with python values) or None without a cursor
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            cursor = json.loads(b64decode(encoded.encode("ascii"), validate=True))
+            if cursor["o"] != list(self.ordering) or len(cursor["p"]) != len(self.fields):
+                raise ValueError
+            position = [None if value is None else field.to_python(value)
+                        for field, value in zip(self.fields, cursor["p"])]
+            if position[-1] is None:
+                raise ValueError
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+        return bool(cursor.get("r")), cursor["p"], position
+
+    def encode_cursor(self, reverse, position):
+        """
+        :param bool reverse: Whether the cursor reads the rows before the position
+        :param list position: Position as returned by get_position
+        :return: str url of the page
+        """
+        cursor = {"o": list(self.ordering), "p": position}
+        if reverse:
+            cursor["r"] = 1
+        encoded = b64encode(json.dumps(cursor, separators=(",", ":")).encode()).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or self.next_position is None:
+            return None
+        return self.encode_cursor(False, self.next_position)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.previous_position is None:
+            return None
+        return self.encode_cursor(True, self.previous_position)
+
+    def get_paginated_response(self, data):
+        content = {"next": self.get_next_link(), "previous": self.get_previous_link()}
+        if self.count is not None:
+            content["count"] = self.count
+        content["results"] = data
+        return Response(content)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count"] = {
+            "type": "integer",
+            "example": 123,
+            "description": "Only with ?count=estimate",
+        }
+        return response_schema
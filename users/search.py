@@ -0,0 +1,142 @@
+"""
+Search of the user directory.
+
+Full UUIDs, E.164 phone numbers and emails are looked up exactly through their unique or expression
+indexes. Other searches go through the text of every user (names, username, email and phone number, see
+migration 0009_user_search):
+
+- postgres: prefix matches of every word on a tsvector, substring and similar (trigram) matches on the text,
+  all served by GIN expression indexes
+- sqlite: prefix matches of every word on an FTS5 table, for development and tests
+- other databases: DRF's icontains search over search_fields
+
+Matches are annotated with their relevance as SEARCH_RANK, RelevanceOrderingFilter orders on it when the
+client does not ask for another ordering.
+"""
+import re
+import uuid
+
+import phonenumbers
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+from .utils import is_username_email, is_username_phone_number, normalize_email
+
+SEARCH_RANK = "search_rank"
+
+WORD = re.compile(r"\w+")
+
+# Expressions of the indexes of migration 0009_user_search, they must stay identical for the indexes to be used
+SEARCH_DOCUMENT = "lower(coalesce(users_user.first_name, '') || ' ' || coalesce(users_user.last_name, '') || ' ' " \
+                  "|| coalesce(users_user.username, '') || ' ' || coalesce(users_user.email, '') || ' ' || " \
+                  "coalesce(users_user.phone_number, ''))"
+SEARCH_VECTOR = f"to_tsvector('simple'::regconfig, translate({SEARCH_DOCUMENT}, '+', ' '))"
+
+
+def get_exact_filter(search):
+    """
+    :param str search: Search text
+    :return: Q matching a full UUID, E.164 phone number or email, None for other searches
+    """
+    try:
+        return Q(id=uuid.UUID(search))
+    except ValueError:
+        pass
+
+    if is_username_email(search):
+        return Q(email__iexact=normalize_email(search))
+
+    if is_username_phone_number(search):
+        try:
+            phone_number = phonenumbers.parse(search, None)
+        except phonenumbers.NumberParseException:
+            return None
+        if phonenumbers.is_possible_number(phone_number):
+            return Q(phone_number=phonenumbers.format_number(phone_number, phonenumbers.PhoneNumberFormat.E164))
+
+    return None
+
+
+def escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_postgres(queryset, search, words):
+    """
+    :param QuerySet queryset: Users
+    :param str search: Lowercased search text
+    :param list[str] words: Words of the search text
+    :return: QuerySet users matching the search, annotated with SEARCH_RANK
+    """
+    conditions = [f"{SEARCH_DOCUMENT} LIKE %s", f"{SEARCH_DOCUMENT} %% %s"]
+    params = [f"%{escape_like(search)}%", search]
+    rank = f"similarity({SEARCH_DOCUMENT}, %s)"
+    rank_params = [search]
+
+    if words:
+        query = " & ".join(f"{word}:*" for word in words)
+        conditions.insert(0, f"{SEARCH_VECTOR} @@ to_tsquery('simple', %s)")
+        params.insert(0, query)
+        rank = f"ts_rank({SEARCH_VECTOR}, to_tsquery('simple', %s)) + {rank}"
+        rank_params.insert(0, query)
+
+    return queryset.filter(
+        RawSQL(" OR ".join(conditions), params, output_field=BooleanField())
+    ).annotate(**{SEARCH_RANK: RawSQL(f"({rank})::float8", rank_params, output_field=FloatField())})
+
+
+def search_sqlite(queryset, words):
+    """
+    :param QuerySet queryset: Users
+    :param list[str] words: Words of the search text
+    :return: QuerySet users matching the search, annotated with SEARCH_RANK
+    """
+    query = " AND ".join(f'"{word}"*' for word in words)
+
+    return queryset.filter(
+        RawSQL("users_user.id IN (SELECT id FROM users_user_fts WHERE users_user_fts MATCH %s)", [query],
+               output_field=BooleanField())
+    ).annotate(**{SEARCH_RANK: RawSQL(
+        "SELECT -rank FROM users_user_fts WHERE users_user_fts MATCH %s AND users_user_fts.id = users_user.id",
+        [query], output_field=FloatField())})
+
+
+class UserSearchFilter(SearchFilter):
+    """
+    Search of the user directory on the search query parameter, search_fields are only used on databases
+    without a search index
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        search = " ".join(terms)
+        exact = get_exact_filter(search)
+        if exact is not None:
+            return queryset.filter(exact)
+
+        words = WORD.findall(search.lower())
+        vendor = connections[queryset.db].vendor
+
+        if vendor == "postgresql":
+            return search_postgres(queryset, search.lower(), words)
+        if vendor == "sqlite" and words:
+            return search_sqlite(queryset, words)
+        return super().filter_queryset(request, queryset, view)
+
+
+class RelevanceOrderingFilter(OrderingFilter):
+    """
+    Orders search results by relevance first, unless the client asked for an ordering
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+
+        if request.query_params.get(self.ordering_param) or SEARCH_RANK not in queryset.query.annotations:
+            return ordering
+        return (f"-{SEARCH_RANK}",) + tuple(ordering or ())
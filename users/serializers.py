@@ -1,4 +1,10 @@
-from django.utils import timezone
+from datetime import date
+from functools import lru_cache
+from operator import itemgetter
+
+from django.utils import timezone, translation
+from django_countries import countries
+from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import ModelSerializer
 from .models import User, Verification
 from django.contrib.auth.models import Group
@@ -11,6 +17,10 @@ class GroupMiniSerializer(ModelSerializer):
 
 
 class UserMiniSerializer(ModelSerializer):
+    """
+    :param list[str] fields: Output fields, see USER_FIELDS. Defaults to all of them
+    """
+
     class Meta:
         model = User
         fields = [
@@ -31,9 +41,21 @@ class UserMiniSerializer(ModelSerializer):
         ]
         read_only_fields = ['is_active', 'is_staff', 'verification_status', 'is_email_verified']
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super(UserMiniSerializer, self).__init__(*args, **kwargs)
+        self.output_fields = fields
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     def to_representation(self, instance):
         serialized_data = super(UserMiniSerializer, self).to_representation(instance)
-        serialized_data['nationality'] = instance.nationality.name
+        if "nationality" in serialized_data:
+            serialized_data['nationality'] = instance.nationality.name
+
+        if self.output_fields is not None and "age" not in self.output_fields:
+            return serialized_data
 
         if instance.birthdate:
             now = timezone.now().date()
@@ -50,6 +72,109 @@ class UserMiniSerializer(ModelSerializer):
         return super(UserMiniSerializer, self).update(instance, validated_data)
 
 
+# Output fields of UserMiniSerializer and UserMiniValuesSerializer, in output order
+USER_FIELDS = UserMiniSerializer.Meta.fields + ["age"]
+
+# Columns read to output a field, other fields are read from the column of the same name
+USER_FIELD_COLUMNS = {"age": ["birthdate"]}
+
+
+def get_user_columns(fields):
+    """
+    :param list[str] fields: Output fields
+    :return: list[str] columns to read to output them, the primary key included
+    """
+    columns = ["id"]
+    for field in fields:
+        for column in USER_FIELD_COLUMNS.get(field, [field]):
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def get_sparse_fields(request, available=None):
+    """
+    Output fields selected by the fields and exclude query parameters, comma separated lists of field names
+    :param Request request: Request
+    :param list[str] available: Fields that can be selected, defaults to USER_FIELDS
+    :return: list[str] selected fields in output order
+    """
+    available = USER_FIELDS if available is None else available
+    selected = available
+
+    for param in ("fields", "exclude"):
+        value = request.query_params.get(param)
+        if not value:
+            continue
+
+        names = {name.strip() for name in value.split(",") if name.strip()}
+        unknown = names - set(available)
+        if unknown:
+            raise ValidationError({param: f"Unknown fields: {', '.join(sorted(unknown))}"})
+
+        if param == "fields":
+            selected = [name for name in selected if name in names]
+        else:
+            selected = [name for name in selected if name not in names]
+
+    return selected
+
+
+@lru_cache(maxsize=None)
+def get_country_names(language):
+    """
+    :param str language: Language code, names are translated in it
+    :return: dict country code -> name, as Country.name gives it
+    """
+    with translation.override(language):
+        return {code: str(name) for code, name in countries}
+
+
+class UserMiniValuesSerializer:
+    """
+    Read only equivalent of UserMiniSerializer for rows fetched with QuerySet.values(*get_user_columns(fields)).
+    Rows are mapped to the same output without model instances nor DRF fields, for lists and bulk reads.
+
+    :param iterable[dict] rows: User rows
+    :param dict context: Serializer context, the request makes profile photo urls absolute like DRF does
+    :param list[str] fields: Output fields, see USER_FIELDS. Defaults to all of them
+    """
+    columns = get_user_columns(USER_FIELDS)
+
+    def __init__(self, rows, context=None, fields=None):
+        self.rows = rows
+        self.context = context or {}
+        self.fields = USER_FIELDS if fields is None else fields
+
+    @property
+    def data(self):
+        today = timezone.now().date()
+        country_names = get_country_names(translation.get_language())
+        photo_storage = User._meta.get_field("profile_photo").storage
+        request = self.context.get("request")
+
+        def photo_url(row):
+            if not row["profile_photo"]:
+                return None
+            url = photo_storage.url(row["profile_photo"])
+            return url if request is None else request.build_absolute_uri(url)
+
+        def optional(convert, column):
+            return lambda row: None if row[column] is None else convert(row[column])
+
+        getters = {
+            "id": lambda row: str(row["id"]),
+            "phone_number": optional(str, "phone_number"),
+            "nationality": lambda row: country_names.get(row["nationality"], ""),
+            "birthdate": optional(date.isoformat, "birthdate"),
+            "profile_photo": photo_url,
+            "age": optional(lambda birthdate: f"{int((today - birthdate).days / 365)} Years", "birthdate"),
+        }
+        getters = [(field, getters.get(field, itemgetter(field))) for field in self.fields]
+
+        return [{field: getter(row) for field, getter in getters} for row in self.rows]
+
+
 class VerificationSerializer(ModelSerializer):
     class Meta:
         model = Verification
@@ -0,0 +1,2 @@
+# Imported by the celery autodiscovery of users.tasks, workers register the tasks of these modules
+from . import tasks_verification
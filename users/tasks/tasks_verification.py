@@ -1,53 +1,35 @@
+from django.conf import settings
+
 from celeryconfig import app
-from django_celery_beat.models import PeriodicTask, ClockedSchedule
 from users.models import Verification
-from datetime import datetime, timedelta
-
-from users.utils import get_object_or_none
 
 
-@app.task
-def schedule_expiration(verification_code):
+# Idempotent, acknowledged once done so that a run lost with its worker is run again
+@app.task(acks_late=True, ignore_result=True)
+def purge_expired_verifications(batch_size=None, max_batches=None):
     """
+    Deletes verifications older than OTP_LIFETIME in bounded chunks.
+    Expired verifications are already rejected on read, this only keeps the table small.
 
-    :param str verification_code: code identifying verification instance
-    :return: None
+    :param int batch_size: Number of rows deleted per statement
+    :param int max_batches: Maximum number of statements per run, the next run picks up the rest
+    :return: int number of deleted verifications
     """
-    kwargs = "{" + "\"code\":" + "\"{}\"".format(verification_code) + "}"
-
-    get_kwargs = {
-        "code": verification_code
-    }
-
-    verification = get_object_or_none(Verification, get_kwargs)
+    batch_size = batch_size or settings.VERIFICATION_PURGE_BATCH_SIZE
+    max_batches = max_batches or settings.VERIFICATION_PURGE_MAX_BATCHES
 
-    if verification:
-        created_at = verification.created_at
-        expiration_time_delta = timedelta(minutes=5)
-        expiration_time = created_at + expiration_time_delta
+    deleted = 0
 
-        schedule = ClockedSchedule.objects.create(
-            clocked_time=expiration_time,
-        )
+    for _ in range(max_batches):
+        ids = list(Verification.objects.expired().values_list("id", flat=True)[:batch_size])
 
-        PeriodicTask.objects.create(
-            name="auto_invalidate_verification_{code}".format(code=verification_code),
-            task="users.tasks.tasks_verification.invalidate_verification",
-            kwargs=kwargs,
-            clocked=schedule,
-            one_off=True
-        )
+        if not ids:
+            break
 
+        Verification.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
 
-@app.task
-def invalidate_verification(*args, **kwargs):
-    code = kwargs.get('id')
-    Verification.objects.filter(id=code).delete()
+        if len(ids) < batch_size:
+            break
 
-    """
-
-    if verification:
-        verification.is_valid = False
-        verification.save()
-        
-    """
+    return deleted
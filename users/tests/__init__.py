@@ -0,0 +1,16 @@
+import uuid
+from unittest import mock
+
+from users.throttling import RedisTokenBuckets
+
+
+def use_fresh_throttle_buckets(test_case):
+    """
+    Gives a test its own throttle buckets so that requests of other tests or runs do not count
+    :param TestCase test_case: Test, the buckets are dropped on cleanup
+    """
+    buckets = RedisTokenBuckets(prefix=f"test-throttle-{uuid.uuid4()}")
+    patcher = mock.patch("users.throttling.get_token_buckets", return_value=buckets)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    return buckets
@@ -1,7 +1,10 @@
-from datetime import datetime
+import tempfile
+from datetime import date, datetime, timedelta, timezone
 
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 
 from users.models import User, Verification
@@ -54,7 +57,7 @@ class TestUsersList(TestCase):
 
         response = self.client.get("/users")
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(len(response.json()['results']), 2)
 
     def test_list_users(self):
         self.client.login(
@@ -64,7 +67,7 @@ class TestUsersList(TestCase):
 
         response = self.client.get("/users")
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(len(response.json()['results']), 1)
 
     def test_list_users_unauthenticated(self):
         self.client.logout()
@@ -73,6 +76,78 @@ class TestUsersList(TestCase):
         self.assertEqual(response.status_code, 403)
 
 
+class TestUsersPagination(TestCase):
+    """
+    Test keyset pagination of the users list:
+    - Pages follow each other without gaps or repeats, ties on the ordering field included
+    - Previous links go back to the previous page
+    - Client orderings on nullable fields
+    - Count only when asked for
+    - Cursors of another ordering are rejected
+    """
+
+    def setUp(self):
+        joined = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        birthdates = [date(1990, 1, 1), None, date(1985, 5, 5), date(1990, 1, 1), None, date(2000, 2, 2), None]
+
+        self.users = []
+        for i, birthdate in enumerate(birthdates):
+            user = User.objects.create(phone_number=f"+25078800{i:04d}", birthdate=birthdate, is_staff=i == 0,
+                                       date_joined=joined + timedelta(microseconds=i // 2))
+            self.users.append(user)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def read_pages(self, url):
+        ids = []
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json())
+            ids += [user["id"] for user in response.json()["results"]]
+            url = response.json()["next"]
+        return ids, pages
+
+    def test_pages(self):
+        ids, pages = self.read_pages("/users?page_size=3")
+
+        expected = sorted(self.users, key=lambda user: (user.date_joined, user.id), reverse=True)
+        self.assertEqual(ids, [str(user.id) for user in expected])
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0]["previous"])
+        self.assertNotIn("count", pages[0])
+
+        response = self.client.get(pages[2]["previous"])
+        self.assertEqual(response.json()["results"], pages[1]["results"])
+        self.assertEqual(self.client.get(response.json()["previous"]).json()["results"], pages[0]["results"])
+
+    def test_nullable_ordering(self):
+        for ordering in ("birthdate", "-birthdate"):
+            ids, pages = self.read_pages(f"/users?page_size=2&ordering={ordering}")
+
+            dated = sorted((user for user in self.users if user.birthdate), key=lambda user: (user.birthdate, user.id),
+                           reverse=ordering.startswith("-"))
+            undated = sorted((user for user in self.users if not user.birthdate), key=lambda user: user.id,
+                             reverse=ordering.startswith("-"))
+            self.assertEqual(ids, [str(user.id) for user in dated + undated])
+
+            response = self.client.get(pages[-1]["previous"])
+            self.assertEqual(response.json()["results"], pages[-2]["results"])
+
+    def test_count(self):
+        response = self.client.get("/users?page_size=2&count=estimate")
+        self.assertEqual(response.json()["count"], 7)
+
+    def test_cursor_of_another_ordering(self):
+        next_page = self.client.get("/users?page_size=2").json()["next"]
+
+        self.assertEqual(self.client.get(next_page + "&ordering=first_name").status_code, 404)
+        self.assertEqual(self.client.get("/users?cursor=invalid").status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
 class TestUsersDetail(TestCase):
     """
     Test users detail viewset:
@@ -174,3 +249,118 @@ class TestUsersDetail(TestCase):
         user = User.objects.get(id=self.user2.id)
 
         self.assertNotEqual(user.nid_number, "99999999999999")
+
+
+class TestUsersSearch(TestCase):
+    """
+    Test search of the users list:
+    - Exact lookups of ids, phone numbers and emails
+    - Word prefixes on names, emails and phone numbers
+    - Results ordered by relevance unless another ordering is asked for
+    - The search index follows updates and deletions
+    """
+
+    def setUp(self):
+        self.staff = User.objects.create(phone_number="+250788000000", first_name="Staff", is_staff=True)
+        self.john = User.objects.create(phone_number="+250788000001", first_name="John", last_name="Doe",
+                                        email="john.doe@example.com")
+        self.jane = User.objects.create(phone_number="+254712000002", first_name="Jane", last_name="Johnson",
+                                        email="jane@example.org")
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def search(self, search, **params):
+        response = self.client.get("/users", data={"search": search, **params})
+        self.assertEqual(response.status_code, 200)
+        return [user["id"] for user in response.json()["results"]]
+
+    def test_exact_lookups(self):
+        self.assertEqual(self.search(str(self.john.id)), [str(self.john.id)])
+        self.assertEqual(self.search("+254 712 000 002"), [str(self.jane.id)])
+        self.assertEqual(self.search("JOHN.DOE@example.com"), [str(self.john.id)])
+
+        with self.assertNumQueries(1):
+            self.client.get("/users", data={"search": "+250788000001"})
+
+    def test_prefixes(self):
+        self.assertEqual(self.search("jo do"), [str(self.john.id)])
+        self.assertCountEqual(self.search("example"), [str(self.john.id), str(self.jane.id)])
+        self.assertEqual(self.search("+2547"), [str(self.jane.id)])
+        self.assertEqual(self.search("nobody"), [])
+
+    def test_relevance(self):
+        self.assertEqual(self.search("john"), [str(self.john.id), str(self.jane.id)])
+        self.assertEqual(self.search("john", ordering="first_name"), [str(self.jane.id), str(self.john.id)])
+
+        response = self.client.get("/users", data={"search": "john", "page_size": 1})
+        self.assertEqual(self.client.get(response.json()["next"]).json()["results"][0]["id"], str(self.jane.id))
+
+    def test_index_follows_changes(self):
+        self.john.first_name = "Jack"
+        self.john.email = None
+        self.john.save()
+        self.jane.delete()
+
+        self.assertEqual(self.search("john"), [])
+        self.assertEqual(self.search("jack"), [str(self.john.id)])
+        self.assertEqual(self.search("jane"), [])
+
+
+class TestSparseFieldsets(TestCase):
+    """
+    Test the fields and exclude parameters of the user endpoints:
+    - Only the requested fields are returned
+    - Only their columns are read
+    - Unknown fields are rejected
+    - Updates are not restricted
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(phone_number="+250788000001", first_name="John", email="john@xyz.com",
+                                        birthdate=date(1990, 5, 17), is_staff=True)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data=params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), queries[-1]["sql"]
+
+    def test_list(self):
+        data, sql = self.get("/users", fields="id,phone_number")
+        self.assertEqual(data["results"], [{"id": str(self.user.id), "phone_number": "+250788000001"}])
+        self.assertNotIn('"email"', sql)
+        self.assertNotIn('"birthdate"', sql)
+
+        data, sql = self.get("/users", fields="age")
+        self.assertEqual(list(data["results"][0]), ["age"])
+        self.assertIn('"birthdate"', sql)
+
+        data, sql = self.get("/users", exclude="profile_photo,nationality,age")
+        self.assertNotIn("profile_photo", data["results"][0])
+        self.assertIn("birthdate", data["results"][0])
+        self.assertNotIn('"profile_photo"', sql)
+
+    def test_detail(self):
+        data, sql = self.get(f"/users/{self.user.id}", fields="first_name,email")
+        self.assertEqual(data, {"first_name": "John", "email": "john@xyz.com"})
+        self.assertNotIn('"phone_number"', sql)
+
+        data, _ = self.get(f"/users/{self.user.id}", exclude="age")
+        self.assertEqual(len(data), 14)
+
+    def test_unknown_fields(self):
+        response = self.client.get("/users", data={"fields": "id,password"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"fields": "Unknown fields: password"})
+
+        self.assertEqual(self.client.get(f"/users/{self.user.id}", data={"exclude": "nid"}).status_code, 400)
+
+    def test_update(self):
+        response = self.client.patch(f"/users/{self.user.id}?fields=id", data={"last_name": "Doe"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["last_name"], "Doe")
+        self.assertEqual(User.objects.get(id=self.user.id).first_name, "John")
@@ -1,12 +1,14 @@
+import tempfile
 import uuid
 
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 
 from users.models import User, Verification
 
 
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
 class TestVerifications(TestCase):
     """
     Test verifications:
@@ -362,3 +364,7 @@ class TestVerifications(TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.json()['detail'], "Email is already verified")
 
+        self.verification.refresh_from_db()
+        self.assertTrue(self.verification.is_valid)
+        self.assertFalse(self.verification.is_used)
+
@@ -0,0 +1,106 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.signals import user_login_failed
+from django.test import TestCase, AsyncClient
+
+from users.models import User, Verification
+from users.tests import use_fresh_throttle_buckets
+
+
+class TestAsyncAuthentication(TestCase):
+    """
+    Test async authentication endpoints:
+    - They answer like their DRF counterparts
+    - Verification codes are issued, verified and consumed
+    """
+
+    def setUp(self):
+        use_fresh_throttle_buckets(self)
+        self.user = User(
+            phone_number="+111111111111",
+            email="email@xyz.com",
+            first_name="John",
+            last_name="Doe",
+            is_email_verified=True
+        )
+        self.user.set_password("Testing@2")
+        self.user.save()
+
+        self.verification = Verification.objects.create(user=self.user)
+
+        self.client = AsyncClient()
+
+    async def test_request_verification_code(self):
+        response = await self.client.post("/aio/auth/request-verification-code", data={"username": "+000000000000"},
+                                          content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json().keys()), ["detail", "cooldown"])
+        self.assertTrue(await sync_to_async(
+            Verification.objects.filter(user__phone_number="+000000000000").exists)())
+
+    async def test_request_verification_code_invalid_username(self):
+        response = await self.client.post("/aio/auth/request-verification-code", data={"username": "john"},
+                                          content_type="application/json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Valid email or phone number is not supplied")
+
+    async def test_verify_otp(self):
+        data = {"username": "+111111111111", "code": self.verification.code}
+
+        response = await self.client.post("/aio/auth/verify-otp", data=data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        data["code"] = "000000" if self.verification.code != "000000" else "111111"
+        response = await self.client.post("/aio/auth/verify-otp", data=data, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    async def test_authenticate(self):
+        data = {"username": "email@xyz.com", "code": self.verification.code, "password": "Testing@2"}
+
+        response = await self.client.post("/aio/auth/verify-otp", data=data, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        response = await self.client.post("/aio/auth/authenticate", data=data, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], str(self.user.id))
+        self.assertTrue(response.json()["token"])
+
+        response = await self.client.post("/aio/auth/authenticate", data=data, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Invalid verification code")
+
+    async def test_authenticate_wrong_password(self):
+        data = {"username": "+111111111111", "code": self.verification.code, "password": "Testing@3"}
+        login_failed = mock.Mock()
+        user_login_failed.connect(login_failed)
+        self.addCleanup(user_login_failed.disconnect, login_failed)
+
+        response = await self.client.post("/aio/auth/authenticate", data=data, content_type="application/json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Invalid credentials")
+        login_failed.assert_called_once()
+
+    async def test_magic_link(self):
+        response = await self.client.post("/aio/auth/generate-magic-link", data={"email": "email@xyz.com"},
+                                          content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        response = await self.client.get(f"/aio/auth/login-with-magic-link?login_id={self.verification.id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["token"])
+
+        response = await self.client.get(f"/aio/auth/login-with-magic-link?login_id={self.verification.id}")
+        self.assertEqual(response.status_code, 400)
+
+        response = await self.client.get("/aio/auth/login-with-magic-link?login_id=invalid")
+        self.assertEqual(response.status_code, 400)
+
+    async def test_method_not_allowed(self):
+        response = await self.client.get("/aio/auth/authenticate")
+
+        self.assertEqual(response.status_code, 405)
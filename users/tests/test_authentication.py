@@ -0,0 +1,101 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from users.authentication import CachedTokenAuthentication, local_token_cache, get_token_cache_key
+from users.models import User
+from users.otp import get_otp_store
+from users.tests import use_fresh_throttle_buckets
+
+
+class TestCachedTokenAuthentication(TestCase):
+    """
+    Test cached token authentication:
+    - Cached tokens are resolved without queries
+    - Tokens are dropped from the cache on logout, password change and user updates
+    - The shared cache holds no password hash, views only save the fields they change on cached users
+    """
+
+    def setUp(self):
+        use_fresh_throttle_buckets(self)
+        self.user = User(
+            phone_number="+111111111111",
+            email="email@xyz.com",
+            first_name="John",
+            last_name="Doe"
+        )
+        self.user.set_password("Testing@2")
+        self.user.save()
+
+        self.token = Token.objects.create(user=self.user)
+        self.authentication = CachedTokenAuthentication()
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def tearDown(self):
+        local_token_cache.clear()
+        cache.delete(get_token_cache_key(self.token.key))
+
+    def test_cached_token_makes_no_queries(self):
+        user, _ = self.authentication.authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(0):
+            cached_user, token = self.authentication.authenticate_credentials(self.token.key)
+
+        self.assertEqual(cached_user, user)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_shared_tier(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        local_token_cache.clear()
+
+        with self.assertNumQueries(0):
+            user, _ = self.authentication.authenticate_credentials(self.token.key)
+
+        self.assertEqual(user, self.user)
+
+    def test_invalid_token(self):
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authentication.authenticate_credentials("invalid")
+
+    def test_deactivated_user(self):
+        self.authentication.authenticate_credentials(self.token.key)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_logout_invalidates_token(self):
+        response = self.client.get("/auth/logout")
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.token.key)
+
+    def test_shared_cache_has_no_password(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        local_token_cache.clear()
+
+        values = cache.get(get_token_cache_key(self.token.key))
+        self.assertNotIn("password", values)
+        self.assertNotIn(self.user.password, values.values())
+
+        user, _ = self.authentication.authenticate_credentials(self.token.key)
+        self.assertTrue(user.check_password("Testing@2"))
+
+    def test_stale_cached_user_keeps_concurrent_changes(self):
+        self.authentication.authenticate_credentials(self.token.key)
+        # Changed by another process, whose invalidation this process does not see
+        User.objects.filter(id=self.user.id).update(first_name="Jane")
+        code = get_otp_store().issue(self.user, channel="EMAIL").code
+
+        response = self.client.post("/verifications/verify-email", data={"code": code})
+
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(id=self.user.id)
+        self.assertEqual((user.first_name, user.is_email_verified), ("Jane", True))
@@ -0,0 +1,94 @@
+from django.contrib.auth import authenticate
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from users.models import User, Verification
+from users.tests import use_fresh_throttle_buckets
+
+
+class TestAuthenticationBackend(TestCase):
+    """
+    Test the authentication backend:
+    - Password login with phone number, email or username in a single query
+    - No query for the password of a user the caller already resolved, the login view reads the user once
+    - Passwordless login with a verification code
+    """
+
+    def setUp(self):
+        self.user = User(
+            phone_number="+111111111111",
+            email="email@xyz.com",
+            first_name="John",
+            last_name="Doe"
+        )
+        self.user.username = "johndoe"
+        self.user.set_password("Testing@2")
+        self.user.save()
+
+        self.verification = Verification.objects.create(user=self.user)
+
+    def test_password_login_with_phone_number(self):
+        with self.assertNumQueries(1):
+            user = authenticate(username="+111111111111", password="Testing@2")
+
+        self.assertEqual(user, self.user)
+
+    def test_password_login_with_email(self):
+        with self.assertNumQueries(1):
+            user = authenticate(username="EMAIL@xyz.com", password="Testing@2")
+
+        self.assertEqual(user, self.user)
+
+    def test_password_login_with_username(self):
+        with self.assertNumQueries(1):
+            user = authenticate(username="johndoe", password="Testing@2")
+
+        self.assertEqual(user, self.user)
+
+    def test_password_login_with_resolved_user(self):
+        with self.assertNumQueries(0):
+            user = authenticate(username="+111111111111", password="Testing@2", user=self.user)
+
+        self.assertEqual(user, self.user)
+        self.assertIsNone(authenticate(username="+111111111111", password="Wrong password", user=self.user))
+
+    def test_login_view_reads_the_user_once(self):
+        use_fresh_throttle_buckets(self)
+        client = APIClient()
+        data = {"username": "+111111111111", "code": self.verification.code, "password": "Testing@2"}
+        self.assertEqual(client.post("/auth/verify-otp", data=data).status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post("/auth/authenticate", data=data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([query for query in queries if 'FROM "users_user"' in query["sql"]]), 1)
+
+    def test_password_login_with_wrong_password(self):
+        self.assertIsNone(authenticate(username="+111111111111", password="Wrong password"))
+
+    def test_password_login_with_unknown_user(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(authenticate(username="+333333333333", password="Testing@2"))
+
+    def test_password_login_with_inactive_user(self):
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(authenticate(username="+111111111111", password="Testing@2"))
+
+    def test_verification_code_login(self):
+        with self.assertNumQueries(2):
+            user = authenticate(username="+111111111111", verification_code=self.verification.code)
+
+        self.assertEqual(user, self.user)
+        self.assertFalse(Verification.objects.get(id=self.verification.id).is_valid)
+
+    def test_verification_code_login_with_wrong_code(self):
+        self.assertIsNone(authenticate(username="+111111111111", verification_code="INVALID"))
+
+    def test_missing_credentials(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(authenticate(username="+111111111111"))
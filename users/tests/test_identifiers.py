@@ -0,0 +1,131 @@
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from users.models import User, UserIdentifier
+from users.utils import classify_identifier
+
+
+class TestUserIdentifiers(TestCase):
+    """
+    Test user identifiers:
+    - Identifiers follow the user on create and update, they are only normalized when the user changed
+    - Lookups are normalized and resolved in a single query on the identifiers
+    - Existing users get their identifiers from the backfill migration and command
+    - An identifier shared by several accounts belongs to the account that joined first
+    """
+
+    def setUp(self):
+        self.user = User(
+            phone_number="+250788000000",
+            email="Email@XYZ.com",
+            first_name="John",
+            last_name="Doe"
+        )
+        self.user.set_password("Testing@2")
+        self.user.save()
+
+    def get_identifiers(self, user):
+        return dict(UserIdentifier.objects.filter(user=user).values_list("kind", "value"))
+
+    def test_identifiers_created_with_user(self):
+        self.assertEqual(self.get_identifiers(self.user), {
+            "PHONE_NUMBER": "+250788000000",
+            "EMAIL": "email@xyz.com",
+        })
+
+    def test_identifiers_follow_updates(self):
+        user = User.objects.get(id=self.user.id)
+        user.email = "new@xyz.com"
+        user.save()
+
+        self.assertEqual(self.get_identifiers(user)["EMAIL"], "new@xyz.com")
+
+        user.email = None
+        user.save()
+
+        self.assertNotIn("EMAIL", self.get_identifiers(user))
+
+    def test_unchanged_identifiers_are_not_written(self):
+        user = User.objects.get(id=self.user.id)
+        user.first_name = "Jane"
+
+        with CaptureQueriesContext(connection) as context:
+            user.save()
+
+        self.assertFalse([query for query in context.captured_queries if "users_useridentifier" in query["sql"]])
+
+    def test_loading_does_not_normalize(self):
+        with mock.patch("users.models.get_identifiers") as get_identifiers, \
+                mock.patch("users.models.get_typeahead_terms") as get_typeahead_terms:
+            user = User.objects.get(id=self.user.id)
+            user.birthdate = "2000-01-01"
+            user.save()
+
+        get_identifiers.assert_not_called()
+        get_typeahead_terms.assert_not_called()
+
+    def test_shared_email_belongs_to_first_user(self):
+        other = User.objects.create_user(phone_number="+250788000001", email="email@xyz.com")
+
+        self.assertEqual(User.objects.get_by_identifier("EMAIL", "email@xyz.com"), self.user)
+        self.assertNotIn("EMAIL", self.get_identifiers(other))
+
+        self.user.email = "new@xyz.com"
+        self.user.save()
+
+        self.assertEqual(self.get_identifiers(other)["EMAIL"], "email@xyz.com")
+
+        self.user.delete()
+
+        self.assertEqual(User.objects.get_by_identifier("EMAIL", "new@xyz.com"), None)
+
+    def test_shared_email_claimed_by_earlier_user(self):
+        earlier = User.objects.create_user(phone_number="+250788000001", email="other@xyz.com",
+                                           date_joined=self.user.date_joined - timedelta(days=1))
+
+        earlier.email = "EMAIL@xyz.com"
+        earlier.save()
+
+        self.assertEqual(User.objects.get_by_identifier("EMAIL", "email@xyz.com"), earlier)
+        self.assertNotIn("EMAIL", self.get_identifiers(self.user))
+
+        earlier.delete()
+
+        self.assertEqual(User.objects.get_by_identifier("EMAIL", "email@xyz.com"), self.user)
+
+    def test_get_by_identifier(self):
+        with self.assertNumQueries(1):
+            user = User.objects.get_by_identifier(*classify_identifier("EMAIL@xyz.COM"))
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(User.objects.get_by_identifier(*classify_identifier("+250 788 000 000")), self.user)
+        self.assertIsNone(User.objects.get_by_identifier(*classify_identifier("+250788999999")))
+        self.assertIsNone(User.objects.get_by_identifier(*classify_identifier("")))
+
+    def test_backfill_migration(self):
+        backfill = import_module("users.migrations.0011_backfill_user_identifiers").backfill_user_identifiers
+        later = User.objects.create_user(phone_number="+250788000001", email="email@xyz.com")
+        UserIdentifier.objects.all().delete()
+
+        backfill(apps, None)
+
+        self.assertEqual(self.get_identifiers(self.user), {
+            "PHONE_NUMBER": "+250788000000",
+            "EMAIL": "email@xyz.com",
+        })
+        self.assertEqual(self.get_identifiers(later), {"PHONE_NUMBER": "+250788000001"})
+
+    def test_backfill(self):
+        UserIdentifier.objects.all().delete()
+
+        call_command("backfill_user_identifiers", batch_size=1, stdout=StringIO())
+
+        self.assertEqual(len(self.get_identifiers(self.user)), 2)
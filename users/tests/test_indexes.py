@@ -0,0 +1,83 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from users.models import User, Verification
+from users.pagination import keyset_filter
+from users.search import search_postgres
+from users.typeahead import get_terms
+
+
+@skipUnless(connection.vendor == "postgresql", "Query plans are only checked on postgres")
+class TestLookupIndexes(TestCase):
+    """
+    Test that the hot lookups of the authentication and user views are served by an index.
+    Sequential scans are disabled so that the planner picks an index whenever one applies,
+    regardless of the size of the test tables.
+    """
+
+    def setUp(self):
+        self.user = User(
+            phone_number="+111111111111",
+            email="email@xyz.com",
+            first_name="John",
+            last_name="Doe"
+        )
+        self.user.set_password("Testing@2")
+        self.user.save()
+
+        self.verification = Verification.objects.create(user=self.user)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertIndexScan(self, queryset, index_name=None):
+        plan = queryset.explain()
+
+        self.assertNotIn("Seq Scan", plan)
+        self.assertIn("Index", plan)
+        if index_name:
+            self.assertIn(index_name, plan)
+
+    def test_user_by_phone_number(self):
+        self.assertIndexScan(User.objects.filter(phone_number="+111111111111"))
+
+    def test_user_by_email(self):
+        self.assertIndexScan(User.objects.filter(email__iexact="EMAIL@xyz.com"), "user_email_upper_idx")
+
+    def test_user_by_username(self):
+        self.assertIndexScan(User.objects.filter(username="john", is_active=True), "user_username_idx")
+
+    def test_users_page(self):
+        terms = [("date_joined", True, True, False), ("id", True, True, False)]
+        self.assertIndexScan(
+            User.objects.order_by("-date_joined", "-id").filter(
+                keyset_filter(terms, [self.user.date_joined, self.user.id]))[:20],
+            "user_date_joined_id_idx"
+        )
+
+    def test_user_search(self):
+        plan = search_postgres(User.objects.all(), "john", ["john"]).explain()
+
+        self.assertNotIn("Seq Scan", plan)
+        self.assertIn("user_search_vector_idx", plan)
+        self.assertIn("user_search_document_trgm_idx", plan)
+
+    def test_typeahead_terms(self):
+        plan = get_terms("jo")[:50].explain()
+
+        self.assertIn("typeahead_term_idx", plan)
+        self.assertNotIn("Sort", plan)
+
+    def test_active_verifications_of_user(self):
+        self.assertIndexScan(Verification.objects.active().filter(user=self.user, is_used=False),
+                             "verification_active_code_unique")
+
+    def test_verification_code_of_user(self):
+        self.assertIndexScan(
+            Verification.objects.active().filter(user=self.user, code=self.verification.code, is_used=True)
+        )
+
+    def test_expired_verifications(self):
+        self.assertIndexScan(Verification.objects.expired(), "verification_created_at_idx")
@@ -0,0 +1,265 @@
+import subprocess
+import sys
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DatabaseError
+from django_celery_beat.models import ClockedSchedule, PeriodicTask, PeriodicTasks
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from notifications.models import OutboxMessage
+from users.models import User, Verification
+from users.otp import DatabaseOTPStore, RedisOTPStore, get_otp_store, claim_otp_send
+from users.tests import use_fresh_throttle_buckets
+from users.tasks.tasks_verification import purge_expired_verifications
+from users.utils import allocate_digits_code
+
+
+class OTPStoreTestMixin:
+    """
+    Behaviour shared by all OTP stores:
+    - One active code per user
+    - Verify marks the code as used
+    - Consume invalidates the code
+    """
+
+    def get_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.user = User(
+            phone_number="+111111111111",
+            email="email@xyz.com",
+            first_name="John",
+            last_name="Doe"
+        )
+        self.user.set_password("Testing@2")
+        self.user.save()
+
+        self.store = self.get_store()
+
+    def test_issue_reuses_active_code(self):
+        otp = self.store.issue(self.user, channel="PHONE_NUMBER")
+        again = self.store.issue(self.user, channel="EMAIL")
+
+        self.assertEqual(len(otp.code), 6)
+        self.assertEqual(otp.code, again.code)
+        self.assertEqual(again.channel, "EMAIL")
+
+    def test_verify(self):
+        otp = self.store.issue(self.user)
+
+        self.assertFalse(self.store.verify(self.user, "INVALID"))
+        self.assertTrue(self.store.verify(self.user, otp.code))
+        self.assertFalse(self.store.verify(self.user, otp.code))
+
+    def test_consume_unused_code(self):
+        otp = self.store.issue(self.user)
+
+        self.assertFalse(self.store.consume(self.user, otp.code, used=True))
+        self.assertTrue(self.store.consume(self.user, otp.code))
+        self.assertFalse(self.store.consume(self.user, otp.code))
+
+    def test_consume_verified_code(self):
+        otp = self.store.issue(self.user)
+        self.store.verify(self.user, otp.code)
+
+        self.assertFalse(self.store.consume(self.user, otp.code))
+        self.assertTrue(self.store.consume(self.user, otp.code, used=True))
+        self.assertNotEqual(self.store.issue(self.user).code, None)
+
+    def test_consume_with_channel(self):
+        otp = self.store.issue(self.user, channel="PHONE_NUMBER")
+
+        self.assertFalse(self.store.consume(self.user, otp.code, channel="EMAIL"))
+        self.assertTrue(self.store.consume(self.user, otp.code, channel="PHONE_NUMBER"))
+
+    def test_consume_without_code(self):
+        self.store.issue(self.user)
+
+        self.assertFalse(self.store.consume(self.user, None))
+        self.assertFalse(self.store.verify(self.user, ""))
+
+
+class TestDatabaseOTPStore(OTPStoreTestMixin, TestCase):
+
+    def get_store(self):
+        return DatabaseOTPStore()
+
+
+class TestRedisOTPStore(OTPStoreTestMixin, TestCase):
+
+    def get_store(self):
+        return RedisOTPStore(prefix=f"test-otp-{uuid.uuid4()}")
+
+    def test_code_expires(self):
+        self.store.issue(self.user)
+
+        ttl = self.store.client.ttl(self.store.key(self.user))
+
+        self.assertGreater(ttl, 0)
+        self.assertLessEqual(ttl, self.store.lifetime)
+
+
+class TestVerificationExpiry(TestCase):
+    """
+    Test verification expiry:
+    - Expired codes are rejected on read
+    - Expired verifications are purged in chunks
+    - Workers register the purge task
+    - The beat entries of the old expiry scheduling are purged in batches
+    """
+
+    def setUp(self):
+        self.user = User(
+            phone_number="+111111111111",
+            email="email@xyz.com",
+            first_name="John",
+            last_name="Doe"
+        )
+        self.user.set_password("Testing@2")
+        self.user.save()
+
+        self.store = DatabaseOTPStore()
+
+    def expire(self, code):
+        created_at = timezone.now() - timedelta(seconds=settings.OTP_LIFETIME + 1)
+        Verification.objects.filter(code=code).update(created_at=created_at)
+
+    def test_expired_code_is_rejected(self):
+        otp = self.store.issue(self.user)
+        self.expire(otp.code)
+
+        self.assertFalse(self.store.verify(self.user, otp.code))
+        self.assertFalse(self.store.consume(self.user, otp.code))
+        self.assertNotEqual(self.store.issue(self.user).code, otp.code)
+
+    def test_purge_expired_verifications(self):
+        for _ in range(5):
+            verification = Verification.objects.create(user=self.user, is_valid=False, is_used=True)
+            self.expire(verification.code)
+        active = self.store.issue(self.user)
+
+        deleted = purge_expired_verifications(batch_size=2)
+
+        self.assertEqual(deleted, 5)
+        self.assertEqual(list(Verification.objects.values_list("code", flat=True)), [active.code])
+
+    def test_purge_verification_schedules(self):
+        for i in range(3):
+            PeriodicTask.objects.create(name=f"auto_invalidate_verification_{i}", task="users.tasks.invalidate",
+                                        one_off=True, clocked=ClockedSchedule.objects.create(
+                                            clocked_time=timezone.now()))
+        other = PeriodicTask.objects.create(name="other", task="users.tasks.other", one_off=True,
+                                            clocked=ClockedSchedule.objects.create(clocked_time=timezone.now()))
+
+        call_command("purge_verification_schedules", batch_size=2, stdout=mock.Mock())
+
+        self.assertEqual(list(PeriodicTask.objects.all()), [other])
+        self.assertEqual(list(ClockedSchedule.objects.all()), [other.clocked])
+        self.assertIsNotNone(PeriodicTasks.last_change())
+
+    def test_purge_task_is_registered(self):
+        # A fresh interpreter only knows the tasks loaded by the autodiscovery, as a worker does
+        script = "import django; django.setup(); from celeryconfig import app; " \
+                 "app.loader.import_default_modules(); print('\\n'.join(app.tasks))"
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+
+        self.assertIn(purge_expired_verifications.name, output.split())
+
+
+class TestCodeAllocation(TestCase):
+    """
+    Test code allocation:
+    - Allocated codes avoid the taken ones without retrying
+    - Codes are unique per user only
+    """
+
+    def test_allocate_from_nearly_full_scope(self):
+        taken = [f"{code:02d}" for code in range(100) if code != 42]
+
+        self.assertEqual(allocate_digits_code(taken, length=2), "42")
+
+    def test_allocate_avoids_taken_codes(self):
+        taken = set()
+        for _ in range(500):
+            code = allocate_digits_code(taken, length=3)
+            self.assertNotIn(code, taken)
+            taken.add(code)
+
+        self.assertEqual(len(taken), 500)
+
+    def test_same_code_for_different_users(self):
+        user1 = User.objects.create_user(phone_number="+111111111111", password="Testing@2")
+        user2 = User.objects.create_user(phone_number="+222222222222", password="Testing@2")
+
+        Verification.objects.create(user=user1, code="123456")
+        Verification.objects.create(user=user2, code="123456")
+        verification = Verification.objects.create_for_user(user1)
+
+        self.assertNotEqual(verification.code, "123456")
+
+
+class TestResendCoalescing(TestCase):
+    """
+    Test resend coalescing:
+    - Repeated requests get the same code and send it once, with the remaining cooldown
+    - A new code or another channel is sent right away
+    - A send that failed can be retried
+    """
+
+    def setUp(self):
+        use_fresh_throttle_buckets(self)
+        self.client = APIClient()
+
+    def request_code(self, username):
+        return self.client.post("/auth/request-verification-code", data={"username": username}, format="json")
+
+    def sent_messages(self):
+        return [message.kwargs["message"] for message in OutboxMessage.objects.all()]
+
+    def test_resend_is_coalesced(self):
+        response = self.request_code("+250788000001")
+        self.assertEqual(response.json()["cooldown"], settings.OTP_RESEND_COOLDOWN)
+
+        for _ in range(3):
+            response = self.request_code("+250788000001")
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(0 < response.json()["cooldown"] <= settings.OTP_RESEND_COOLDOWN)
+            self.assertIn("already been sent", response.json()["detail"])
+
+        self.assertEqual(len(self.sent_messages()), 1)
+        self.assertEqual(Verification.objects.filter(user__phone_number="+250788000001").count(), 1)
+
+    def test_new_code_is_sent(self):
+        self.request_code("+250788000001")
+        user = User.objects.get(phone_number="+250788000001")
+        code = Verification.objects.get(user=user).code
+        get_otp_store().consume(user, code)
+
+        self.request_code("+250788000001")
+
+        self.assertEqual(len(self.sent_messages()), 2)
+        self.assertNotIn(code, self.sent_messages()[1])
+
+    def test_channels_are_coalesced_separately(self):
+        user = User(phone_number="+250788000001", email="user@example.com")
+        user.save()
+        otp = get_otp_store().issue(user, channel="PHONE_NUMBER")
+
+        self.assertEqual(claim_otp_send(user, otp, "PHONE_NUMBER"), 0)
+        self.assertEqual(claim_otp_send(user, otp, "EMAIL"), 0)
+        self.assertGreater(claim_otp_send(user, otp, "EMAIL"), 0)
+
+    def test_failed_send_is_released(self):
+        with mock.patch("users.views.enqueue_notification", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.request_code("+250788000001")
+
+        self.assertEqual(self.request_code("+250788000001").json()["cooldown"], settings.OTP_RESEND_COOLDOWN)
+        self.assertEqual(len(self.sent_messages()), 1)
@@ -0,0 +1,106 @@
+import gzip
+import uuid
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils.translation import gettext_lazy
+from django_countries.fields import Country
+from phonenumber_field.phonenumber import PhoneNumber
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from UAMSAPI import middleware
+from UAMSAPI.middleware import choose_encoding, BROTLI, GZIP
+from UAMSAPI.renderers import ORJSONRenderer, ORJSONParser
+from users.models import User
+
+
+class TestORJSON(SimpleTestCase):
+    """
+    Test the orjson renderer and parser:
+    - Same output as DRF's JSONRenderer
+    - Phone numbers and countries
+    - Indented output
+    - Invalid JSON
+    """
+
+    def test_same_output(self):
+        data = {
+            "id": uuid.uuid4(),
+            "date": date(2022, 5, 17),
+            "datetime": datetime(2022, 5, 17, 10, 30, 15, 123456, tzinfo=timezone.utc),
+            "time": time(10, 30, 15, 123456),
+            "decimal": Decimal("1.50"),
+            "lazy": gettext_lazy("Active"),
+            "text": "Ñame\u2028",
+            "nested": [{"count": 1, "empty": None, "flag": True}],
+            1: "integer key",
+        }
+
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_phone_numbers_and_countries(self):
+        data = {"phone_number": PhoneNumber.from_string("+250788000001"), "nationality": Country("RW")}
+        self.assertEqual(ORJSONRenderer().render(data), b'{"phone_number":"+250788000001","nationality":"RW"}')
+
+    def test_indent(self):
+        rendered = ORJSONRenderer().render({"a": [1]}, "application/json; indent=2")
+        self.assertEqual(rendered, JSONRenderer().render({"a": [1]}, "application/json; indent=2"))
+
+    def test_parse(self):
+        self.assertEqual(ORJSONParser().parse(BytesIO('{"name": "Ñame"}'.encode())), {"name": "Ñame"})
+
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b'{"name": '))
+
+
+@override_settings(COMPRESSION_MIN_SIZE=1024)
+class TestCompression(TestCase):
+    """
+    Test response compression:
+    - Encoding negotiation
+    - Size threshold
+    - gzip and brotli bodies
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(phone_number="+250788000000", is_staff=True)
+        User.objects.bulk_create([User(phone_number=f"+25078800{i:04d}", username=f"user{i}") for i in range(1, 20)])
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding("gzip, deflate, br", [BROTLI, GZIP]), BROTLI)
+        self.assertEqual(choose_encoding("gzip, br;q=0.5", [BROTLI, GZIP]), GZIP)
+        self.assertEqual(choose_encoding("br;q=0, *", [BROTLI, GZIP]), GZIP)
+        self.assertEqual(choose_encoding("gzip, br", [GZIP]), GZIP)
+        self.assertIsNone(choose_encoding("identity", [BROTLI, GZIP]))
+        self.assertIsNone(choose_encoding("", [GZIP]))
+
+    def test_gzip(self):
+        plain = self.client.get("/users")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+        with mock.patch("UAMSAPI.middleware.get_available_encodings", return_value=[GZIP]):
+            response = self.client.get("/users", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+
+    def test_threshold(self):
+        response = self.client.get(f"/users/{self.user.id}", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    @skipUnless(middleware.brotli, "brotli is not installed")
+    def test_brotli(self):
+        plain = self.client.get("/users")
+        response = self.client.get("/users", HTTP_ACCEPT_ENCODING="gzip, br")
+
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(middleware.brotli.decompress(response.content), plain.content)
@@ -0,0 +1,54 @@
+from datetime import date
+
+from django.test import TestCase
+from django.utils import translation
+from rest_framework.test import APIClient, APIRequestFactory
+
+from users.models import User
+from users.serializers import UserMiniSerializer, UserMiniValuesSerializer, get_user_columns
+
+
+class TestUserMiniValuesSerializer(TestCase):
+    """
+    Test that rows serialized by UserMiniValuesSerializer match UserMiniSerializer:
+    - Set and empty optional fields
+    - Translated country names
+    - Profile photo urls, absolute with a request
+    - Sparse fields
+    - The users list
+    """
+
+    def setUp(self):
+        User.objects.create(phone_number="+250788000001", first_name="John", last_name="Doe", email="john@xyz.com",
+                            nationality="RW", birthdate=date(1990, 5, 17), marital_status="SINGLE", gender="MALE",
+                            profile_photo="profile-photos/john.png", is_staff=True)
+        User.objects.create(phone_number="+254712000002")
+        User.objects.create(phone_number="+256772000003", nationality="", first_name="", verification_status="VERIFIED")
+
+    def assertSameOutput(self, context=None, fields=None):
+        users = User.objects.order_by("id")
+        expected = UserMiniSerializer(users, many=True, context=context or {}, fields=fields).data
+        columns = UserMiniValuesSerializer.columns if fields is None else get_user_columns(fields)
+
+        self.assertEqual(UserMiniValuesSerializer(users.values(*columns), context, fields).data,
+                         [dict(user) for user in expected])
+
+    def test_same_output(self):
+        self.assertSameOutput()
+        self.assertSameOutput({"request": APIRequestFactory().get("/users")})
+
+        with translation.override("fr"):
+            self.assertSameOutput()
+
+        self.assertSameOutput(fields=["phone_number", "nationality", "age"])
+
+    def test_users_list(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(phone_number="+250788000001"))
+
+        response = client.get("/users")
+        request = response.wsgi_request
+        expected = UserMiniSerializer(User.objects.order_by("-date_joined", "-id"), many=True,
+                                      context={"request": request}).data
+
+        self.assertEqual(response.json()["results"], [dict(user) for user in expected])
@@ -0,0 +1,36 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+
+from users.management.commands.check_startup_time import parse_import_times
+
+
+class TestStartupTime(SimpleTestCase):
+    """
+    Test web worker startup:
+    - Import times are parsed from python -X importtime
+    - Provider clients are not imported by a web worker
+    - A start over the budget fails
+    """
+
+    def test_parse_import_times(self):
+        output = "import time: self [us] | cumulative | imported package\n" \
+                 "import time:       120 |        120 |   users.utils\n" \
+                 "import time:      2000 |       2120 | users.views\n" \
+                 "Traceback (most recent call last):\n"
+
+        self.assertEqual(parse_import_times(output), [("users.utils", 1, 0.00012, 0.00012),
+                                                      ("users.views", 0, 0.002, 0.00212)])
+
+    def test_startup(self):
+        stdout = StringIO()
+        call_command("check_startup_time", budget=60, top=100000, stdout=stdout)
+
+        modules = {line.split()[-1] for line in stdout.getvalue().splitlines()[1:-1]}
+        self.assertIn("users.views", modules)
+        self.assertTrue(modules.isdisjoint({"aiohttp", "sendgrid", "google.oauth2.service_account"}))
+
+        with self.assertRaises(CommandError):
+            call_command("check_startup_time", budget=0.001, stdout=StringIO())
@@ -0,0 +1,105 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.test import TestCase, AsyncClient, override_settings
+from rest_framework.test import APIClient
+
+from users.models import User, Verification
+from users.tests import use_fresh_throttle_buckets
+from users.throttling import parse_rate
+
+THROTTLE_RATES = {
+    "otp.ip": "10/minute",
+    "otp.identifier": "2/minute",
+    "otp.country": "4/minute",
+    "login.ip": "10/minute",
+    "login.identifier": "2/minute",
+}
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": THROTTLE_RATES})
+class TestAuthenticationThrottling(TestCase):
+    """
+    Test throttling of the authentication endpoints:
+    - Requests are throttled per identifier, phone country code and client IP
+    - A throttled request takes no token and runs no database query
+    - Login endpoints have their own buckets
+    - The async endpoints share the buckets of the DRF ones
+    """
+
+    def setUp(self):
+        self.buckets = use_fresh_throttle_buckets(self)
+        self.client = APIClient()
+
+    def request_code(self, username, ip="10.0.0.1"):
+        return self.client.post("/auth/request-verification-code", data={"username": username}, format="json",
+                                REMOTE_ADDR=ip)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("10/minute"), (10, 10 / 60))
+        self.assertEqual(parse_rate("2/s"), (2, 2))
+        self.assertIsNone(parse_rate(None))
+
+    def test_identifier_bucket(self):
+        for _ in range(2):
+            self.assertEqual(self.request_code("+250788000001").status_code, 200)
+
+        response = self.request_code("+250 788 000 001", ip="10.0.0.2")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(int(response["Retry-After"]), 30)
+
+        self.assertEqual(self.request_code("+250788000002").status_code, 200)
+
+    def test_country_bucket(self):
+        for number in ("+250788000001", "+250788000002", "+250788000003", "+250788000004"):
+            self.assertEqual(self.request_code(number, ip=f"10.0.1.{number[-1]}").status_code, 200)
+
+        self.assertEqual(self.request_code("+250788000005", ip="10.0.1.5").status_code, 429)
+        self.assertEqual(self.request_code("+254712000001", ip="10.0.1.5").status_code, 200)
+
+    def test_ip_bucket(self):
+        rates = {name: rate for name, rate in THROTTLE_RATES.items() if name != "otp.country"}
+
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": rates}):
+            for i in range(10):
+                self.assertEqual(self.request_code(f"+25078800{i:04d}").status_code, 200)
+
+            self.assertEqual(self.request_code("+250788000010").status_code, 429)
+            self.assertEqual(self.request_code("+250788000010", ip="10.0.0.2").status_code, 200)
+
+    def test_throttled_request_is_cheap(self):
+        for _ in range(2):
+            self.request_code("+250788000001")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.request_code("+250788000001").status_code, 429)
+
+        # The rejected request took no token from the country bucket
+        for number in ("+250788000002", "+250788000003"):
+            self.assertEqual(self.request_code(number).status_code, 200)
+        self.assertEqual(self.request_code("+250788000004").status_code, 429)
+
+    def test_login_buckets(self):
+        user = User(phone_number="+250788000001")
+        user.set_password("Testing@2")
+        user.save()
+        code = Verification.objects.create(user=user).code
+        data = {"username": "+250788000001", "code": code}
+
+        for _ in range(2):
+            self.assertEqual(self.request_code("+250788000001").status_code, 200)
+        self.assertEqual(self.client.post("/auth/verify-otp", data=data, format="json").status_code, 200)
+
+        self.client.post("/auth/verify-otp", data=data, format="json")
+        self.assertEqual(self.client.post("/auth/verify-otp", data=data, format="json").status_code, 429)
+        self.assertEqual(self.client.post("/auth/authenticate", data=data, format="json").status_code, 429)
+
+    async def test_async_views(self):
+        client = AsyncClient()
+
+        for _ in range(2):
+            self.assertEqual((await sync_to_async(self.request_code)("+250788000001")).status_code, 200)
+
+        response = await client.post("/aio/auth/request-verification-code", data={"username": "+250788000001"},
+                                     content_type="application/json")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "30")
@@ -0,0 +1,119 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from users.authentication import local_user_cache
+from users.models import User, Verification
+from users.tokens import issue_token, read_token, revoke_token, revoke_user_tokens, InvalidToken, ACCESS, REFRESH
+from users.tests import use_fresh_throttle_buckets
+
+
+@override_settings(AUTH_TOKEN_TYPE="signed")
+class TestSignedTokens(TestCase):
+    """
+    Test signed tokens:
+    - Login endpoints issue signed access and refresh tokens
+    - Access tokens authenticate requests without a token table
+    - Refresh tokens rotate and are exchanged once even by concurrent requests, logout revokes every token of
+      the user
+    """
+
+    def setUp(self):
+        use_fresh_throttle_buckets(self)
+        self.user = User(
+            phone_number="+111111111111",
+            email="email@xyz.com",
+            first_name="John",
+            last_name="Doe"
+        )
+        self.user.set_password("Testing@2")
+        self.user.save()
+
+        self.verification = Verification.objects.create(user=self.user)
+
+        self.client = APIClient()
+
+    def tearDown(self):
+        local_user_cache.clear()
+
+    def test_read_token(self):
+        token = issue_token(self.user, ACCESS)
+
+        self.assertEqual(read_token(token, ACCESS)["uid"], str(self.user.id))
+
+        with self.assertRaises(InvalidToken):
+            read_token(token, REFRESH)
+
+        with self.assertRaises(InvalidToken):
+            read_token(token[:-1], ACCESS)
+
+    def test_revoke_token(self):
+        token = issue_token(self.user, REFRESH)
+        other = issue_token(self.user, REFRESH)
+
+        payload = read_token(token, REFRESH)
+
+        self.assertTrue(revoke_token(payload))
+        self.assertFalse(revoke_token(payload))
+
+        with self.assertRaises(InvalidToken):
+            read_token(token, REFRESH)
+        self.assertTrue(read_token(other, REFRESH))
+
+    def test_revoke_user_tokens(self):
+        token = issue_token(self.user, ACCESS)
+
+        revoke_user_tokens(self.user)
+
+        with self.assertRaises(InvalidToken):
+            read_token(token, ACCESS)
+        self.assertTrue(read_token(issue_token(self.user, ACCESS), ACCESS))
+
+    def test_login_link_issues_signed_tokens(self):
+        response = self.client.get(f"/auth/login-with-magic-link?login_id={self.verification.id}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(read_token(response.json()["token"], ACCESS)["uid"], str(self.user.id))
+        self.assertEqual(read_token(response.json()["refresh_token"], REFRESH)["uid"], str(self.user.id))
+
+    def test_access_token_authentication(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {issue_token(self.user, ACCESS)}")
+
+        response = self.client.get(f"/users/{self.user.id}")
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_refresh_token_rotation(self):
+        refresh_token = issue_token(self.user, REFRESH)
+
+        response = self.client.post("/auth/refresh-token", data={"refresh_token": refresh_token})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(read_token(response.json()["token"], ACCESS))
+
+        response = self.client.post("/auth/refresh-token", data={"refresh_token": refresh_token})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Token has been revoked")
+
+    def test_concurrent_refresh_token_rotation(self):
+        payload = read_token(issue_token(self.user, REFRESH), REFRESH)
+
+        # Both requests read the token before either revoked it
+        with mock.patch("users.views.read_token", return_value=payload):
+            first = self.client.post("/auth/refresh-token", data={"refresh_token": "token"})
+            second = self.client.post("/auth/refresh-token", data={"refresh_token": "token"})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 400)
+
+    def test_logout_revokes_tokens(self):
+        access_token = issue_token(self.user, ACCESS)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+        response = self.client.get("/auth/logout")
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f"/users/{self.user.id}")
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,73 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from users.models import User, TypeaheadTerm
+from users.typeahead import typeahead_cache
+from users.utils import get_typeahead_terms, TYPEAHEAD_TERMS_PER_USER
+
+
+class TestUserTypeahead(TestCase):
+    """
+    Test the staff typeahead:
+    - Prefixes of names in both orders, emails and phone numbers with or without country code
+    - Distinct users, at most limit of them
+    - Terms follow updates of the users
+    - Results are cached
+    - Staff only
+    """
+
+    def setUp(self):
+        typeahead_cache.clear()
+        self.addCleanup(typeahead_cache.clear)
+
+        self.staff = User.objects.create(phone_number="+250788000000", first_name="Staff", is_staff=True)
+        self.john = User.objects.create(phone_number="+250788000001", first_name="Jöhn", last_name="Doe",
+                                        email="John.Doe@example.com")
+        self.jane = User.objects.create(phone_number="+254712000002", first_name="Jane", last_name="Johnson")
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def lookup(self, q, **params):
+        response = self.client.get("/users/typeahead", data={"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [user["id"] for user in response.json()["results"]]
+
+    def test_prefixes(self):
+        self.assertEqual(self.lookup("JOHN D"), [str(self.john.id)])
+        self.assertEqual(self.lookup("doe jo"), [str(self.john.id)])
+        self.assertEqual(self.lookup("john.d"), [str(self.john.id)])
+        self.assertEqual(self.lookup("+254 71"), [str(self.jane.id)])
+        self.assertEqual(self.lookup("7120"), [str(self.jane.id)])
+        self.assertEqual(self.lookup("nobody"), [])
+        self.assertEqual(self.lookup(" "), [])
+
+    def test_results(self):
+        # "john doe" and "john.doe@example.com" come before "johnson jane"
+        self.assertEqual(self.lookup("jo"), [str(self.john.id), str(self.jane.id)])
+        self.assertEqual(self.lookup("jo", limit=1), [str(self.john.id)])
+
+        response = self.client.get("/users/typeahead", data={"q": "john d"})
+        self.assertEqual(response.json()["results"], [{"id": str(self.john.id), "first_name": "Jöhn",
+                                                       "last_name": "Doe", "phone_number": "+250788000001"}])
+
+        self.assertEqual(self.client.get("/users/typeahead", data={"q": "jo", "limit": "x"}).status_code, 400)
+
+    def test_terms_follow_updates(self):
+        self.john.last_name = "Smith"
+        self.john.save()
+
+        self.assertEqual(set(TypeaheadTerm.objects.filter(user=self.john).values_list("term", flat=True)),
+                         {"john smith", "smith john", "john.doe@example.com", "250788000001", "788000001"})
+        self.assertEqual(self.lookup("smith"), [str(self.john.id)])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.lookup("smith"), [str(self.john.id)])
+
+    def test_terms_per_user(self):
+        terms = get_typeahead_terms("John", "Doe", "jdoe", "john@example.com", "+250788000001")
+        self.assertEqual(len(terms), TYPEAHEAD_TERMS_PER_USER)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.john)
+        self.assertEqual(self.client.get("/users/typeahead", data={"q": "jo"}).status_code, 403)
@@ -0,0 +1,174 @@
+"""
+Token bucket throttles of the authentication endpoints.
+
+Every request takes a token from one bucket per key it is throttled on: the client IP, the normalized
+identifier (phone number or email) and, for phone numbers, the country calling code. Buckets live in
+redis and are all checked and updated by a single script call, a request is let through only when
+each of its buckets has a token left. Rates are configured in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+under <scope>.<bucket>, e.g. otp.identifier, buckets without a rate are not checked.
+
+Keys only come from the client address and the request body so that throttled requests are rejected
+before any database query.
+"""
+import logging
+import math
+from functools import lru_cache
+
+import phonenumbers
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .utils import classify_identifier
+
+logger = logging.getLogger(__name__)
+
+DURATIONS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """
+    :param str rate: <requests>/<period>, the period is second, minute, hour or day (only its first letter counts)
+    :return: tuple (capacity, tokens refilled per second) or None when rate is None
+    """
+    if rate is None:
+        return None
+    requests, period = rate.split("/")
+    capacity = int(requests)
+    return capacity, capacity / DURATIONS[period[0]]
+
+
+class RedisTokenBuckets:
+    """
+    Token buckets kept in redis, one hash per bucket holding its tokens and the time they were counted.
+    A bucket starts full and is refilled continuously, its key expires once it would be full again.
+    """
+
+    TAKE_SCRIPT = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local tokens = {}
+    local wait = 0
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2 - 1])
+        local rate = tonumber(ARGV[i * 2])
+        local state = redis.call('HMGET', key, 'tokens', 'updated')
+        tokens[i] = capacity
+        if state[1] then
+            tokens[i] = math.min(capacity, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+        end
+        if tokens[i] < 1 then
+            wait = math.max(wait, (1 - tokens[i]) / rate)
+        end
+    end
+    if wait > 0 then
+        return tostring(wait)
+    end
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2 - 1])
+        local rate = tonumber(ARGV[i * 2])
+        redis.call('HSET', key, 'tokens', tostring(tokens[i] - 1), 'updated', tostring(now))
+        redis.call('PEXPIRE', key, math.ceil((capacity - tokens[i] + 1) / rate * 1000))
+    end
+    return '0'
+    """
+
+    def __init__(self, url=None, prefix="throttle"):
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.THROTTLE_REDIS_URL, decode_responses=True)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.TAKE_SCRIPT)
+
+    def take(self, buckets):
+        """
+        Takes a token from every bucket, or from none of them when one is empty
+        :param list[tuple] buckets: (key, capacity, tokens refilled per second) of each bucket
+        :return: float seconds until every bucket has a token again, 0 when the tokens were taken
+        """
+        if not buckets:
+            return 0
+        args = [value for _, capacity, rate in buckets for value in (capacity, rate)]
+        return float(self._take(keys=[f"{self.prefix}:{key}" for key, _, _ in buckets], args=args))
+
+
+@lru_cache(maxsize=None)
+def get_token_buckets():
+    return RedisTokenBuckets()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles a request on the buckets of its scope
+    """
+    scope = None
+    buckets = ("ip", "identifier", "country")
+
+    def __init__(self):
+        self.wait_time = 0
+
+    def get_bucket_keys(self, request, data):
+        """
+        :param HttpRequest request: Request, the client IP is read from its META
+        :param dict data: Request body
+        :return: dict bucket name -> key
+        """
+        keys = {"ip": self.get_ident(request)}
+
+        username = (data.get("username") or data.get("email")) if isinstance(data, dict) else None
+        kind, identifier = classify_identifier(username) if isinstance(username, str) else (None, None)
+
+        if kind in ("PHONE_NUMBER", "EMAIL"):
+            keys["identifier"] = identifier
+
+        if kind == "PHONE_NUMBER":
+            try:
+                keys["country"] = str(phonenumbers.parse(identifier, None).country_code)
+            except phonenumbers.NumberParseException:
+                pass
+
+        return keys
+
+    def allow(self, request, data):
+        """
+        Same as allow_request for requests that did not go through DRF, e.g. the async views
+        :param HttpRequest request: Request
+        :param dict data: Parsed request body
+        :return: bool
+        """
+        buckets = []
+
+        for bucket, key in self.get_bucket_keys(request, data).items():
+            name = f"{self.scope}.{bucket}"
+            rate = parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(name)) if bucket in self.buckets else None
+            if rate is not None:
+                buckets.append((f"{name}:{key}", *rate))
+
+        try:
+            self.wait_time = get_token_buckets().take(buckets)
+        except Exception as e:
+            # An unreachable redis must not lock everybody out
+            logger.warning("Authentication throttling skipped: %s", e)
+            self.wait_time = 0
+
+        return self.wait_time == 0
+
+    def allow_request(self, request, view):
+        return self.allow(request, request.data)
+
+    def wait(self):
+        return math.ceil(self.wait_time)
+
+
+class OTPRateThrottle(TokenBucketThrottle):
+    """
+    Requests sending a verification code or a login link, each of them costs an SMS or an email
+    """
+    scope = "otp"
+
+
+class LoginRateThrottle(TokenBucketThrottle):
+    """
+    Requests checking a password, a verification code or a login link
+    """
+    scope = "login"
@@ -0,0 +1,122 @@
+"""
+Stateless signed access and refresh tokens.
+
+Tokens are signed with django.core.signing and carry the user id, a token id (jti) and the issue time,
+so validating one needs no storage. Revocation goes through a deny-list in the shared cache whose
+entries expire together with the tokens they revoke:
+- auth:revoked:<jti> revokes a single token (refresh token rotation), it is claimed with an atomic add
+- auth:revoked-before:<user id> revokes every token of a user issued before the stored time
+
+AUTH_TOKEN_TYPE picks what the login endpoints hand out: "token" for database backed DRF tokens
+or "signed" for these tokens.
+"""
+import secrets
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from rest_framework.authtoken.models import Token
+
+ACCESS = "access"
+REFRESH = "refresh"
+
+SALT = "users.tokens"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def get_lifetime(token_type):
+    if token_type == REFRESH:
+        return settings.SIGNED_REFRESH_TOKEN_LIFETIME
+    return settings.SIGNED_ACCESS_TOKEN_LIFETIME
+
+
+def get_revocation_cache():
+    return caches[settings.TOKEN_CACHE_ALIAS]
+
+
+def issue_token(user, token_type=ACCESS):
+    """
+    :param User user: Token owner
+    :param str token_type: access or refresh
+    :return: str signed token
+    """
+    payload = {
+        "uid": str(user.pk),
+        "jti": secrets.token_urlsafe(12),
+        "typ": token_type,
+        "iat": time.time(),
+    }
+    return signing.dumps(payload, salt=SALT)
+
+
+def read_token(token, token_type=ACCESS):
+    """
+    Validates a token and returns its payload
+    :param str token: Signed token
+    :param str token_type: Expected token type
+    :return: dict payload
+    :raises InvalidToken: When the token is malformed, expired, of another type or revoked
+    """
+    try:
+        payload = signing.loads(token, salt=SALT, max_age=get_lifetime(token_type))
+    except signing.BadSignature:
+        raise InvalidToken("Invalid or expired token")
+
+    if payload.get("typ") != token_type:
+        raise InvalidToken("Invalid token type")
+
+    revoked = get_revocation_cache().get_many([
+        f"auth:revoked:{payload['jti']}",
+        f"auth:revoked-before:{payload['uid']}",
+    ])
+
+    if f"auth:revoked:{payload['jti']}" in revoked:
+        raise InvalidToken("Token has been revoked")
+
+    revoked_before = revoked.get(f"auth:revoked-before:{payload['uid']}")
+    if revoked_before and payload["iat"] <= revoked_before:
+        raise InvalidToken("Token has been revoked")
+
+    return payload
+
+
+def revoke_token(payload):
+    """
+    Revokes a single token until it expires. The token id is claimed atomically, of concurrent revocations of
+    the same token only one succeeds.
+    :param dict payload: Payload returned by read_token
+    :return: bool whether this call revoked the token, False when it was revoked already or has expired
+    """
+    remaining = get_lifetime(payload["typ"]) - (time.time() - payload["iat"])
+    if remaining <= 0:
+        return False
+    return get_revocation_cache().add(f"auth:revoked:{payload['jti']}", 1, int(remaining) + 1)
+
+
+def revoke_user_tokens(user):
+    """
+    Revokes every signed token issued to the user so far
+    :param User user: Token owner
+    """
+    get_revocation_cache().set(f"auth:revoked-before:{user.pk}", time.time(),
+                               settings.SIGNED_REFRESH_TOKEN_LIFETIME)
+
+
+def issue_auth_tokens(user):
+    """
+    Returns the tokens handed out on login, according to AUTH_TOKEN_TYPE
+    :param User user: Authenticated user
+    :return: dict
+    """
+    if settings.AUTH_TOKEN_TYPE == "signed":
+        return {
+            "token": issue_token(user, ACCESS),
+            "refresh_token": issue_token(user, REFRESH),
+        }
+
+    token, _ = Token.objects.get_or_create(user=user)
+    return {"token": token.key}
@@ -0,0 +1,72 @@
+"""
+Typeahead of staff user lookups.
+
+A lookup reads the TypeaheadTerm rows starting with the normalized prefix in term order, joined to the few
+user columns returned, and stops after enough distinct users. On postgres the terms are compared and ordered
+in the C collation of typeahead_term_idx, so that the index serves the order and the scan stops at the limit.
+Results are kept for TYPEAHEAD_CACHE_TIMEOUT seconds in an in-process cache, so the keystrokes of a burst and
+the staff typing the same prefix are served without a query. Users saved meanwhile show up once the entry
+expires.
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.models.functions import Collate
+
+from .authentication import LocalCache
+from .models import TypeaheadTerm
+from .utils import normalize_typeahead_query, TYPEAHEAD_TERMS_PER_USER
+
+# Greatest code point, in the C collation the terms starting with a prefix sort between the prefix and the prefix
+# followed by it
+LAST_CHARACTER = chr(0x10FFFF)
+
+typeahead_cache = LocalCache(settings.TYPEAHEAD_CACHE_SIZE, settings.TYPEAHEAD_CACHE_TIMEOUT)
+
+
+def get_terms(prefix):
+    """
+    :param str prefix: Normalized query
+    :return: QuerySet TypeaheadTerm rows starting with prefix, in term order
+    """
+    terms = TypeaheadTerm.objects.all()
+    if connections[terms.db].vendor == "postgresql":
+        terms = terms.alias(c_term=Collate("term", "C"))
+        return terms.filter(c_term__gte=prefix, c_term__lt=prefix + LAST_CHARACTER).order_by("c_term")
+    return terms.filter(term__startswith=prefix).order_by("term")
+
+
+def lookup_users(query, limit):
+    """
+    :param str query: Beginning of a name, username, email or phone number
+    :param int limit: Maximum number of users returned
+    :return: list[dict] id, first_name, last_name and phone_number of the users having a term starting with query
+    """
+    prefix = normalize_typeahead_query(query)
+    if not prefix or limit < 1:
+        return []
+
+    key = (prefix, limit)
+    results = typeahead_cache.get(key)
+    if results is not None:
+        return results
+
+    rows = get_terms(prefix).values_list(
+        "user_id", "user__first_name", "user__last_name", "user__phone_number")[:limit * TYPEAHEAD_TERMS_PER_USER]
+
+    results = []
+    seen = set()
+    for user_id, first_name, last_name, phone_number in rows:
+        if user_id in seen:
+            continue
+        seen.add(user_id)
+        results.append({
+            "id": str(user_id),
+            "first_name": first_name,
+            "last_name": last_name,
+            "phone_number": str(phone_number) if phone_number else None,
+        })
+        if len(results) == limit:
+            break
+
+    typeahead_cache.set(key, results)
+    return results
@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserListViewset, UserDetailViewset, AuthenticationViewset, VerificationsViewset
+from .views import UserListViewset, UserTypeaheadViewset, UserDetailViewset, AuthenticationViewset, \
+    VerificationsViewset
+from . import async_views
 
 routes = DefaultRouter(trailing_slash=False)
 routes.register('auth', AuthenticationViewset, basename='auth')
@@ -9,5 +11,13 @@ routes.register('verifications', VerificationsViewset, basename='verifications')
 urlpatterns = [
     path("", include(routes.urls)),
     path('users', UserListViewset.as_view(), name="users-list"),
+    path('users/typeahead', UserTypeaheadViewset.as_view(), name="users-typeahead"),
     path('users/<slug:pk>', UserDetailViewset.as_view(), name="user-details"),
+    path('aio/auth/request-verification-code', async_views.request_verification_code,
+         name="aio-auth-request-verification-code"),
+    path('aio/auth/verify-otp', async_views.verify_otp, name="aio-auth-verify-otp"),
+    path('aio/auth/authenticate', async_views.perform__authentication, name="aio-auth-authenticate"),
+    path('aio/auth/generate-magic-link', async_views.generate_magic_link, name="aio-auth-generate-magic-link"),
+    path('aio/auth/login-with-magic-link', async_views.signin_with_magic_link,
+         name="aio-auth-login-with-magic-link"),
 ]
\ No newline at end of file
@@ -1,7 +1,10 @@
-import string, random
+import secrets
+import string
+import unicodedata
 
 from django.contrib import messages
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.contrib.auth.password_validation import (
     UserAttributeSimilarityValidator,
     CommonPasswordValidator,
@@ -11,6 +14,8 @@ from django.contrib.auth.password_validation import (
 
 import re
 
+import phonenumbers
+
 # Make a regular expression
 # for validating an Email
 regex = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
@@ -47,6 +52,115 @@ def is_username_phone_number(username):
     return username.startswith("+")
 
 
+def normalize_phone_number(phone_number):
+    """
+    :param str phone_number: Phone number starting with a country code
+    :return: str phone number in E.164 format
+    """
+    phone_number = str(phone_number)
+
+    try:
+        parsed = phonenumbers.parse(phone_number, None)
+        return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+    except phonenumbers.NumberParseException:
+        return re.sub(r"[\s()\-]", "", phone_number)
+
+
+def normalize_email(email):
+    """
+    :param str email: Email address
+    :return: str lowercased email address
+    """
+    return email.strip().lower()
+
+
+def classify_identifier(username):
+    """
+    Classifies a login identifier and normalizes it the way UserIdentifier stores it
+
+    :param str username: Phone number, email or username
+    :return: tuple (kind, value), kind is PHONE_NUMBER, EMAIL, USERNAME or None when username is empty
+    """
+    if not username:
+        return None, None
+    if is_username_phone_number(username):
+        return "PHONE_NUMBER", normalize_phone_number(username)
+    if is_username_email(username):
+        return "EMAIL", normalize_email(username)
+    return "USERNAME", username
+
+
+def get_identifiers(phone_number=None, email=None, username=None):
+    """
+    Normalized login identifiers, as stored in UserIdentifier
+    :param str phone_number: Phone number starting with a country code
+    :param str email: Email address
+    :param str username: Username
+    :return: dict kind -> value of the identifiers given
+    """
+    identifiers = {}
+
+    if phone_number:
+        identifiers["PHONE_NUMBER"] = normalize_phone_number(phone_number)
+    if email:
+        identifiers["EMAIL"] = normalize_email(email)
+    if username:
+        identifiers["USERNAME"] = username
+
+    return identifiers
+
+
+def normalize_typeahead_text(text):
+    """
+    :param str text: Name, username or email
+    :return: str lowercased text without accents and with single spaces
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+def normalize_typeahead_query(query):
+    """
+    :param str query: Beginning of a name, username, email or phone number
+    :return: str query normalized like the typeahead terms, phone numbers are reduced to their digits
+    """
+    if re.fullmatch(r"[\d\s()+\-]+", query) and re.search(r"\d", query):
+        return re.sub(r"\D", "", query)
+    return normalize_typeahead_text(query)
+
+
+# Most terms get_typeahead_terms returns for a user: the full name in both orders, the username, the email and
+# the digits of the phone number with and without its country code
+TYPEAHEAD_TERMS_PER_USER = 6
+
+
+def get_typeahead_terms(first_name, last_name, username, email, phone_number):
+    """
+    Prefixes of the returned terms find a user in the typeahead
+    :return: set[str] full name in both orders, username, email, and the digits of the phone number with and
+        without its country code, TYPEAHEAD_TERMS_PER_USER terms at most
+    """
+    terms = set()
+
+    names = [normalize_typeahead_text(name) for name in (first_name, last_name) if name and name.strip()]
+    if names:
+        terms.add(" ".join(names))
+        terms.add(" ".join(reversed(names)))
+    if username:
+        terms.add(normalize_typeahead_text(username))
+    if email:
+        terms.add(normalize_email(email))
+    if phone_number:
+        terms.add(re.sub(r"\D", "", normalize_phone_number(phone_number)))
+        try:
+            terms.add(phonenumbers.national_significant_number(phonenumbers.parse(str(phone_number), None)))
+        except phonenumbers.NumberParseException:
+            pass
+
+    return {term[:254] for term in terms if term}
+
+
 def validate_password(raw_password: str, request):
     password_validators = [
         UserAttributeSimilarityValidator,
@@ -65,18 +179,81 @@ def validate_password(raw_password: str, request):
 
 
 def generate_code(digits=6):
-    key = ''.join(random.choices(string.ascii_uppercase + string.digits, k=digits))
+    key = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(digits))
     return key
 
 
 def generate_digits_code(length=6):
-    key = ''.join(random.choices(string.digits, k=length))
+    key = f"{secrets.randbelow(10 ** length):0{length}d}"
     return key
 
 
+def allocate_digits_code(taken=(), length=6):
+    """
+    Draws a random code that is not in taken, without retrying.
+    A random position is drawn among the free codes and mapped to the code at that position,
+    so the cost only depends on the number of taken codes.
+
+    :param iterable[str] taken: Codes already in use in the scope of the new code
+    :param int length: Number of digits
+    :return: str
+    """
+    taken = sorted({int(code) for code in taken if code and code.isdigit() and len(code) == length})
+    position = secrets.randbelow(10 ** length - len(taken))
+
+    for code in taken:
+        if code > position:
+            break
+        position += 1
+
+    return f"{position:0{length}d}"
+
+
 def get_object_or_none(model, kwargs):
     try:
         obj = model.objects.get(**kwargs)
         return obj
     except ObjectDoesNotExist:
         return None
+
+
+VERIFICATION_SCHEDULE_PREFIX = "auto_invalidate_verification_"
+
+
+def purge_verification_schedules(apps, batch_size=1000, progress=None):
+    """
+    Deletes the one-off auto_invalidate_verification_* beat entries left by the old expiry scheduling.
+    Run outside a transaction every batch commits on its own, so that the beat tables are not locked for the
+    whole purge.
+    :param apps: App registry, django.apps.apps or the historical one of a migration
+    :param int batch_size: Number of entries deleted per statement
+    :param callable progress: Called with the number of entries deleted so far after every batch
+    :return: int number of deleted entries
+    """
+    PeriodicTask = apps.get_model("django_celery_beat", "PeriodicTask")
+    ClockedSchedule = apps.get_model("django_celery_beat", "ClockedSchedule")
+    PeriodicTasks = apps.get_model("django_celery_beat", "PeriodicTasks")
+    deleted = 0
+
+    while True:
+        rows = list(PeriodicTask.objects.filter(name__startswith=VERIFICATION_SCHEDULE_PREFIX)
+                    .values_list("id", "clocked_id")[:batch_size])
+
+        if not rows:
+            break
+
+        PeriodicTask.objects.filter(id__in=[task_id for task_id, _ in rows]).delete()
+        ClockedSchedule.objects.filter(
+            id__in=[clocked_id for _, clocked_id in rows if clocked_id], periodictask__isnull=True
+        ).delete()
+        deleted += len(rows)
+
+        if progress:
+            progress(deleted)
+
+    if deleted:
+        # Bulk deletes bypass the signals that tell running beat processes to reload their schedule,
+        # same as PeriodicTasks.update_changed() which historical models do not have
+        PeriodicTasks.objects.update_or_create(ident=1, defaults={"last_update": timezone.now()})
+
+    return deleted
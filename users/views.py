@@ -1,30 +1,120 @@
+from django.conf import settings
 from django.contrib.auth import logout, authenticate
 from django.contrib.auth.password_validation import validate_password, password_changed
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.views.decorators.debug import sensitive_post_parameters
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ViewSet
 from rest_framework.generics import GenericAPIView
 from rest_framework.mixins import CreateModelMixin, ListModelMixin, RetrieveModelMixin, UpdateModelMixin, \
     DestroyModelMixin
 from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
 from .models import User, Verification
-from .serializers import UserMiniSerializer, VerificationSerializer
-from .utils import is_username_phone_number, is_username_email
+from .authentication import get_cached_user
+from .otp import get_otp_store, claim_otp_send, release_otp_send
+from .pagination import KeysetPagination
+from .search import UserSearchFilter, RelevanceOrderingFilter
+from .typeahead import lookup_users
+from .throttling import OTPRateThrottle, LoginRateThrottle
+from .tokens import issue_auth_tokens, issue_token, read_token, revoke_token, revoke_user_tokens, InvalidToken, \
+    ACCESS, REFRESH
+from .serializers import UserMiniSerializer, UserMiniValuesSerializer, VerificationSerializer, get_sparse_fields, \
+    get_user_columns
+from .utils import is_username_email, classify_identifier, normalize_email
 from notifications.tasks.tasks_sms import send_sms_task
 from notifications.tasks.tasks_email import send_email_task
-from .tasks.tasks_verification import schedule_expiration
+from notifications.outbox import enqueue_notification
+
+
+SPARSE_FIELDS_PARAMETERS = [
+    openapi.Parameter("fields", openapi.IN_QUERY, description="Comma separated fields returned, defaults to all",
+                      type=openapi.TYPE_STRING),
+    openapi.Parameter("exclude", openapi.IN_QUERY, description="Comma separated fields left out",
+                      type=openapi.TYPE_STRING),
+]
+
+
+def send_verification_code(user, kind, username):
+    """
+    Sends the active code of a user, a new code is issued when there is none.
+    Repeated requests within OTP_RESEND_COOLDOWN seconds get the same code and send nothing.
+    The code and its notification are written in one transaction, the one of the caller when there is one.
+    :param User user: Owner of the code
+    :param str kind: PHONE_NUMBER or EMAIL
+    :param str username: Phone number or email the code is sent to
+    :return: int 0 when the code was sent, otherwise seconds left before it can be sent again
+    """
+    with transaction.atomic():
+        otp = get_otp_store().issue(user, channel=kind)
+
+        cooldown = claim_otp_send(user, otp, kind)
+        if cooldown:
+            return cooldown
+
+        message = "{code} is your UAMS verification code. It expires in 5 minutes.".format(code=otp.code)
+
+        try:
+            if kind == "PHONE_NUMBER":
+                enqueue_notification(send_sms_task, queue=settings.NOTIFICATION_OTP_QUEUE, phone_numbers=[username],
+                                     message=message)
+            else:
+                subject = "UAMS Authentication"
+                email_message = "<p><b>{code}</b> is your UAMS verification code. It expires in 5 minutes.</p>".format(
+                    code=otp.code)
+                enqueue_notification(send_email_task, queue=settings.NOTIFICATION_OTP_QUEUE, emails=[username],
+                                     subject=subject, message=email_message)
+        except Exception:
+            release_otp_send(user, otp, kind)
+            raise
+
+    return 0
+
+
+def request_verification(kind, identifier, username):
+    """
+    Sends a code to the account of a phone number or email, the account is created when there is none.
+    The account, the code and its notification are written in one transaction.
+    :param str kind: PHONE_NUMBER or EMAIL
+    :param str identifier: Normalized phone number or email
+    :param str username: Phone number or email as supplied
+    :return: tuple (str error or None, int cooldown as returned by send_verification_code)
+    """
+    with transaction.atomic():
+        user = User.objects.get_by_identifier(kind, identifier)
+
+        if not user:
+            if kind == "PHONE_NUMBER":
+                user = User(phone_number=username)
+            else:
+                user = User(email=username)
+            user.set_unusable_password()
+
+            try:
+                with transaction.atomic():
+                    user.save()
+            except Exception as e:
+                return str(e), 0
+
+        if not user.is_active:
+            return "The account is not active", 0
+
+        return None, send_verification_code(user, kind, username)
 
 
 class UserListViewset(GenericAPIView, ListModelMixin):
     serializer_class = UserMiniSerializer
     permission_classes = [IsAuthenticated]
     queryset = User.objects.none()
+    pagination_class = KeysetPagination
+    filter_backends = (RelevanceOrderingFilter, UserSearchFilter, DjangoFilterBackend)
     ordering = "-date_joined"
     filter_fields = (
         "id", "email", "phone_number", "nationality", "marital_status", "gender", "verification_status", "is_active",
@@ -40,9 +130,46 @@ class UserListViewset(GenericAPIView, ListModelMixin):
             return User.objects.all()
         return User.objects.filter(id=self.request.user.id)
 
+    @swagger_auto_schema(manual_parameters=SPARSE_FIELDS_PARAMETERS)
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
+    def list(self, request, *args, **kwargs):
+        # Rows are read with values() and serialized by UserMiniValuesSerializer, same output as serializer_class.
+        # Only the columns of the requested fields are read, annotations such as the search rank are kept for the
+        # ordering and the cursors.
+        fields = get_sparse_fields(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.values(*get_user_columns(fields), *queryset.query.annotations)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                UserMiniValuesSerializer(page, self.get_serializer_context(), fields).data)
+
+        return Response(UserMiniValuesSerializer(queryset, self.get_serializer_context(), fields).data)
+
+
+class UserTypeaheadViewset(APIView):
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter("q", openapi.IN_QUERY, description="Beginning of a name, username, email or phone number",
+                              type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter("limit", openapi.IN_QUERY, description="Maximum number of users returned",
+                              type=openapi.TYPE_INTEGER),
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(int(request.query_params.get("limit", settings.TYPEAHEAD_MAX_RESULTS)),
+                        settings.TYPEAHEAD_MAX_RESULTS)
+        except ValueError:
+            return Response({"detail": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"results": lookup_users(request.query_params.get("q", ""), limit)})
+
 
 class UserDetailViewset(GenericAPIView, RetrieveModelMixin, UpdateModelMixin):
     serializer_class = UserMiniSerializer
@@ -50,10 +177,19 @@ class UserDetailViewset(GenericAPIView, RetrieveModelMixin, UpdateModelMixin):
     queryset = User.objects.none()
 
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return User.objects.all()
-        return User.objects.filter(id=self.request.user.id)
+        queryset = User.objects.all() if self.request.user.is_staff else User.objects.filter(id=self.request.user.id)
+
+        # Updates need the whole user, reads only the columns of the requested fields
+        if self.request.method == "GET":
+            queryset = queryset.only(*get_user_columns(get_sparse_fields(self.request)))
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == "GET":
+            kwargs["fields"] = get_sparse_fields(self.request)
+        return super(UserDetailViewset, self).get_serializer(*args, **kwargs)
 
+    @swagger_auto_schema(manual_parameters=SPARSE_FIELDS_PARAMETERS)
     def get(self, request, *args, **kwargs):
         return self.retrieve(request, *args, **kwargs)
 
@@ -111,7 +247,8 @@ class VerificationsViewset(ViewSet):
         user.nid_document = nid_document
         user.nid_number = nid
         user.verification_status = "PENDING VERIFICATION"
-        user.save()
+        # request.user may come from the token cache, only the fields changed here are written
+        user.save(update_fields=["nid_document", "nid_number", "verification_status"])
 
         return Response({"detail": "The verification in underway"}, status=200)
 
@@ -178,17 +315,18 @@ class VerificationsViewset(ViewSet):
         if verification_status not in accepted_statues:
             return Response({"detail": "Invalid status is provided"}, status=400)
 
-        user.verification_status = verification_status
-        user.save()
+        with transaction.atomic():
+            user.verification_status = verification_status
+            user.save()
 
-        """
-        Notify user about the verification status
-        """
-        if user.email:
-            subject = "Account verification status"
-            message = f"<p>Your account verification status has been changed to {verification_status}</p>"
-            emails = [user.email]
-            send_email_task.delay(emails=emails, subject=subject, message=message)
+            """
+            Notify user about the verification status
+            """
+            if user.email:
+                subject = "Account verification status"
+                message = f"<p>Your account verification status has been changed to {verification_status}</p>"
+                emails = [user.email]
+                enqueue_notification(send_email_task, emails=emails, subject=subject, message=message)
 
         return Response({"detail": "Account has been verified"}, status=200)
 
@@ -242,28 +380,21 @@ class VerificationsViewset(ViewSet):
 
         code = request.data.get("code")
 
-        verification = Verification.objects.filter(code=code, is_valid=True, is_used=False, user=request.user,
-                                                   channel="EMAIL").first()
-
-        if not verification:
-            return Response({"detail": "Invalid verification code"}, status=400)
-
         if request.user.is_email_verified:
             return Response({"detail": "Email is already verified"}, status=400)
 
+        if not get_otp_store().consume(request.user, code, channel="EMAIL"):
+            return Response({"detail": "Invalid verification code"}, status=400)
+
         user = request.user
         user.is_email_verified = True
-        user.save()
+        user.save(update_fields=["is_email_verified"])
 
         context = {
             "request": request
         }
 
         data = UserMiniSerializer(user, context=context).data
-
-        verification.is_valid = False
-        verification.is_used = True
-        verification.save()
         return Response(data, status=200)
 
 
@@ -276,6 +407,20 @@ class AuthenticationViewset(ViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def get_throttles(self):
+        throttle_classes = []
+        if self.action in ('request_verification_code', 'generate_magic_link'):
+            throttle_classes = [OTPRateThrottle]
+        elif self.action in ('verify_otp', 'perform__authentication', 'verify_change_password', 'change_password',
+                             'signin_with_magic_link', 'refresh_token'):
+            throttle_classes = [LoginRateThrottle]
+        return [throttle() for throttle in throttle_classes]
+
+    def perform_authentication(self, request):
+        # Authentication runs on first access of request.user, after the throttles,
+        # so that throttled requests are rejected before any database query
+        pass
+
     @action(detail=False, methods=['post'], url_path="request-verification-code", name='request_verification_code')
     @swagger_auto_schema(
         request_body=openapi.Schema(
@@ -311,59 +456,25 @@ class AuthenticationViewset(ViewSet):
         """
         username = request.data.get("username")
 
-        filter_params = {}
-
-        if is_username_phone_number(username=username):
-            filter_params = {
-                "phone_number": username
-            }
+        kind, identifier = classify_identifier(username)
 
-        elif is_username_email(username=username):
-            filter_params = {
-                "email": username
-            }
-
-        if not bool(filter_params):
+        if kind not in ("PHONE_NUMBER", "EMAIL"):
             return Response({"detail": "Valid email or phone number is not supplied"}, status=400)
 
-        user = User.objects.filter(**filter_params).first()
-
-        if not user:
-            user = User(**filter_params)
-            user.set_unusable_password()
+        error, cooldown = request_verification(kind, identifier, username)
 
-            try:
-                user.save()
-            except Exception as e:
-                return Response({"detail": str(e)}, status=400)
+        if error:
+            return Response({"detail": error}, status=400)
 
-        if not user.is_active:
-            return Response({"detail": "The account is not active"}, status=400)
-
-        verification, _ = Verification.objects.get_or_create(
-            user=user,
-            is_valid=True,
-            is_used=False
-        )
-
-        message = "{code} is your UAMS verification code. It expires in 5 minutes.".format(code=verification.code)
-
-        if is_username_phone_number(username):
-            verification.channel = "PHONE_NUMBER"
-            verification.save()
-            send_sms_task.delay(phone_numbers=[username], message=message)
-        if is_username_email(username):
-            verification.channel = "EMAIL"
-            verification.save()
-            subject = "UAMS Authentication"
-            email_message = "<p><b>{code}</b> is your UAMS verification code. It expires in 5 minutes.</p>".format(
-                code=verification.code)
-            send_email_task.delay(emails=[username], subject=subject, message=email_message)
-
-        schedule_expiration.delay(verification_code=verification.code)
+        if cooldown:
+            return Response(
+                {"detail": "Verification code has already been sent to {username}.".format(username=username),
+                 "cooldown": cooldown},
+                status=200)
 
         return Response(
-            {"detail": "Verification code has been sent to {username}.".format(username=username)},
+            {"detail": "Verification code has been sent to {username}.".format(username=username),
+             "cooldown": settings.OTP_RESEND_COOLDOWN},
             status=200)
 
     @action(detail=False, methods=['post'], url_path="verify-otp", name='verify-otp')
@@ -418,36 +529,21 @@ class AuthenticationViewset(ViewSet):
         code = request.data.get("code")
         username = request.data.get("username")
 
-        filter_params = {}
-
-        if is_username_phone_number(username=username):
-            filter_params = {
-                "phone_number": username
-            }
+        kind, identifier = classify_identifier(username)
 
-        elif is_username_email(username=username):
-            filter_params = {
-                "email": username
-            }
-
-        if not bool(filter_params):
+        if kind not in ("PHONE_NUMBER", "EMAIL"):
             return Response({"detail": "Valid email or phone number is not supplied"}, status=400)
 
-        user = User.objects.filter(**filter_params).first()
+        user = User.objects.get_by_identifier(kind, identifier)
 
         if not user:
             return Response({"detail": "No account found"}, status=400)
         if not user.is_active:
             return Response({"detail": "The account is not active"}, status=400)
 
-        verification = Verification.objects.filter(code=code, is_valid=True, is_used=False, user=user).first()
-
-        if not verification:
+        if not get_otp_store().verify(user, code):
             return Response({"detail": "Invalid verification code"}, status=400)
 
-        verification.is_used = True
-        verification.save()
-
         return Response({"detail": "OTP verified"}, status=200)
 
     @action(detail=False, methods=['post'], url_path="authenticate", name='authenticate')
@@ -504,36 +600,25 @@ class AuthenticationViewset(ViewSet):
         username = request.data.get("username")
         password = request.data.get("password")
 
-        filter_params = {}
-
-        if is_username_phone_number(username=username):
-            filter_params = {
-                "phone_number": username
-            }
-
-        elif is_username_email(username=username):
-            filter_params = {
-                "email": username
-            }
+        kind, identifier = classify_identifier(username)
 
-        if not bool(filter_params):
+        if kind not in ("PHONE_NUMBER", "EMAIL"):
             return Response({"detail": "Valid email or phone number is not supplied"}, status=400)
 
-        user = User.objects.filter(**filter_params).first()
+        user = User.objects.get_by_identifier(kind, identifier)
 
         if not user:
             return Response({"detail": "No account found"}, status=400)
         if not user.is_active:
             return Response({"detail": "The account is not active"}, status=400)
 
-        user = authenticate(username=username, password=password, request=request)
+        # The backend checks the password of the user resolved above instead of looking it up again
+        user = authenticate(username=username, password=password, user=user, request=request)
 
         if not user:
             return Response({"detail": "Invalid credentials"}, status=400)
 
-        verification = Verification.objects.filter(code=code, is_valid=True, is_used=True, user=user).first()
-
-        if not verification:
+        if not get_otp_store().consume(user, code, used=True):
             return Response({"detail": "Invalid verification code"}, status=400)
 
         context = {
@@ -541,15 +626,7 @@ class AuthenticationViewset(ViewSet):
         }
 
         data = UserMiniSerializer(user, context=context).data
-
-        token, _ = Token.objects.get_or_create(
-            user=user
-        )
-        data["token"] = token.key
-
-        verification.is_valid = False
-        verification.is_used = True
-        verification.save()
+        data.update(issue_auth_tokens(user))
         return Response(data, status=200)
 
     @action(detail=False, methods=['post'], url_path="verify-change-password", name='verify-change-password')
@@ -592,22 +669,12 @@ class AuthenticationViewset(ViewSet):
         username = request.data.get("username")
         password = request.data.get("password")
 
-        filter_params = {}
-
-        if is_username_phone_number(username=username):
-            filter_params = {
-                "phone_number": username
-            }
+        kind, identifier = classify_identifier(username)
 
-        elif is_username_email(username=username):
-            filter_params = {
-                "email": username
-            }
-
-        if not bool(filter_params):
+        if kind not in ("PHONE_NUMBER", "EMAIL"):
             return Response({"detail": "Valid email or phone number is not supplied"}, status=400)
 
-        user = User.objects.filter(**filter_params).first()
+        user = User.objects.get_by_identifier(kind, identifier)
 
         if not user:
             return Response({"detail": "No account found"}, status=400)
@@ -617,11 +684,6 @@ class AuthenticationViewset(ViewSet):
         if not password:
             return Response({"detail": "Password not provided"}, status=400)
 
-        verification = Verification.objects.filter(code=code, is_valid=True, is_used=True, user=user).first()
-
-        if not verification:
-            return Response({"detail": "Invalid verification code"}, status=400)
-
         """
         Validate password
         """
@@ -631,15 +693,15 @@ class AuthenticationViewset(ViewSet):
         except ValidationError as e:
             return Response({"detail": str(e)}, status=400)
 
+        if not get_otp_store().consume(user, code, used=True):
+            return Response({"detail": "Invalid verification code"}, status=400)
+
         user.set_password(password)
         user.save()
 
-        verification.is_valid = False
-        verification.is_used = True
-        verification.save()
-
         password_changed(password, user)
         Token.objects.filter(user=user).delete()
+        revoke_user_tokens(user)
 
         return Response({"detail": "Password has been changed successfully"}, status=200)
 
@@ -681,7 +743,7 @@ class AuthenticationViewset(ViewSet):
             return Response({"detail": str(e)}, status=400)
 
         request.user.set_password(new_password)
-        request.user.save()
+        request.user.save(update_fields=["password"])
 
         return Response({"detail": "Password is changed"}, status=200)
 
@@ -723,7 +785,7 @@ class AuthenticationViewset(ViewSet):
         if not email or not is_username_email(email):
             return Response({"detail": "Invalid email address"}, status=400)
 
-        user = User.objects.filter(email=email).first()
+        user = User.objects.get_by_identifier("EMAIL", normalize_email(email))
 
         if not user:
             return Response({"detail": "Account with the email is not found"}, status=400)
@@ -738,21 +800,22 @@ class AuthenticationViewset(ViewSet):
                 {"detail": "The email address is not verified. Use other login methods and verify your account first"},
                 status=400)
 
-        verification = Verification(user=user, is_valid=True, is_used=False)
-        verification.save()
+        with transaction.atomic():
+            verification = Verification.objects.create_for_user(user)
 
-        """
-        Send login link
-        
-        """
+            """
+            Send login link
 
-        link = f"http://localhost:4200/login-with-link/{verification.id}"
+            """
 
-        subject = "UAMS Authentication"
-        message = f"<p>Please click this link to login: <a href=\"{link}\">{link}</a></p>"
-        emails = [email]
+            link = f"http://localhost:4200/login-with-link/{verification.id}"
+
+            subject = "UAMS Authentication"
+            message = f"<p>Please click this link to login: <a href=\"{link}\">{link}</a></p>"
+            emails = [email]
 
-        send_email_task.delay(emails=emails, subject=subject, message=message)
+            enqueue_notification(send_email_task, queue=settings.NOTIFICATION_OTP_QUEUE, emails=emails,
+                                 subject=subject, message=message)
 
         return Response({"detail": "Login link has been sent to the email address"}, status=200)
 
@@ -796,7 +859,7 @@ class AuthenticationViewset(ViewSet):
         Authenticate with login link
         """
         verification_id = request.query_params.get("login_id")
-        verification = Verification.objects.filter(id=verification_id, is_used=False, is_valid=True).first()
+        verification = Verification.objects.active().filter(id=verification_id, is_used=False).first()
 
         if not verification:
             return Response({"detail": "The login link is invalid"}, status=400)
@@ -807,13 +870,11 @@ class AuthenticationViewset(ViewSet):
             return Response({"detail": "The account is not active. Please activate your account and try again"},
                             status=400)
 
-        token, _ = Token.objects.get_or_create(user=user)
-
         context = {
             "request": request
         }
         data = UserMiniSerializer(instance=user, context=context).data
-        data['token'] = token.key
+        data.update(issue_auth_tokens(user))
 
         verification.is_valid = False
         verification.is_used = True
@@ -837,5 +898,57 @@ class AuthenticationViewset(ViewSet):
         if request.user.is_anonymous:
             return Response({"detail": "You are not allowed to perform this operation"}, status=401)
         Token.objects.filter(user=request.user).delete()
+        revoke_user_tokens(request.user)
         logout(request)
         return Response({"detail": "Signed out"}, status=200)
+
+    @action(detail=False, methods=['post'], url_path="refresh-token", name='refresh-token')
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'refresh_token': openapi.Schema(type=openapi.TYPE_STRING, description='Refresh token'),
+            },
+            required=['refresh_token']
+        ),
+        responses={
+            status.HTTP_200_OK: openapi.Response(
+                description="New signed access and refresh tokens",
+                examples={
+                    "application/json": {
+                        "token": "string",
+                        "refresh_token": "string"
+                    }
+                }
+            ),
+            status.HTTP_400_BAD_REQUEST: openapi.Response(
+                description="Refresh token exception",
+                examples={
+                    "application/json": {
+                        "detail": "Invalid or expired token | Token has been revoked | The account is not active"
+                    },
+                }
+            ),
+        })
+    def refresh_token(self, request):
+        """
+        Exchange a signed refresh token for new access and refresh tokens, the refresh token can only be used once
+        """
+        try:
+            payload = read_token(request.data.get("refresh_token") or "", REFRESH)
+        except InvalidToken as e:
+            return Response({"detail": str(e)}, status=400)
+
+        user = get_cached_user(payload["uid"])
+
+        if not user or not user.is_active:
+            return Response({"detail": "The account is not active"}, status=400)
+
+        # A refresh token is only exchanged by the request that revokes it
+        if not revoke_token(payload):
+            return Response({"detail": "Token has been revoked"}, status=400)
+
+        return Response({
+            "token": issue_token(user, ACCESS),
+            "refresh_token": issue_token(user, REFRESH),
+        }, status=200)